@@ -47,13 +47,28 @@ import traceback
 import random
 import os
 import csv
+import contextlib
+import bisect
+import codecs
+import gzip
+import sqlite3
+import hashlib
+import marshal
+import math
 import atexit
-from collections import defaultdict
+import threading
+from array import array
+from collections import OrderedDict, defaultdict, deque
 from datetime import datetime, timedelta
 from io import StringIO
 from aiohttp import TCPConnector, ClientTimeout
 from appdaemon.plugins.hass.hassapi import Hass
 
+try:
+    import numpy as np
+except ImportError: # Optional: only used to speed up hulls of large clusters
+    np = None
+
 # ─── Singleton guard: prevents double‑initialisation ───
 _IS_RAI_RUNNING = False
 
@@ -77,6 +92,7 @@ DAY_NAMES = {
     'Friday': 'יום שישי', 'Saturday': 'יום שבת'
 }
 DEFAULT_UNKNOWN_AREA = "ישראל"
+GEOJSON_COORD_DECIMALS = 5 # ~1 m, plenty for city points
 
 @functools.lru_cache(maxsize=None)
 def standardize_name(name: str) -> str:
@@ -99,35 +115,39 @@ def check_bom(text: str) -> str:
     return text
 
 def parse_datetime_str(ds: str, logger_func=None) -> datetime | None:
-    """Parses various datetime string formats into datetime objects."""
+    """Parses various datetime string formats into naive datetime objects (timezone info is dropped)."""
     if not ds or not isinstance(ds, str): return None
-    ds = ds.strip().strip('"')
-    formats = [
-        "%Y-%m-%dT%H:%M:%S.%f", # ISO with microseconds
-        "%Y-%m-%dT%H:%M:%S",    # ISO without microseconds
-        "%Y-%m-%d %H:%M:%S.%f", # Space separated with microseconds
-        "%Y-%m-%d %H:%M:%S"     # Space separated without microseconds
-    ]
-    for fmt in formats:
-        try: return datetime.strptime(ds, fmt)
-        except ValueError: pass
     try:
-        # Handle ISO format with timezone (make naive for comparison)
-        if '+' in ds: ds = ds.split('+')[0]
-        if 'Z' in ds: ds = ds.split('Z')[0]
-        # Try parsing again after stripping potential timezone info
-        for iso_fmt in ["%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S"]:
-            try: return datetime.strptime(ds, iso_fmt)
-            except ValueError: pass
-        # Last attempt with fromisoformat
-        return datetime.fromisoformat(ds)
-    except ValueError:
-        return None
+        return _parse_datetime_cached(ds)
     except Exception as e:
         if logger_func:
             logger_func(f"Unexpected error parsing datetime string '{ds}': {e}", level="WARNING")
         return None
 
+_DATETIME_FALLBACK_FORMATS = ("%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S")
+
+@functools.lru_cache(maxsize=4096) # Salvos share one timestamp across hundreds of history entries
+def _parse_datetime_cached(ds: str) -> datetime | None:
+    """parse_datetime_str without the logging: fromisoformat first, strptime fallbacks only for odd formats."""
+    ds = ds.strip().strip('"')
+    try:
+        dt = datetime.fromisoformat(ds)
+        return dt if dt.tzinfo is None else dt.replace(tzinfo=None)
+    except ValueError:
+        pass
+    # Oref 'YYYY-MM-DD HH:MM:SS' shape with a zone suffix fromisoformat rejects (e.g. 'Z' before Python 3.11)
+    if len(ds) > 19 and ds[10] in ' T' and ds[19] in 'Z+-':
+        try:
+            return datetime.fromisoformat(ds[:19])
+        except ValueError:
+            pass
+    if '+' in ds: ds = ds.split('+')[0]
+    if 'Z' in ds: ds = ds.split('Z')[0]
+    for fmt in _DATETIME_FALLBACK_FORMATS:
+        try: return datetime.strptime(ds, fmt)
+        except ValueError: pass
+    return None
+
 def get_convex_hull(points):
     """Computes the convex hull of a set of points (Monotone Chain algorithm)."""
     n = len(points)
@@ -147,14 +167,178 @@ def get_convex_hull(points):
         upper.append(p)
     return lower[:-1] + upper[:-1]
 
+# Each city is drawn as 5 points on a 0.015-degree circle around it before hulling.
+_EXPANSION_OFFSETS = [(0.015 * math.cos(math.radians(angle)), 0.015 * math.sin(math.radians(angle))) for angle in range(0, 360, 72)]
+_NUMPY_HULL_MIN_POINTS = 64 # Below this, NumPy's per-call overhead outweighs its gains
+
+def _convex_hull_np(points):
+    """
+    NumPy version of get_convex_hull for large point sets, with the same output.
+    Points strictly inside the polygon of the extreme points (min/max of x, y, x+y, x-y) cannot
+    be hull vertices, so they are discarded in bulk before running the monotone chain on the rest.
+    """
+    pts = np.asarray(points, dtype=float)
+    pts = pts[np.lexsort((pts[:, 1], pts[:, 0]))]
+    x, y = pts[:, 0], pts[:, 1]
+    extremes = {int(i) for i in (x.argmin(), x.argmax(), y.argmin(), y.argmax(),
+                                 (x + y).argmin(), (x + y).argmax(), (x - y).argmin(), (x - y).argmax())}
+    poly = get_convex_hull([tuple(pts[i]) for i in extremes])
+    if len(poly) >= 3:
+        inside = np.ones(len(pts), dtype=bool)
+        for (ax, ay), (bx, by) in zip(poly, poly[1:] + poly[:1]):
+            inside &= (bx - ax) * (y - ay) - (by - ay) * (x - ax) > 1e-12
+        pts = pts[~inside]
+    return get_convex_hull(list(map(tuple, pts.tolist())))
+
+def expanded_hull(cluster):
+    """Convex hull of the cluster's points after expanding each one with _EXPANSION_OFFSETS."""
+    if np is not None and len(cluster) * len(_EXPANSION_OFFSETS) >= _NUMPY_HULL_MIN_POINTS:
+        expanded = (np.asarray(cluster, dtype=float)[:, None, :] + np.asarray(_EXPANSION_OFFSETS)[None, :, :]).reshape(-1, 2)
+        return _convex_hull_np(expanded)
+    expanded = [(lon + dx, lat + dy) for lon, lat in cluster for dx, dy in _EXPANSION_OFFSETS]
+    return get_convex_hull(expanded)
+
+def is_point_in_poly(x, y, poly):
+    """Ray-casting point-in-polygon test."""
+    n = len(poly)
+    inside = False
+    if n < 3: return False
+    p1x, p1y = poly[0]
+    for i in range(n + 1):
+        p2x, p2y = poly[i % n]
+        if y > min(p1y, p2y):
+            if y <= max(p1y, p2y):
+                if x <= max(p1x, p2x):
+                    if p1y != p2y:
+                        xints = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
+                    if p1x == p2x or x <= xints:
+                        inside = not inside
+        p1x, p1y = p2x, p2y
+    return inside
+
+_NEIGHBOUR_CELLS = [(dx, dy) for dx in range(-2, 3) for dy in range(-2, 3) if dx or dy]
+
+def cluster_points(points, threshold):
+    """
+    Groups points into clusters using a uniform grid index of half-threshold cells.
+    Each point joins the earliest-created cluster that has a member closer than
+    threshold (same result as a full pairwise scan). Points sharing a cell are always
+    within threshold, so only the 5x5 neighbouring cells need distance checks.
+    """
+    clusters = []
+    cell_size = threshold / 2
+    grid = {}
+    for p in points:
+        cx, cy = math.floor(p[0] / cell_size), math.floor(p[1] / cell_size)
+        own_cell = grid.get((cx, cy))
+        best = min(own_cell) if own_cell else None
+
+        candidates = defaultdict(list)
+        if best != 0:
+            for dx, dy in _NEIGHBOUR_CELLS:
+                cell = grid.get((cx + dx, cy + dy))
+                if not cell: continue
+                for idx, cell_points in cell.items():
+                    if best is None or idx < best:
+                        candidates[idx].append(cell_points)
+        for idx in sorted(candidates):
+            if any(math.sqrt((p[0]-q[0])**2 + (p[1]-q[1])**2) < threshold
+                   for cell_points in candidates[idx] for q in cell_points):
+                best = idx
+                break
+
+        if best is None:
+            best = len(clusters)
+            clusters.append([p])
+        else:
+            clusters[best].append(p)
+        grid.setdefault((cx, cy), {}).setdefault(best, []).append(p)
+    return clusters
+
+# ----------------------------------------------------------------------
+# Helper Class: JsonArrayStream
+# ----------------------------------------------------------------------
+class JsonArrayStream:
+    """
+    Incremental parser for a top-level JSON array fed as text chunks: feed() returns the elements
+    completed so far, so a large array can be consumed (and abandoned) while it downloads.
+    Raises ValueError (json.JSONDecodeError for malformed JSON) if the text is not a JSON array.
+    """
+    _WHITESPACE = re.compile(r'[ \t\n\r]*')
+    _DELIMITER  = re.compile(r'[ \t\n\r]*([,\]]?)[ \t\n\r]*')
+
+    def __init__(self):
+        self._scan   = json.JSONDecoder().scan_once
+        self._buffer = ""
+        self._state  = "start" # start -> first -> value -> done
+        self.started = False   # True once the opening '[' was seen
+
+    def feed(self, text: str, final: bool = False) -> list:
+        buf = self._buffer + text if self._buffer else text
+        end_of_text = len(buf)
+        pos = self._WHITESPACE.match(buf).end()
+        items = []
+        if self._state == "start" and pos < end_of_text:
+            if buf[pos] != "[":
+                raise ValueError("JSON value is not an array")
+            pos = self._WHITESPACE.match(buf, pos + 1).end()
+            self._state, self.started = "first", True
+        if self._state == "first" and pos < end_of_text:
+            if buf[pos] == "]":
+                pos, self._state = pos + 1, "done"
+            else:
+                self._state = "value"
+        scan, delimiter = self._scan, self._DELIMITER.match
+        while self._state == "value" and pos < end_of_text:
+            try:
+                item, end = scan(buf, pos)
+            except (StopIteration, json.JSONDecodeError) as e:
+                if not final: break # Element not complete yet
+                if isinstance(e, json.JSONDecodeError): raise
+                raise json.JSONDecodeError("Expecting value", buf, pos) from None
+            match = delimiter(buf, end)
+            delim = match.group(1)
+            if not delim:
+                # Elements are only accepted once their delimiter arrived: a number may continue in the next chunk
+                if match.end() < end_of_text and (final or type(item) not in (int, float)):
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buf, match.end())
+                break
+            items.append(item)
+            pos = match.end()
+            if delim == "]":
+                self._state = "done"
+        if self._state == "done":
+            pos = self._WHITESPACE.match(buf, pos).end()
+            if pos < end_of_text:
+                raise json.JSONDecodeError("Extra data", buf, pos)
+        self._buffer = buf[pos:]
+        if final and self.started and self._state != "done":
+            raise json.JSONDecodeError("Unterminated array", buf, len(buf))
+        return items
+
 # ----------------------------------------------------------------------
 # Helper Class: OrefAPIClient
 # ----------------------------------------------------------------------
 class OrefAPIClient:
-    def __init__(self, session, urls, logger):
+    def __init__(self, session, urls, logger, timings=None):
         self._session = session
         self._urls    = urls
         self._log     = logger
+        self._timings = timings
+        # Conditional polling state for the live alerts endpoint
+        self._live_etag          = None
+        self._live_last_modified = None
+        self._live_raw           = None
+        self._live_result        = None
+        self.live_stats = {
+            "requests": 0, "not_modified": 0, "bytes_downloaded": 0,
+            "parses": 0, "parses_skipped": 0,
+            "fetch_ms": 0.0, "decode_ms": 0.0, "parse_ms": 0.0
+        }
+        self.consecutive_errors = 0
+        self.live_ok = False # True when the last get_live_alerts() call got a valid (or unchanged) response
+        self.history_validators = None
+        self.history_stats = {}
 
     async def _fetch_with_retries(self, fetch_func, retries: int = 2):
         """Retry on network errors with exponential backoff."""
@@ -170,79 +354,134 @@ class OrefAPIClient:
                 await asyncio.sleep(wait)
 
     async def get_live_alerts(self):
-        """Fetch live alerts, return dict or None."""
+        """
+        Fetch live alerts, return dict or None.
+        Sends If-None-Match / If-Modified-Since when the server provided validators, and skips
+        decoding and parsing when the body is unchanged (304 or byte-identical), returning the
+        previously parsed result instead. Sets `live_ok` to whether the poll succeeded.
+        Validators are only kept with a body that was read and parsed, so after a failed read or
+        an invalid body the next request is unconditional.
+        """
+        self.live_ok = False
         url = self._urls.get("live")
         if not url:
             self._log("Live alerts URL not configured.", level="ERROR")
             return None
+        stats = self.live_stats
         try:
             async def _do_fetch():
-                async with self._session.get(url) as resp:
+                headers = {}
+                if self._live_etag: headers['If-None-Match'] = self._live_etag
+                if self._live_last_modified: headers['If-Modified-Since'] = self._live_last_modified
+                async with self._session.get(url, headers=headers) as resp:
+                    if resp.status == 304:
+                        return None, None
                     resp.raise_for_status()
                     if 'application/json' not in resp.headers.get('Content-Type', ''):
                         self._log(f"Warning: Expected JSON content type, got {resp.headers.get('Content-Type')}", level="WARNING")
-                    raw_data = await resp.read()
-                    try:
-                        return raw_data.decode('utf-8-sig')
-                    except UnicodeDecodeError:
-                        self._log("Failed decoding with utf-8-sig, trying utf-8.", level="DEBUG")
-                        return raw_data.decode('utf-8')
-
-            text = await self._fetch_with_retries(_do_fetch)
-
-            if not text or not text.strip():
-                return None
+                    return await resp.read(), (resp.headers.get('ETag'), resp.headers.get('Last-Modified'))
+
+            t0 = time.perf_counter()
+            raw_data, validators = await self._fetch_with_retries(_do_fetch)
+            t1 = time.perf_counter()
+            self.consecutive_errors = 0
+            stats["requests"] += 1
+            stats["fetch_ms"] += (t1 - t0) * 1000
+            if self._timings: self._timings.record("fetch", (t1 - t0) * 1000)
+
+            if raw_data is None:
+                stats["not_modified"] += 1
+                stats["parses_skipped"] += 1
+                self.live_ok = True
+                return self._live_result
+            stats["bytes_downloaded"] += len(raw_data)
+            if raw_data == self._live_raw:
+                stats["parses_skipped"] += 1
+                self._live_etag, self._live_last_modified = validators
+                self.live_ok = True
+                return self._live_result
 
             try:
-                text = check_bom(text)
-                return json.loads(text)
-            except json.JSONDecodeError as e:
-                log_text_preview = text[:1000].replace('\n', '\\n').replace('\r', '\\r') 
-                if "Expecting value: line 1 column 1 (char 0)" in str(e) and len(text) > 0:
-                    pass
-                else:
-                    self._log(f"Invalid JSON in live alerts: {e}. Raw text preview: '{log_text_preview}...'", level="WARNING")
-                return None
+                text = raw_data.decode('utf-8-sig')
+            except UnicodeDecodeError:
+                self._log("Failed decoding with utf-8-sig, trying utf-8.", level="DEBUG")
+                text = raw_data.decode('utf-8')
+            t2 = time.perf_counter()
+            stats["decode_ms"] += (t2 - t1) * 1000
+            if self._timings: self._timings.record("decode", (t2 - t1) * 1000)
+
+            result = None
+            valid = True
+            if text and text.strip():
+                try:
+                    text = check_bom(text)
+                    result = json.loads(text)
+                except json.JSONDecodeError as e:
+                    log_text_preview = text[:1000].replace('\n', '\\n').replace('\r', '\\r') 
+                    if "Expecting value: line 1 column 1 (char 0)" in str(e) and len(text) > 0:
+                        pass
+                    else:
+                        self._log(f"Invalid JSON in live alerts: {e}. Raw text preview: '{log_text_preview}...'", level="WARNING")
+                        valid = False
+                    result = None
+            parse_ms = (time.perf_counter() - t2) * 1000
+            stats["parses"] += 1
+            stats["parse_ms"] += parse_ms
+            if self._timings: self._timings.record("parse", parse_ms)
+
+            self._live_raw = raw_data if valid else None # An invalid body is parsed (and reported) again
+            self._live_result = result
+            self._live_etag, self._live_last_modified = validators if valid else (None, None)
+            self.live_ok = valid
+            return result
 
         except aiohttp.ClientResponseError as e:
+            self.consecutive_errors += 1
             self._log(f"HTTP error fetching live alerts: Status {e.status}, Message: {e.message}", level="WARNING")
         except (aiohttp.ClientError, asyncio.TimeoutError) as e: 
+            self.consecutive_errors += 1
             self._log(f"Network/Timeout error fetching live alerts: {e}", level="WARNING")
         except Exception as e:
             self._log(f"Unexpected error fetching live alerts: {e.__class__.__name__} - {e}", level="ERROR")
 
+        self._live_etag = self._live_last_modified = None # The body may not have been read
         return None
 
-    async def get_alert_history(self):
-        """Fetch alert history, return list or None."""
+    HISTORY_CHUNK_SIZE = 64 * 1024
+    HISTORY_STOP_AFTER = 20 # Consecutive entries older than stop_before that end the download
+
+    async def get_alert_history(self, etag=None, last_modified=None, stop_before=None):
+        """
+        Fetch alert history, return list or None.
+        The feed is newest first and is parsed while it downloads; given `stop_before` (a datetime),
+        the download stops once entries are older than it, so the rest is never read or parsed.
+        Given the validators of an earlier response, returns [] if the server answers 304 Not Modified.
+        The response's validators are kept in self.history_validators.
+        """
         url = self._urls.get("history")
         if not url:
             self._log("History alerts URL not configured.", level="ERROR")
             return None
         try:
             async def _do_fetch():
-                async with self._session.get(url) as resp:
+                headers = {}
+                if etag: headers['If-None-Match'] = etag
+                if last_modified: headers['If-Modified-Since'] = last_modified
+                async with self._session.get(url, headers=headers) as resp:
+                    if resp.status == 304:
+                        self._log("History alerts not modified since the last fetch.", level="DEBUG")
+                        return []
                     resp.raise_for_status()
-                    raw_data = await resp.read()
-                    try:
-                        return raw_data.decode('utf-8-sig')
-                    except UnicodeDecodeError:
-                        return raw_data.decode('utf-8')
-
-            text = await self._fetch_with_retries(_do_fetch)
-            if not text or not text.strip():
-                return None
-            try:
-                text = check_bom(text)
-                data = json.loads(text)
-                if isinstance(data, list):
-                    return data
-                self._log("History response is not a list", level="WARNING")
-                return None
-            except json.JSONDecodeError as e:
-                log_text_preview = text[:5500].replace('\n', '\\n').replace('\r', '\\r')
-                self._log(f"Invalid JSON in history alerts: {e}. Raw text preview: '{log_text_preview}...'", level="WARNING")
-                return None
+                    self.history_validators = {"etag": resp.headers.get('ETag'), "last_modified": resp.headers.get('Last-Modified')}
+                    return await self._read_history(resp.content.iter_chunked(self.HISTORY_CHUNK_SIZE), stop_before)
+
+            return await self._fetch_with_retries(_do_fetch)
+        except ValueError as e: # Includes json.JSONDecodeError and UnicodeDecodeError
+            preview = ""
+            if isinstance(e, json.JSONDecodeError):
+                preview = e.doc[max(0, e.pos - 500):e.pos + 500].replace('\n', '\\n').replace('\r', '\\r')
+                preview = f" Raw text around the error: '{preview}'"
+            self._log(f"Invalid JSON in history alerts: {e}.{preview}", level="WARNING")
         except aiohttp.ClientResponseError as e:
             self._log(f"HTTP error fetching history: Status {e.status}, Message: {e.message}", level="WARNING")
         except (aiohttp.ClientError, asyncio.TimeoutError) as e:
@@ -251,6 +490,35 @@ class OrefAPIClient:
             self._log(f"Unexpected error fetching history: {e}", level="ERROR")
         return None
 
+    async def _read_history(self, chunks, stop_before=None):
+        """
+        Decodes and parses the history feed from an async iterator of byte chunks, returning the
+        entries read (None for an empty body). Stops after HISTORY_STOP_AFTER consecutive entries
+        older than `stop_before`, which tolerates small ordering glitches in the feed.
+        """
+        decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        stream = JsonArrayStream()
+        entries = []
+        older_run = 0
+        stats = self.history_stats = {"history_bytes": 0, "history_entries": 0, "history_stopped_early": False}
+        async for chunk in chunks:
+            stats["history_bytes"] += len(chunk)
+            for entry in stream.feed(decoder.decode(chunk)):
+                entries.append(entry)
+                if stop_before is None: continue
+                t = parse_datetime_str(entry.get('alertDate')) if isinstance(entry, dict) else None
+                if t is not None and t < stop_before:
+                    older_run += 1
+                    if older_run >= self.HISTORY_STOP_AFTER:
+                        stats["history_entries"] = len(entries)
+                        stats["history_stopped_early"] = True
+                        return entries
+                else:
+                    older_run = 0
+        entries.extend(stream.feed(decoder.decode(b"", final=True), final=True))
+        stats["history_entries"] = len(entries)
+        return entries if stream.started else None
+
     async def download_file(self, url: str):
         """Download text content (e.g. Lamas data), return str or None."""
         try:
@@ -277,23 +545,33 @@ class OrefAPIClient:
 # Helper Class: LamasDataManager
 # ----------------------------------------------------------------------
 class LamasDataManager:
+    # Bump CACHE_VERSION whenever _process_lamas_data, standardize_name or the coordinate index layout change.
+    CACHE_MAGIC   = b"RAILAMAS"
+    CACHE_VERSION = 1
+    MAX_UNKNOWN_CITIES = 1024 # Bound on interned names that are not in the Lamas data (more are not interned)
+
     def __init__(self, file_path, github_url, api_client, logger):
         self._local_file_path = file_path
+        self._cache_file_path = os.path.splitext(file_path)[0] + ".cache"
         self._github_url      = github_url
         self._api_client      = api_client
         self._log             = logger
         self._lamas_data      = None
         self._city_details_map= {}
+        self._reset_coordinate_index()
 
     async def load_data(self, force_download=False):
         """Loads Lamas data, preferring local file unless forced or missing/invalid."""
         loaded = None
+        source_is_local = False
         if not force_download and os.path.exists(self._local_file_path):
+            if self._load_cache():
+                return True
             try:
                 with open(self._local_file_path, 'r', encoding='utf-8-sig') as f:
                     loaded = json.load(f)
                 if loaded and 'areas' in loaded: 
-                    pass
+                    source_is_local = True
                 else:
                     self._log("Local Lamas data invalid or empty. Will attempt download.", level="WARNING")
                     loaded = None 
@@ -313,6 +591,7 @@ class LamasDataManager:
                             os.makedirs(os.path.dirname(self._local_file_path), exist_ok=True)
                             with open(self._local_file_path, 'w', encoding='utf-8-sig') as f:
                                 json.dump(loaded, f, ensure_ascii=False, indent=2) 
+                            source_is_local = True
                             self._log("Lamas data downloaded and saved locally.")
                         except Exception as e:
                             self._log(f"Error saving Lamas data locally to '{self._local_file_path}': {e}", level="ERROR")
@@ -327,13 +606,102 @@ class LamasDataManager:
 
         if loaded and self._process_lamas_data(loaded):
             self._build_city_details_map()
+            self._build_coordinate_index()
+            if source_is_local:
+                self._save_cache()
             return True
 
         self._log("CRITICAL: Failed to load Lamas data from both local file and download.", level="CRITICAL")
         self._lamas_data = None
         self._city_details_map = {}
+        self._reset_coordinate_index()
         return False
 
+    def _source_fingerprint(self, with_hash=False):
+        st = os.stat(self._local_file_path)
+        fp = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        if with_hash:
+            with open(self._local_file_path, 'rb') as f:
+                fp["sha256"] = hashlib.sha256(f.read()).hexdigest()
+        return fp
+
+    def _load_cache(self):
+        """
+        Restores the processed map and coordinate index from the binary cache next to the JSON file.
+        The cache is used only if its magic, version and payload checksum are intact and it was built
+        from the current source file (same size and mtime, or same content hash if only touched).
+        """
+        path = self._cache_file_path
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+            header_len = len(self.CACHE_MAGIC) + 4 + 32
+            if blob[:len(self.CACHE_MAGIC)] != self.CACHE_MAGIC or len(blob) < header_len:
+                self._log("Lamas cache has an unknown format. Rebuilding.", level="DEBUG")
+                return False
+            version = int.from_bytes(blob[len(self.CACHE_MAGIC):len(self.CACHE_MAGIC) + 4], "little")
+            if version != self.CACHE_VERSION:
+                self._log(f"Lamas cache version {version} != {self.CACHE_VERSION}. Rebuilding.", level="DEBUG")
+                return False
+            payload = blob[header_len:]
+            if hashlib.sha256(payload).digest() != blob[header_len - 32:header_len]:
+                self._log("Lamas cache checksum mismatch. Rebuilding.", level="WARNING")
+                return False
+            cache = marshal.loads(payload)
+
+            source = cache["source"]
+            current = self._source_fingerprint()
+            if (current["size"], current["mtime_ns"]) != (source["size"], source["mtime_ns"]):
+                if self._source_fingerprint(with_hash=True)["sha256"] != source["sha256"]:
+                    self._log("Lamas source file changed since the cache was built. Rebuilding.", level="INFO")
+                    return False
+
+            lons, lats, areas = array('d'), array('d'), array('H')
+            lons.frombytes(cache["lons"])
+            lats.frombytes(cache["lats"])
+            areas.frombytes(cache["areas"])
+            self._lamas_data       = cache["lamas_data"]
+            self._city_details_map = cache["city_details_map"]
+            self._city_ids         = cache["city_ids"]
+            self._city_lons, self._city_lats, self._city_areas = lons, lats, areas
+            self._area_names       = cache["area_names"]
+            self._build_id_tables()
+            self._log(f"Lamas data loaded from cache: {len(self._city_ids)} cities in {len(self._area_names)} areas.", level="DEBUG")
+            return True
+        except Exception as e:
+            self._log(f"Error reading Lamas cache '{path}': {e}. Rebuilding.", level="WARNING")
+            self._lamas_data = None
+            self._city_details_map = {}
+            self._reset_coordinate_index()
+            return False
+
+    def _save_cache(self):
+        """Writes the processed map and coordinate index to the binary cache (temp file + rename)."""
+        path = self._cache_file_path
+        tmp_path = f"{path}.tmp"
+        try:
+            payload = marshal.dumps({
+                "source": self._source_fingerprint(with_hash=True),
+                "lamas_data": self._lamas_data,
+                "city_details_map": self._city_details_map,
+                "city_ids": self._city_ids,
+                "lons": self._city_lons.tobytes(),
+                "lats": self._city_lats.tobytes(),
+                "areas": self._city_areas.tobytes(),
+                "area_names": self._area_names,
+            })
+            header = self.CACHE_MAGIC + self.CACHE_VERSION.to_bytes(4, "little") + hashlib.sha256(payload).digest()
+            with open(tmp_path, 'wb') as f:
+                f.write(header + payload)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            self._log(f"Error writing Lamas cache '{path}': {e}", level="WARNING")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
     def _process_lamas_data(self, raw_data):
         if not raw_data or 'areas' not in raw_data:
             self._log("Lamas data missing 'areas' key during processing.", level="ERROR")
@@ -411,6 +779,118 @@ class LamasDataManager:
             return None
         return self._city_details_map.get(standardized_name) 
 
+    def _reset_coordinate_index(self):
+        self._city_ids   = {}            # standardized name -> dense integer id
+        self._city_lons  = array('d')    # id -> longitude (NaN when missing)
+        self._city_lats  = array('d')    # id -> latitude (NaN when missing)
+        self._city_areas = array('H')    # id -> index into self._area_names
+        self._area_names = []
+        self._city_names = []            # id -> standardized name (Lamas ids, then interned unknown names)
+        self._city_display = []          # id -> original (display) name
+        self._unknown_ids = {}           # standardized name -> id, for interned names not in the Lamas data
+
+    def _build_coordinate_index(self):
+        """Assigns dense ids (area-major Lamas order) and fills the parallel coordinate arrays."""
+        self._reset_coordinate_index()
+        if not self._lamas_data or 'areas' not in self._lamas_data:
+            return
+        nan = float('nan')
+        for area, cities in self._lamas_data['areas'].items():
+            area_idx = len(self._area_names)
+            self._area_names.append(area)
+            if not isinstance(cities, dict): continue
+            for std, details in cities.items():
+                lon, lat = details.get("long", nan), details.get("lat", nan)
+                city_id = self._city_ids.get(std)
+                if city_id is None:
+                    self._city_ids[std] = len(self._city_lons)
+                    self._city_lons.append(lon)
+                    self._city_lats.append(lat)
+                    self._city_areas.append(area_idx)
+                else: # Duplicate name: last area wins, same as _city_details_map
+                    self._city_lons[city_id] = lon
+                    self._city_lats[city_id] = lat
+                    self._city_areas[city_id] = area_idx
+        self._build_id_tables()
+        self._log(f"Lamas coordinate index built: {len(self._city_ids)} cities in {len(self._area_names)} areas.", level="DEBUG")
+
+    def _build_id_tables(self):
+        """Fills the id -> name tables from self._city_ids (Lamas cities only)."""
+        self._city_names = [None] * len(self._city_ids)
+        self._city_display = [None] * len(self._city_ids)
+        for std, city_id in self._city_ids.items():
+            details = self._city_details_map.get(std) or {}
+            self._city_names[city_id] = std
+            self._city_display[city_id] = details.get("original_name", std)
+        self._unknown_ids = {}
+
+    def intern(self, name: str):
+        """
+        Returns the integer id for a city name, like get_city_id(), but names not in the Lamas data
+        also get an id, after the Lamas ids (with no coordinates and the unknown area). Those are kept
+        apart from the Lamas ids, so get_city_id() still returns None for them, and at most
+        MAX_UNKNOWN_CITIES are kept: past that, an unknown name is its own id (the standardized
+        name, not stored), which the id accessors below accept too, so the city is never dropped.
+        """
+        city_id = self.get_city_id(name)
+        if city_id is not None:
+            return city_id
+        std = standardize_name(name)
+        city_id = self._unknown_ids.get(std)
+        if city_id is None:
+            if len(self._unknown_ids) >= self.MAX_UNKNOWN_CITIES:
+                return std
+            city_id = len(self._city_names)
+            self._unknown_ids[std] = city_id
+            self._city_names.append(std)
+            self._city_display.append(std)
+            if len(self._unknown_ids) == self.MAX_UNKNOWN_CITIES:
+                self._log(f"{self.MAX_UNKNOWN_CITIES} city names not in the Lamas data seen; further unknown names are not interned.", level="WARNING")
+        return city_id
+
+    def intern_all(self, names) -> frozenset:
+        """The ids of `names` (see intern())."""
+        return frozenset(map(self.intern, names))
+
+    def is_known(self, city_id) -> bool:
+        """True for ids of Lamas cities, False for unknown names (interned or not)."""
+        return type(city_id) is int and city_id < len(self._city_lons)
+
+    def city_name(self, city_id) -> str:
+        """Standardized name of a city id."""
+        return city_id if type(city_id) is str else self._city_names[city_id]
+
+    def display_name(self, city_id) -> str:
+        """Original Lamas name of a city id (the standardized name for unknown cities)."""
+        return city_id if type(city_id) is str else self._city_display[city_id]
+
+    def city_area(self, city_id) -> str:
+        """Area name of a city id, or DEFAULT_UNKNOWN_AREA for unknown cities."""
+        if self.is_known(city_id):
+            return self._area_names[self._city_areas[city_id]]
+        return DEFAULT_UNKNOWN_AREA
+
+    def get_city_id(self, name: str):
+        """Returns the integer id for a standardized (or raw) city name, or None if unknown."""
+        city_id = self._city_ids.get(name)
+        if city_id is None and isinstance(name, str):
+            city_id = self._city_ids.get(standardize_name(name))
+        return city_id
+
+    def get_coords(self, city_id):
+        """Returns (lon, lat) for a city id, or None if the city has no coordinates."""
+        if not self.is_known(city_id):
+            return None
+        lon, lat = self._city_lons[city_id], self._city_lats[city_id]
+        if lon != lon or lat != lat: # NaN check
+            return None
+        return (lon, lat)
+
+    def get_city_coords(self, name: str):
+        """Returns (lon, lat) for a city name, or None if unknown or without coordinates."""
+        city_id = self.get_city_id(name)
+        return None if city_id is None else self.get_coords(city_id)
+
 # ----------------------------------------------------------------------
 # Helper Class: AlertProcessor
 # ----------------------------------------------------------------------
@@ -457,17 +937,18 @@ class AlertProcessor:
             self._log(f"Error during _check_len for {context}: {e}", level="ERROR")
         return text
 
-    def process_alert_window_data(self, category, title, description, window_std_cities, window_alerts_grouped, user_configured_stds=None):
-        if user_configured_stds is None:
-            user_configured_stds = set()
-            
+    def process_alert_window_data(self, category, title, description, window):
+        """
+        Builds the window's text attributes from an AlertWindow, whose sorted name lists and
+        per-area text are kept up to date as payloads arrive.
+        """
         log_prefix = "[Alert Processor]"
 
         icon, emoji = self._icons.get(category, ("mdi:alert", "❗"))
         duration = self.extract_duration_from_desc(description)
 
-        if not window_std_cities:
-            self._log(f"{log_prefix} Called with empty overall city set (window_std_cities). Returning default structure.", level="WARNING")
+        if not window.city_ids:
+            self._log(f"{log_prefix} Called with an empty alert window. Returning default structure.", level="WARNING")
             input_text_state = title[:self.max_input_len] if title else "אין התרעות"
             return {
                 "areas_alert_str": "", "cities_list_sorted": [], "data_count": 0,
@@ -480,39 +961,11 @@ class AlertProcessor:
                 "input_text_state": input_text_state
             }
 
-        my_alarming_stds = window_std_cities.intersection(user_configured_stds)
-        my_alarming_orig_names = []
-
-        overall_areas_set = set()
-        overall_orig_cities_set = set()
-        cities_by_area_overall = {}
-        unknown_cities_logged_overall = set()
-        
-        for std in window_std_cities:
-            det = self._lamas.get_city_details(std)
-            area = DEFAULT_UNKNOWN_AREA
-            name = std
-            if det:
-                area = det.get("area", DEFAULT_UNKNOWN_AREA)
-                name = det.get("original_name", std)
-            elif std not in unknown_cities_logged_overall:
-                self._log(f"{log_prefix} Overall Processing: City '{std}' not found in Lamas. Using Area='{area}'.", level="WARNING")
-                unknown_cities_logged_overall.add(std)
-                
-            overall_areas_set.add(area)
-            overall_orig_cities_set.add(name)
-            cities_by_area_overall.setdefault(area, set()).add(name)
-            
-            if std in my_alarming_stds:
-                my_alarming_orig_names.append(name)
-
-        my_alarming_orig_names.sort()
-        user_alarming_str = ", ".join(my_alarming_orig_names)
+        user_alarming_str = ", ".join(window.user_names)
 
-        overall_areas_list_sorted = sorted(list(overall_areas_set))
+        overall_areas_list_sorted = window.areas
         overall_areas_str = ", ".join(overall_areas_list_sorted) if overall_areas_list_sorted else "ישראל"
-        other_cities = sorted(list(overall_orig_cities_set - set(my_alarming_orig_names)))
-        full_cities_list = my_alarming_orig_names + other_cities
+        full_cities_list = window.user_names + window.other_names
         overall_count = len(full_cities_list)
         
         if overall_count > 50:
@@ -522,13 +975,9 @@ class AlertProcessor:
 
         overall_cities_str = ", ".join(display_cities_list)
 
-        full_overall_lines = []
-        for area, names_set in sorted(cities_by_area_overall.items()):
-            sorted_cities_str_area = ", ".join(sorted(list(names_set)))
-            full_overall_lines.append(f"{area}: {sorted_cities_str_area}")
-            
-        if len(full_overall_lines) > 20:
-            full_overall_lines = full_overall_lines[:20] + ["...רשימה חלקית עקב עומס"]
+        full_overall_lines = [window.area_line(area) for area in overall_areas_list_sorted[:20]]
+        if len(overall_areas_list_sorted) > 20:
+            full_overall_lines.append("...רשימה חלקית עקב עומס")
             
         status_str_raw = f"{title} - {overall_areas_str}: {overall_cities_str}"
         full_message_str_raw = title + "\n * " + "\n * ".join(full_overall_lines)
@@ -536,13 +985,13 @@ class AlertProcessor:
 
         wa_grouped_lines = []
         tg_grouped_lines = []
-        num_alert_types_in_window = len(window_alerts_grouped)
+        num_alert_types_in_window = len(window.grouped)
 
         if num_alert_types_in_window > 1:
             wa_grouped_lines.append(f"{emoji} *התרעות פעילות ({num_alert_types_in_window} סוגים)*")
             tg_grouped_lines.append(f"{emoji} **התרעות פעילות ({num_alert_types_in_window} סוגים)**")
         elif num_alert_types_in_window == 1:
-            single_title = next(iter(window_alerts_grouped.keys()))
+            single_title = next(iter(window.grouped.keys()))
             wa_grouped_lines.append(f"{emoji} *{single_title}*")
             tg_grouped_lines.append(f"{emoji} **{single_title}**")
         else:
@@ -550,18 +999,15 @@ class AlertProcessor:
             wa_grouped_lines.append(f"{emoji} *{title}*")
             tg_grouped_lines.append(f"{emoji} **{title}**")
 
-        grouped_processed_count = 0
-        for alert_title_group, areas_dict in sorted(window_alerts_grouped.items()):
+        for alert_title_group in sorted(window.grouped):
             if num_alert_types_in_window > 1:
                 group_icon, group_emoji = ("mdi:alert-decagram", "🚨")
                 wa_grouped_lines.append(f"\n{group_emoji} *{alert_title_group}*")
                 tg_grouped_lines.append(f"\n{group_emoji} **{alert_title_group}**")
-            for area, cities_set in sorted(areas_dict.items()):
-                if not cities_set: continue
-                sorted_cities_str_group = ", ".join(sorted(list(cities_set)))
+            for area in sorted(window.grouped[alert_title_group]):
+                sorted_cities_str_group = window.group_text(alert_title_group, area)
                 wa_grouped_lines.append(f"> {area}\n{sorted_cities_str_group}")
                 tg_grouped_lines.append(f"**__{area}__** — {sorted_cities_str_group}")
-                grouped_processed_count += len(cities_set)
 
         if description:
             wa_grouped_lines.append(f"\n{description}")
@@ -594,11 +1040,101 @@ class AlertProcessor:
             "input_text_state": input_state
         }
 
+# ----------------------------------------------------------------------
+# Helper Class: AlertWindow
+# ----------------------------------------------------------------------
+class AlertWindow:
+    """
+    The cities of the current alert window (LamasDataManager ids), overall and grouped by title and area,
+    with the sorted name lists and per-area text that process_alert_window_data renders. add() updates
+    them in place and re-renders only the areas the payload touched.
+    """
+    def __init__(self, lamas_manager, user_city_ids=frozenset(), logger=None):
+        self._lamas = lamas_manager
+        self._user_city_ids = user_city_ids
+        self._log = logger
+        self.clear()
+
+    def clear(self):
+        self.city_ids = set()
+        self.grouped = {}            # title -> area -> set of ids
+        self.areas = []              # sorted areas of the window's cities
+        self.user_names = []         # sorted names of the user's cities (one per id)
+        self.other_names = []        # sorted unique names not among user_names
+        self.nonuser_names = []      # sorted names of the other cities (one per id)
+        self._names = set()          # every name in the window
+        self._user_name_set = set()
+        self._area_names = {}        # area -> sorted unique names
+        self._area_lines = {}        # area -> "area: names"
+        self._group_names = {}       # (title, area) -> sorted names (one per id)
+        self._group_texts = {}       # (title, area) -> joined names
+
+    def area_line(self, area) -> str:
+        return self._area_lines[area]
+
+    def group_text(self, title, area) -> str:
+        return self._group_texts[(title, area)]
+
+    def add(self, title, city_ids):
+        """
+        Adds a payload's cities under `title`. Returns (names, areas) of the cities that were new to
+        the title's group, names in payload order.
+        """
+        lamas = self._lamas
+        touched_areas, touched_groups = set(), set()
+        new_names, new_areas = [], set()
+        title_group = self.grouped.setdefault(title, {})
+        for city_id in city_ids:
+            area = lamas.city_area(city_id)
+            name = lamas.display_name(city_id)
+            if city_id not in self.city_ids:
+                self.city_ids.add(city_id)
+                if not lamas.is_known(city_id) and self._log:
+                    self._log(f"[Alert Window] City '{lamas.city_name(city_id)}' not found in Lamas. Using Area='{area}'.", level="WARNING")
+                area_names = self._area_names.get(area)
+                if area_names is None:
+                    bisect.insort(self.areas, area)
+                    area_names = self._area_names[area] = []
+                if _insort_unique(area_names, name):
+                    touched_areas.add(area)
+                if city_id in self._user_city_ids:
+                    if name in self._names and name not in self._user_name_set:
+                        self.other_names.pop(bisect.bisect_left(self.other_names, name))
+                    bisect.insort(self.user_names, name)
+                    self._user_name_set.add(name)
+                else:
+                    if name not in self._names:
+                        bisect.insort(self.other_names, name)
+                    bisect.insort(self.nonuser_names, name)
+                self._names.add(name)
+
+            cities = title_group.setdefault(area, set())
+            if city_id not in cities:
+                cities.add(city_id)
+                bisect.insort(self._group_names.setdefault((title, area), []), name)
+                touched_groups.add((title, area))
+                new_names.append(name)
+                new_areas.add(area)
+
+        for area in touched_areas:
+            self._area_lines[area] = f"{area}: {', '.join(self._area_names[area])}"
+        for key in touched_groups:
+            self._group_texts[key] = ", ".join(self._group_names[key])
+        return new_names, new_areas
+
+def _insort_unique(sorted_list, item) -> bool:
+    """Inserts item into sorted_list unless already present; returns True if inserted."""
+    i = bisect.bisect_left(sorted_list, item)
+    if i < len(sorted_list) and sorted_list[i] == item:
+        return False
+    sorted_list.insert(i, item)
+    return True
+
 # ----------------------------------------------------------------------
 # Helper Class: HistoryManager
 # ----------------------------------------------------------------------
 class HistoryManager:
-    def __init__(self, hours_to_show, lamas_manager, logger, timer_duration_seconds):
+    def __init__(self, hours_to_show, lamas_manager, logger, timer_duration_seconds, journal=None):
         if not isinstance(timer_duration_seconds, (int, float)) or timer_duration_seconds <= 0:
             logger.log(f"Invalid timer_duration_seconds ({timer_duration_seconds}), using default 120.", level="WARNING")
             timer_duration_seconds = 120
@@ -610,9 +1146,41 @@ class HistoryManager:
         self._lamas = lamas_manager 
         self._log   = logger        
         self._timer_duration_seconds = timer_duration_seconds 
-        self._history_list = [] 
-        self._added_in_current_poll = set() 
+        self._journal = journal
         self._max_history_events = 2000
+        self._history_list = deque(maxlen=self._max_history_events) # Newest first
+        self._added_in_current_poll = set() 
+
+        # Incremental merge state for get_history_attributes()
+        self._merge_window = timedelta(minutes=50)
+        self._city_alerts = {}            # city -> deque of its alerts, newest first
+        self._city_order = OrderedDict()  # cities by their newest alert, newest first
+        self._city_blocks = {}            # city -> [(time, HA entry dict), ...] merged blocks
+        self._dirty_cities = set()
+        self._needs_rebuild = False
+        self._generation = 0
+        self._cached_attrs = None
+        self._cached_generation = -1
+
+        # Incremental per-location aggregates for get_history_geojson()
+        self._geo_full_rebuild = True
+        self._geo_changed_cities = set()   # cities whose merged blocks changed since the last GeoJSON
+        self._city_locations = {}          # city -> (lon, lat) or None, resolved once via Lamas
+        self._location_cities = {}         # (lon, lat) -> cities in the history at that point
+        self._location_features = {}       # (lon, lat) -> (latest time, latest city, feature JSON text)
+        self._geojson_text = None
+        self._geojson_generation = -1
+
+    @property
+    def generation(self) -> int:
+        """Increments whenever the history content changes."""
+        return self._generation
+
+    def _reset_history(self, alerts):
+        """Replaces the whole history (newest-first) and schedules a full merge rebuild."""
+        self._history_list = deque(alerts[:self._max_history_events], maxlen=self._max_history_events)
+        self._needs_rebuild = True
+        self._generation += 1
 
     def clear_poll_tracker(self):
         """Clears the set tracking entries added during the last poll cycle."""
@@ -620,32 +1188,159 @@ class HistoryManager:
 
     def _prune_and_limit(self) -> bool:
         """
-        Prunes old alerts from the internal history list to prevent memory leaks and slow loops.
+        Prunes old alerts from the internal history to prevent memory leaks and slow loops.
+        The history is kept newest-first, so expired alerts are popped from the old end.
         Returns True if items were actually removed.
         """
         original_len = len(self._history_list)
-        now = datetime.now()
-        cutoff = now - timedelta(hours=self._hours_to_show)
+        cutoff = datetime.now() - timedelta(hours=self._hours_to_show)
+
+        history = self._history_list
+        while history and history[-1]['time'] < cutoff:
+            self._pop_oldest()
+
+        return len(history) != original_len
+
+    def _pop_oldest(self):
+        alert = self._history_list.pop()
+        self._generation += 1
+        if self._needs_rebuild: return
+        city = alert['city']
+        city_alerts = self._city_alerts.get(city)
+        if city_alerts:
+            city_alerts.pop()
+            if not city_alerts:
+                del self._city_alerts[city]
+                self._city_order.pop(city, None)
+                self._city_blocks.pop(city, None)
+                self._dirty_cities.discard(city)
+                self._geo_changed_cities.add(city)
+                return
+        self._dirty_cities.add(city)
+
+    def _insert_alerts(self, alerts: list, alert_time: datetime):
+        """Inserts alerts sharing alert_time, keeping the history newest-first."""
+        history = self._history_list
+        alerts = alerts[:self._max_history_events]
+        if not history or alert_time > history[0]['time']:
+            while history and len(history) + len(alerts) > self._max_history_events:
+                self._pop_oldest()
+            history.extendleft(reversed(alerts))
+            self._generation += 1
+            if self._needs_rebuild: return
+            for alert in reversed(alerts):
+                city = alert['city']
+                self._city_alerts.setdefault(city, deque()).appendleft(alert)
+                self._city_order[city] = None
+                self._city_order.move_to_end(city, last=False)
+                self._dirty_cities.add(city)
+            return
 
-        # Filter out old items
-        self._history_list = [
-            a for a in self._history_list
-            if isinstance(a.get('time'), datetime) and a['time'] >= cutoff
-        ]
+        # Same timestamp as the newest entry, or the clock went backwards (e.g. DST change):
+        # bisect for the slot after all newer-or-equal entries
+        lo, hi = 0, len(history)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if history[mid]['time'] >= alert_time: lo = mid + 1
+            else: hi = mid
+        for alert in alerts:
+            if len(history) == history.maxlen:
+                if lo >= len(history): break # Older than everything kept, the cap drops it
+                history.pop()
+            history.insert(lo, alert)
+            lo += 1
+        self._needs_rebuild = True
+        self._generation += 1
+
+    def _rebuild_merge_index(self):
+        """Rebuilds the per-city indexes from scratch (initial load or out-of-order insert)."""
+        self._city_alerts = {}
+        self._city_order = OrderedDict()
+        self._city_blocks = {}
+        for alert in self._history_list:
+            if not all(k in alert for k in ['city', 'time']) or not isinstance(alert.get('time'), datetime):
+                self._log(f"Merge Logic: Skipping malformed history entry: {alert}", level="WARNING")
+                continue
+            city = alert['city']
+            if city not in self._city_alerts:
+                self._city_alerts[city] = deque()
+                self._city_order[city] = None
+            self._city_alerts[city].append(alert)
+        self._dirty_cities = set(self._city_alerts)
+        self._needs_rebuild = False
+        self._geo_full_rebuild = True
+
+    def _merge_city_blocks(self, city_alerts) -> list:
+        """Merges one city's newest-first alerts into blocks of 50 minutes from each block's latest alert."""
+        blocks = []
+        for alert in city_alerts:
+            if blocks and blocks[-1][0]['time'] - alert['time'] < self._merge_window:
+                blocks[-1].append(alert)
+            else:
+                blocks.append([alert])
+
+        merged = []
+        for block in blocks:
+            latest_alert_in_block = block[0]
+            all_titles_in_block = set()
+            for alert_in_block in block:
+                original_title = alert_in_block.get('title', 'לא ידוע')
+                translated_title = "התרעות מקדימות" if original_title == "בדקות הקרובות צפויות להתקבל התרעות באזורך" else original_title
+                all_titles_in_block.add(translated_title)
+
+            alert_time = latest_alert_in_block['time']
+            try:
+                time_str = alert_time.strftime('%Y-%m-%d %H:%M:%S')
+            except (AttributeError, Exception) as e:
+                self._log(f"History Formatting: Error formatting time {alert_time}: {e}", level="WARNING")
+                time_str = str(alert_time)
+
+            merged.append((alert_time, {
+                'title': " & ".join(sorted(list(all_titles_in_block))),
+                'city': latest_alert_in_block.get('city', 'לא ידוע'),
+                'area': latest_alert_in_block.get('area', DEFAULT_UNKNOWN_AREA),
+                'time': time_str
+            }))
+        return merged
+
+    def attach_journal(self, journal):
+        """Starts journaling history alerts to `journal`, which must already be open."""
+        self._journal = journal
 
-        # Limit to max events
-        if len(self._history_list) > self._max_history_events:
-            self._history_list = self._history_list[:self._max_history_events]
+    def read_journal(self):
+        """Returns the journaled alerts within hours_to_show, newest first, or None without an open journal. Blocking."""
+        if not self._journal or not self._journal.is_open:
+            return None
+        cutoff = datetime.now() - timedelta(hours=self._hours_to_show)
+        return self._journal.query(cutoff, limit=self._max_history_events)
 
-        return len(self._history_list) != original_len
+    def feed_horizon(self, with_journal=False):
+        """
+        Oldest alert time load_history_data uses from AlertsHistory.json: the hours_to_show cutoff, or
+        with a journal its covered_until (None when the whole feed is needed).
+        """
+        if with_journal:
+            return self._journal.covered_until
+        return datetime.now() - timedelta(hours=self._hours_to_show)
 
     async def load_initial_history(self, api_client):
         """Loads initial history data from the API."""
-        data = await api_client.get_alert_history() 
+        self.load_history_data(await api_client.get_alert_history(stop_before=self.feed_horizon()))
+
+    def load_history_data(self, data, journal_alerts=None):
+        """
+        Replaces the history with the alerts in an AlertsHistory.json payload (already fetched).
+        With a journal, `journal_alerts` (newest first, from AlertJournal.query) is the history and
+        only payload alerts newer than the journal's covered_until are added to it (and journaled).
+        """
+        journal = self._journal if journal_alerts is not None else None
         if not isinstance(data, list):
-            self._history_list = []
-            self._log("Failed to load initial history.", level="WARNING")
-            return
+            if journal is None:
+                self._reset_history([])
+                self._log("Failed to load initial history.", level="WARNING")
+                return
+            self._log("Failed to load AlertsHistory.json. Using the journaled history only.", level="WARNING")
+            data = []
 
         now = datetime.now()
         cutoff = now - timedelta(hours=self._hours_to_show)
@@ -653,6 +1348,12 @@ class HistoryManager:
         unknown_cities_logged = set()
         loaded_count = 0
         parse_errors = 0
+        covered_until = journal.covered_until if journal else None
+        gap_alerts, gap_categories = [], []
+        journaled = set() # Feed alerts journaled past covered_until (e.g. restarted again before a healthy poll)
+        for alert in journal_alerts or ():
+            if covered_until is not None and alert['time'] <= covered_until: break
+            journaled.add((alert['time'], alert['title'], alert['city']))
 
         for e in data:
             loaded_count += 1
@@ -669,7 +1370,10 @@ class HistoryManager:
                 if alert_date_str: parse_errors += 1
                 continue 
             
-            if t < cutoff:
+            if journal:
+                if covered_until is not None and t <= covered_until:
+                    continue # Already journaled
+            elif t < cutoff:
                 continue 
 
             city_raw = e.get('data','לא ידוע')
@@ -678,26 +1382,39 @@ class HistoryManager:
             area = det["area"] if det else DEFAULT_UNKNOWN_AREA
             orig_name = det["original_name"] if det else city_raw
 
-            temp_hist.append({
+            alert = {
                 'title': title_raw,
                 'city': orig_name,
                 'area': area,
                 'time': t 
-            })
+            }
+            if journal:
+                if (t, title_raw, orig_name) in journaled:
+                    continue
+                gap_alerts.append(alert)
+                gap_categories.append(e.get('category') if isinstance(e.get('category'), int) else None)
+                if t < cutoff:
+                    continue
+            temp_hist.append(alert)
+
+        if journal:
+            journal.record(gap_alerts, gap_categories)
+            self._log(f"Initial history: {len(journal_alerts)} alerts from the journal, {len(gap_alerts)} newer alerts added from AlertsHistory.json.", level="INFO")
+            temp_hist = journal_alerts + temp_hist
 
         temp_hist.sort(key=lambda x: x.get('time', datetime.min), reverse=True)
-        self._history_list = temp_hist
+        self._reset_history(temp_hist)
         
         self._prune_and_limit()
 
         unique_cities = len(set(a['city'] for a in self._history_list))
         self._log(f"Initial history: Processed {loaded_count} raw alerts, kept {len(self._history_list)} within {self._hours_to_show}h ({unique_cities} unique cities).")
 
-    def update_history(self, title: str, std_payload_cities: set):
-        """Updates the history list with new alerts from the current payload."""
+    def update_history(self, title: str, std_payload_cities: set, category=None, persist=True):
+        """Updates the history list with new alerts from the current payload (journaled unless persist is False)."""
         now = datetime.now()
         unknown_cities_logged = set()
-        added_count_this_call = 0
+        new_alerts = []
 
         if not std_payload_cities:
             return
@@ -717,18 +1434,20 @@ class HistoryManager:
             history_key = (title, std, area) 
 
             if history_key not in self._added_in_current_poll:
-                self._history_list.append({
+                new_alerts.append({
                     'title': title,
                     'city': orig_city_name, 
                     'area': area,
                     'time': now 
                 })
                 self._added_in_current_poll.add(history_key)
-                added_count_this_call += 1
 
-        if added_count_this_call > 0:
-            self._history_list.sort(key=lambda x: x.get('time', datetime.min), reverse=True)
+        if new_alerts:
+            self._insert_alerts(new_alerts, now)
             self._prune_and_limit()
+            if persist and self._journal:
+                self._journal.record(new_alerts, category)
+                self._journal.mark_covered(now, force=True)
 
     def restructure_alerts(self, alerts_list: list) -> dict:
         """Groups alerts by title, then area, including city and time."""
@@ -766,79 +1485,167 @@ class HistoryManager:
     def get_history_attributes(self) -> dict:
         """
         Generates attributes for history sensors.
-        We assume self._history_list is already pruned via _prune_and_limit().
+        We assume self._history_list is already pruned via _prune_and_limit() and newest-first.
+        Merged blocks are kept per city and only cities touched since the last call are re-merged.
+        The returned dict is cached until the history changes (see `generation`); treat it as read-only.
         """
-        city_event_blocks = defaultdict(list)
-        merge_window = timedelta(minutes=50)
+        if self._cached_attrs is not None and self._cached_generation == self._generation:
+            return self._cached_attrs
 
-        for alert in self._history_list:
-            if not all(k in alert for k in ['city', 'time']) or not isinstance(alert.get('time'), datetime):
-                self._log(f"Merge Logic: Skipping malformed history entry: {alert}", level="WARNING")
-                continue
-
-            city_name = alert['city']
-            alert_time = alert['time']
-
-            if not city_event_blocks[city_name]:
-                city_event_blocks[city_name].append([alert])
-                continue
+        if self._needs_rebuild:
+            self._rebuild_merge_index()
+        for city in self._dirty_cities:
+            self._city_blocks[city] = self._merge_city_blocks(self._city_alerts[city])
+        self._geo_changed_cities.update(self._dirty_cities)
+        self._dirty_cities.clear()
 
-            latest_time_in_last_block = city_event_blocks[city_name][-1][0]['time']
+        merged_history_with_dt = [entry for city in self._city_order for entry in self._city_blocks[city]]
+        merged_history_with_dt.sort(key=lambda x: x[0], reverse=True)
+        final_history_list_for_ha = [entry for _, entry in merged_history_with_dt]
 
-            if latest_time_in_last_block - alert_time < merge_window:
-                city_event_blocks[city_name][-1].append(alert)
-            else:
-                city_event_blocks[city_name].append([alert])
-
-        merged_history_with_dt = []
-        for city, blocks in city_event_blocks.items():
-            for block in blocks:
-                if not block: continue
-
-                latest_alert_in_block = block[0]
-                all_titles_in_block = set()
-                for alert_in_block in block:
-                    original_title = alert_in_block.get('title', 'לא ידוע')
-                    translated_title = "התרעות מקדימות" if original_title == "בדקות הקרובות צפויות להתקבל התרעות באזורך" else original_title
-                    all_titles_in_block.add(translated_title)
-
-                final_title = " & ".join(sorted(list(all_titles_in_block)))
-                merged_alert = {
-                    'title': final_title,
-                    'city': latest_alert_in_block['city'],
-                    'area': latest_alert_in_block['area'],
-                    'time': latest_alert_in_block['time']
-                }
-                merged_history_with_dt.append(merged_alert)
+        final_grouped_structure = self.restructure_alerts(final_history_list_for_ha)
 
-        merged_history_with_dt.sort(key=lambda x: x.get('time', datetime.min), reverse=True)
+        self._cached_attrs = {
+            "cities_past_24h": sorted(self._city_order),
+            "last_24h_alerts": final_history_list_for_ha,
+            "last_24h_alerts_group": final_grouped_structure
+        }
+        self._cached_generation = self._generation
+        return self._cached_attrs
 
-        final_history_list_for_ha = []
-        final_cities_set = set()
+    def get_history_geojson(self) -> str:
+        """
+        The merged history (as in get_history_attributes) as compact GeoJSON FeatureCollection text:
+        one Point per location with its alert count, cities and latest alert, newest first.
+        Only the features of locations whose cities changed since the last call are rebuilt.
+        """
+        self.get_history_attributes()
+        if self._geojson_text is not None and self._geojson_generation == self._generation:
+            return self._geojson_text
 
-        for a in merged_history_with_dt:
-            time_str = "N/A"
-            try:
-                time_str = a['time'].strftime('%Y-%m-%d %H:%M:%S')
-            except (AttributeError, Exception) as e:
-                self._log(f"History Formatting: Error formatting time {a.get('time')}: {e}", level="WARNING")
-                time_str = str(a.get('time', 'N/A'))
-
-            city_name = a.get('city', 'לא ידוע')
-            final_history_list_for_ha.append({
-                'title': a.get('title', 'לא ידוע'),
-                'city': city_name,
-                'area': a.get('area', DEFAULT_UNKNOWN_AREA),
-                'time': time_str
-            })
-            final_cities_set.add(city_name)
+        if self._geo_full_rebuild:
+            self._location_cities, self._location_features = {}, {}
+            changed = list(self._city_blocks)
+        else:
+            changed = self._geo_changed_cities
+        dirty_locations = set()
+        for city in changed:
+            location = self._city_location(city)
+            if location is None: continue
+            cities = self._location_cities.setdefault(location, set())
+            if city in self._city_blocks: cities.add(city)
+            else: cities.discard(city)
+            dirty_locations.add(location)
+        self._geo_changed_cities = set()
+        self._geo_full_rebuild = False
+
+        # Ties on time go to the city listed first in the history, as in last_24h_alerts
+        rank = {city: i for i, city in enumerate(self._city_order)}
+        for location in dirty_locations:
+            cities = self._location_cities[location]
+            if cities:
+                self._location_features[location] = self._build_location_feature(location, cities, rank)
+            else:
+                del self._location_cities[location]
+                self._location_features.pop(location, None)
+
+        features = sorted(self._location_features.values(), key=lambda f: (f[0], -rank[f[1]]), reverse=True)
+        self._geojson_text = '{"type":"FeatureCollection","features":[' + ",".join(f[2] for f in features) + ']}'
+        self._geojson_generation = self._generation
+        return self._geojson_text
+
+    def _city_location(self, city):
+        """The (lon, lat) of a history city name, or None when Lamas has no coordinates for it (cached)."""
+        if city in self._city_locations:
+            return self._city_locations[city]
+        std = standardize_name(city)
+        city_id = self._lamas.get_city_id(std) if std else None
+        location = self._lamas.get_coords(city_id) if city_id is not None else None
+        if location is None and std:
+            reason = "Not found in Lamas" if city_id is None else "Missing coords"
+            self._log(f"GeoJSON (history): SKIP hist city '{city}' (std: '{std}'). Reason: {reason}.", level="DEBUG")
+        self._city_locations[city] = location = tuple(location) if location else None
+        return location
+
+    def _build_location_feature(self, location, cities, rank):
+        """Aggregates the merged blocks of the cities at one location into (latest time, latest city, feature JSON)."""
+        count, latest = 0, None
+        for city in cities:
+            blocks = self._city_blocks[city]
+            count += len(blocks)
+            key = (blocks[0][0], -rank[city])
+            if latest is None or key > latest[0]:
+                latest = (key, city, blocks[0][1])
+        (latest_time, _), latest_city, latest_entry = latest
+
+        city_names_at_point = sorted(cities)
+        alert_time_str = latest_entry.get('time', 'N/A')
+        lon, lat = location
+        feature = {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [round(lon, GEOJSON_COORD_DECIMALS), round(lat, GEOJSON_COORD_DECIMALS)]},
+            "properties": {
+                "name": ", ".join(city_names_at_point),
+                "area": latest_entry.get("area", ""),
+                "icon": "mdi:history",
+                "label": "📜",
+                "description": f"{latest_entry.get('title', 'התרעה היסטורית')}\n"
+                               f"{', '.join(city_names_at_point)}\n"
+                               f"זמן אחרון: {alert_time_str}\n"
+                               f"סה״כ: {count} אירועים",
+                "alert_count_at_location": count,
+                "latest_alert_time": alert_time_str
+            }
+        }
+        return latest_time, latest_city, json.dumps(feature, ensure_ascii=False, separators=(',', ':'))
 
-        final_grouped_structure = self.restructure_alerts(final_history_list_for_ha)
+    def get_budgeted_attributes(self, max_bytes: int) -> dict:
+        """
+        Like get_history_attributes, but each value is cut to its most recent entries so that its JSON
+        encoding fits in `max_bytes`. The alert list and group keep the newest alerts; the city list
+        keeps the most recently alerted cities (still sorted by name).
+        """
+        attrs = self.get_history_attributes()
+        alerts = attrs["last_24h_alerts"]
+
+        shown_alerts, used = 0, 2
+        for alert in alerts:
+            used += json_size(alert) + 2
+            if used > max_bytes: break
+            shown_alerts += 1
+
+        cities, used = set(), 2
+        for alert in alerts:
+            city = alert.get('city')
+            if city in cities: continue
+            used += json_size(city) + 2
+            if used > max_bytes: break
+            cities.add(city)
+
+        # Estimate how many of the newest alerts fit once grouped, then verify and shrink if needed.
+        seen_titles, seen_areas = set(), set()
+        shown_grouped, used = 0, 2
+        for alert in alerts:
+            title, area = alert.get('title', 'לא ידוע'), alert.get('area', DEFAULT_UNKNOWN_AREA)
+            time_str = alert.get('time', '')
+            used += json_size({'city': alert.get('city', 'לא ידוע'), 'time': time_str.split(' ')[-1]}) + 2
+            if title not in seen_titles:
+                used += json_size(title) + 6
+            if (title, area) not in seen_areas:
+                used += json_size(area) + 6
+            if used > max_bytes: break
+            seen_titles.add(title)
+            seen_areas.add((title, area))
+            shown_grouped += 1
+        group = self.restructure_alerts(alerts[:shown_grouped])
+        while shown_grouped and json_size(group) > max_bytes:
+            shown_grouped = int(shown_grouped * 0.9)
+            group = self.restructure_alerts(alerts[:shown_grouped])
 
         return {
-            "cities_past_24h": sorted(list(final_cities_set)),
-            "last_24h_alerts": final_history_list_for_ha,
-            "last_24h_alerts_group": final_grouped_structure
+            "cities_past_24h": sorted(cities),
+            "last_24h_alerts": alerts[:shown_alerts],
+            "last_24h_alerts_group": group
         }
 
     def get_last_alert_segment(self):
@@ -862,21 +1669,283 @@ class HistoryManager:
 
         return [{
             "type": "active",
-            "cities": list(set(latest_cities)), 
+            "cities": list(self._lamas.intern_all(latest_cities)), 
             "threat": self._history_list[0]['title']
         }]
     
+# ----------------------------------------------------------------------
+# Helper Class: AlertJournal
+# ----------------------------------------------------------------------
+class AlertJournal:
+    """
+    Local SQLite journal of history alerts (time, title, city, area, category), indexed on time and
+    on city + time, so the history survives restarts and can span more than AlertsHistory.json covers.
+    Writes run on a background thread. `covered_until` is the last time live polling was known to be
+    healthy: alerts up to then are already journaled, so on startup only newer ones are taken from
+    AlertsHistory.json. The history endpoint's ETag / Last-Modified are kept so an unchanged feed
+    is not downloaded again.
+    """
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS alerts ("
+        " ts REAL NOT NULL, title TEXT NOT NULL, city TEXT NOT NULL, area TEXT NOT NULL, category INTEGER)",
+        "CREATE INDEX IF NOT EXISTS alerts_ts ON alerts (ts)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS alerts_city_ts ON alerts (city, ts, title)",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    )
+    COVERED_INTERVAL = 60 # Seconds between covered_until updates while idle
+
+    def __init__(self, path, retention_days, logger):
+        self._path = path
+        self._retention = timedelta(days=retention_days)
+        self._log = logger
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writer = None
+        self._meta = {}
+        self._last_covered_write = None
+
+    def open(self) -> bool:
+        """Opens (creating if needed) the database, prunes expired alerts and reads the metadata. Blocking."""
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            conn = sqlite3.connect(self._path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                for statement in self.SCHEMA:
+                    conn.execute(statement)
+                pruned = conn.execute("DELETE FROM alerts WHERE ts < ?", ((datetime.now() - self._retention).timestamp(),)).rowcount
+            self._meta = dict(conn.execute("SELECT key, value FROM meta"))
+            count = conn.execute("SELECT COUNT(*) FROM alerts").fetchone()[0]
+        except Exception as e:
+            self._log(f"Alert journal: Could not open '{self._path}': {e}. Journal disabled.", level="WARNING")
+            return False
+        self._conn = conn
+        self._writer = BackgroundFileWriter(self._log, name="red-alerts-journal")
+        self._log(f"Alert journal: {count} alerts in '{self._path}' ({pruned} expired removed).", level="INFO")
+        return True
+
+    @property
+    def is_open(self) -> bool:
+        return self._conn is not None
+
+    @property
+    def covered_until(self):
+        value = self._meta.get("covered_until")
+        return datetime.fromtimestamp(float(value)) if value else None
+
+    def history_validators(self) -> dict:
+        """The AlertsHistory.json ETag / Last-Modified seen on the last fetch, as get_alert_history() kwargs."""
+        validators = {"etag": self._meta.get("history_etag"), "last_modified": self._meta.get("history_last_modified")}
+        return {k: v for k, v in validators.items() if v}
+
+    def set_history_validators(self, etag, last_modified):
+        self._set_meta({"history_etag": etag, "history_last_modified": last_modified})
+
+    def query(self, since, until=None, city=None, limit=None) -> list:
+        """Returns alerts with since <= time (< until), optionally for one city, newest first. Blocking."""
+        if not self._conn:
+            return []
+        sql = "SELECT ts, title, city, area FROM alerts WHERE ts >= ?"
+        params = [since.timestamp()]
+        if until is not None:
+            sql += " AND ts < ?"
+            params.append(until.timestamp())
+        if city is not None:
+            sql += " AND city = ?"
+            params.append(city)
+        sql += " ORDER BY ts DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        fromtimestamp = datetime.fromtimestamp
+        return [{'title': title, 'city': city_name, 'area': area, 'time': fromtimestamp(ts)} for ts, title, city_name, area in rows]
+
+    def record(self, alerts, categories=None):
+        """Queues history alert dicts (title, city, area, time) for insertion; `categories` is one int or a list."""
+        if not self._conn or not alerts:
+            return
+        if not isinstance(categories, list):
+            categories = [categories] * len(alerts)
+        rows = [(a['time'].timestamp(), a['title'], a['city'], a['area'], cat) for a, cat in zip(alerts, categories)]
+        self._writer.submit(self._path, lambda: self._execute_many(
+            "INSERT OR IGNORE INTO alerts (ts, title, city, area, category) VALUES (?, ?, ?, ?, ?)", rows
+        ), coalesce=False)
+
+    def mark_covered(self, when, force=False):
+        """Records that live polling was healthy up to `when` (written at most every COVERED_INTERVAL seconds unless forced)."""
+        if not self._conn:
+            return
+        now = time.monotonic()
+        if not force and self._last_covered_write is not None and now - self._last_covered_write < self.COVERED_INTERVAL:
+            return
+        self._last_covered_write = now
+        self._set_meta({"covered_until": str(when.timestamp())})
+
+    def _set_meta(self, values):
+        """Queues metadata behind the alert rows already queued (same writer key, in order), so covered_until is never ahead of them."""
+        if not self._conn:
+            return
+        self._meta.update(values)
+        rows = list(values.items())
+        self._writer.submit(self._path, lambda: self._execute_many(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", rows
+        ), coalesce=False)
+
+    def _execute_many(self, sql, rows):
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(sql, rows)
+
+    def flush(self, timeout=None) -> bool:
+        return self._writer.flush(timeout) if self._writer else True
+
+    def close(self, timeout=10) -> bool:
+        """Writes pending rows and closes the database."""
+        if not self._conn:
+            return True
+        flushed = self._writer.close(timeout)
+        with self._lock:
+            try:
+                self._conn.close()
+            except Exception as e:
+                self._log(f"Alert journal: Error closing database: {e}", level="WARNING")
+            self._conn = None
+        return flushed
+
+# ----------------------------------------------------------------------
+# Helper Class: BackgroundFileWriter
+# ----------------------------------------------------------------------
+class BackgroundFileWriter:
+    """
+    Runs file write jobs on a daemon thread so disk I/O never blocks the event loop.
+    Jobs are queued per path: a coalescing job replaces any jobs still pending for its
+    path (the latest full-file write wins), other jobs (appends) run in submission order.
+    """
+    def __init__(self, logger, name="red-alerts-file-writer", timings=None):
+        self._log = logger
+        self._timings = timings
+        self._cond = threading.Condition()
+        self._pending = OrderedDict() # path -> [job, ...]
+        self._busy = False
+        self._closed = False
+        self.jobs_written = 0
+        self.jobs_coalesced = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, path, job, coalesce=True):
+        """Queues a zero-argument callable that writes `path`. After close() jobs run inline."""
+        with self._cond:
+            if not self._closed:
+                jobs = self._pending.get(path)
+                if jobs is None:
+                    self._pending[path] = [job]
+                elif coalesce:
+                    self.jobs_coalesced += len(jobs)
+                    jobs[:] = [job]
+                else:
+                    jobs.append(job)
+                self._cond.notify()
+                return
+        self._run_job(path, job)
+
+    def _run_job(self, path, job):
+        started = time.perf_counter()
+        try:
+            job()
+            self.jobs_written += 1
+        except Exception as e:
+            self._log(f"Background writer: Unhandled error writing {path}: {e}", level="ERROR")
+        if self._timings:
+            self._timings.record("file_write", (time.perf_counter() - started) * 1000)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                path, jobs = self._pending.popitem(last=False)
+                self._busy = True
+            for job in jobs:
+                self._run_job(path, job)
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+    def flush(self, timeout=None) -> bool:
+        """Blocks until all queued jobs are written. Returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def close(self, timeout=10) -> bool:
+        """Flushes pending jobs and stops the thread. Returns False if the flush timed out."""
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        return flushed
+
+def json_size(value) -> int:
+    """UTF-8 byte length of `value` encoded the way attributes are sent to Home Assistant."""
+    return len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+
+def write_bytes_atomic(path, data: bytes):
+    """Writes bytes to a temp file next to `path`, then renames it over `path`."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def write_json_atomic(path, data, indent=2):
+    """Writes JSON to a temp file next to `path`, then renames it over `path`."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8-sig') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 # ----------------------------------------------------------------------
 # Helper Class: FileManager
 # ----------------------------------------------------------------------
 class FileManager:
-    def __init__(self, paths, save_enabled, day_names_map, timer_duration, logger):
+    def __init__(self, paths, save_enabled, day_names_map, timer_duration, logger, timings=None):
         self._paths = paths
         self._save_enabled = save_enabled
         self._day_names = day_names_map
         self._timer_duration = timer_duration
         self._log = logger
         self._last_saved_alert_id = None 
+        self._writer = BackgroundFileWriter(logger, timings=timings) if save_enabled else None
+
+    def _submit(self, path, job, coalesce=True):
+        """Hands a write job to the background writer (or runs it inline if there is none)."""
+        if self._writer:
+            self._writer.submit(path, job, coalesce=coalesce)
+        else:
+            job()
+
+    def flush(self, timeout=None) -> bool:
+        """Blocks until all queued file writes are on disk."""
+        return self._writer.flush(timeout) if self._writer else True
+
+    def close(self, timeout=10) -> bool:
+        """Flushes queued file writes and stops the background writer."""
+        return self._writer.close(timeout) if self._writer else True
 
     def get_from_json(self):
         """Loads the last alert state from the JSON backup file."""
@@ -899,6 +1968,9 @@ class FileManager:
         """Creates the CSV history file with a header row if it doesn't exist or is empty."""
         path = self._paths.get("csv")
         if not self._save_enabled or not path: return
+        self._submit(path, lambda: self._write_csv_header(path), coalesce=False)
+
+    def _write_csv_header(self, path):
         try:
             os.makedirs(os.path.dirname(path), exist_ok=True)
             if not os.path.exists(path) or os.path.getsize(path) == 0:
@@ -915,10 +1987,11 @@ class FileManager:
         """Saves the current alert state to the JSON backup file."""
         path = self._paths.get("json_backup")
         if not self._save_enabled or not path: return
+        self._submit(path, lambda: self._write_json_backup(data, path))
+
+    def _write_json_backup(self, data, path):
         try:
-            os.makedirs(os.path.dirname(path), exist_ok=True)
-            with open(path, "w", encoding='utf-8-sig') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            write_json_atomic(path, data)
         except PermissionError as e:
             self._log(f"Permission error writing JSON backup to {path}: {e}", level="ERROR")
         except TypeError as e: 
@@ -962,16 +2035,9 @@ class FileManager:
             full_cities_str = str(full_cities_list)
         # --------------------------------------------
 
-        try:
-            os.makedirs(os.path.dirname(txt_p), exist_ok=True)
-            with open(txt_p, 'a', encoding='utf-8-sig') as f:
-                f.write(date_str + "\n")
-                title = attrs.get('title', 'אין כותרת')
-                f.write(f"{title}\n{full_cities_str}\n")
-        except PermissionError as e:
-            self._log(f"Permission error writing TXT history to {txt_p}: {e}", level="ERROR")
-        except Exception as e:
-            self._log(f"Error writing TXT history to {txt_p}: {e}", level="ERROR")
+        title = attrs.get('title', 'אין כותרת')
+        txt_entry = f"{date_str}\n{title}\n{full_cities_str}\n"
+        self._submit(txt_p, lambda: self._append_text(txt_p, txt_entry, "TXT history"), coalesce=False)
 
         try:
             self.create_csv_header_if_needed() 
@@ -995,43 +2061,92 @@ class FileManager:
             line = output.getvalue().strip() 
             output.close()
 
-            os.makedirs(os.path.dirname(csv_p), exist_ok=True)
-            with open(csv_p, 'a', encoding='utf-8-sig', newline='') as f:
-                f.write(line + "\n")
-
+            self._submit(csv_p, lambda: self._append_text(csv_p, line + "\n", "CSV history", newline=''), coalesce=False)
             self._last_saved_alert_id = alert_id 
 
+        except Exception as e:
+            self._log(f"Error preparing CSV history row for {csv_p}: {e}", level="ERROR")
+
+    def _append_text(self, path, text, label, newline=None):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a', encoding='utf-8-sig', newline=newline) as f:
+                f.write(text)
         except PermissionError as e:
-            self._log(f"Permission error writing CSV history to {csv_p}: {e}", level="ERROR")
+            self._log(f"Permission error writing {label} to {path}: {e}", level="ERROR")
         except Exception as e:
-            self._log(f"Error writing CSV history to {csv_p}: {e}", level="ERROR")
+            self._log(f"Error writing {label} to {path}: {e}", level="ERROR")
 
     def clear_last_saved_id(self):
         """Resets the tracker for the last saved alert ID (called at window start)."""
         self._last_saved_alert_id = None
 
-    def save_geojson_file(self, geojson_data, path):
-        """Saves the provided GeoJSON data structure to the specified file path."""
+    def save_full_history(self, history_attrs):
+        """Saves the complete (untruncated) history attributes for the history sensors' `full_history_url`."""
+        path = self._paths.get("history_full")
+        if not self._save_enabled or not path: return
+        self._submit(path, lambda: self._write_full_history(history_attrs, path))
+
+    def _write_full_history(self, history_attrs, path):
+        try:
+            write_json_atomic(path, history_attrs, indent=None)
+        except PermissionError as e:
+            self._log(f"Permission error writing full history to {path}: {e}", level="ERROR")
+        except Exception as e:
+            self._log(f"Error writing full history to {path}: {e}", level="ERROR")
+
+    def writer_stats(self) -> dict:
+        """Background writer counters: jobs written and jobs dropped because a newer write replaced them."""
+        if not self._writer:
+            return {}
+        return {"jobs_written": self._writer.jobs_written, "jobs_coalesced": self._writer.jobs_coalesced}
+
+    def save_metrics_file(self, text):
+        """Saves the Prometheus text-format metrics (`metrics` path)."""
+        path = self._paths.get("metrics")
+        if not self._save_enabled or not path: return
+        self._submit(path, lambda: self._write_metrics_file(text, path))
+
+    def _write_metrics_file(self, text, path):
+        try:
+            write_bytes_atomic(path, text.encode('utf-8'))
+        except PermissionError as e:
+            self._log(f"Permission error writing metrics to {path}: {e}", level="ERROR")
+        except Exception as e:
+            self._log(f"Error writing metrics to {path}: {e}", level="ERROR")
+
+    def save_geojson_file(self, geojson_data, path, gzip_copy=False):
+        """
+        Queues a GeoJSON FeatureCollection (a dict, or already serialized text) for writing, compact, to the
+        specified file path, plus a gzip-compressed `path`.gz copy if `gzip_copy` is set.
+        A dict is serialized on the writer thread, so it must not be mutated afterwards.
+        """
         if not self._save_enabled: return
         if not path:
             self._log("Skipping GeoJSON save: Path is missing.", level="WARNING")
             return
-        if not isinstance(geojson_data, dict) or "features" not in geojson_data:
+        if not isinstance(geojson_data, str) and (not isinstance(geojson_data, dict) or "features" not in geojson_data):
             self._log(f"Skipping GeoJSON save to {path}: Invalid data structure.", level="WARNING")
             return
 
-        num_features = len(geojson_data.get('features', []))
-        try:
-            os.makedirs(os.path.dirname(path), exist_ok=True)
-            with open(path, 'w', encoding='utf-8-sig') as f:
-                json.dump(geojson_data, f, ensure_ascii=False, indent=2)
-
-            log_level = "DEBUG"
-            if "latest" in path and num_features > 0: log_level = "INFO" 
-            elif "24h" in path and num_features > 0: log_level = "DEBUG" 
-            elif "latest" in path and num_features == 0: log_level = "DEBUG" 
+        self._submit(path, lambda: self._write_geojson_file(geojson_data, path, gzip_copy))
 
-            if num_features > 0 or "24h" in path :
+    def _write_geojson_file(self, geojson_data, path, gzip_copy=False):
+        try:
+            if isinstance(geojson_data, str):
+                text, num_features = geojson_data, None
+            else:
+                text = json.dumps(geojson_data, ensure_ascii=False, separators=(',', ':'))
+                num_features = len(geojson_data.get('features', []))
+            payload = text.encode('utf-8-sig')
+            write_bytes_atomic(path, payload)
+            if gzip_copy:
+                write_bytes_atomic(f"{path}.gz", gzip.compress(payload, compresslevel=6, mtime=0))
+
+            if num_features is None:
+                self._log(f"Successfully wrote GeoJSON ({len(payload)} bytes) to: {path}", level="DEBUG")
+            elif num_features > 0 or "24h" in path:
+                log_level = "INFO" if "latest" in path and num_features > 0 else "DEBUG"
                 self._log(f"Successfully wrote GeoJSON ({num_features} features) to: {path}", level=log_level)
 
         except PermissionError as e:
@@ -1042,6 +2157,288 @@ class FileManager:
             self._log(f"Error writing GeoJSON to {path}: {e}", level="ERROR")
 
 
+# ----------------------------------------------------------------------
+# Helper Class: MqttPublisher
+# ----------------------------------------------------------------------
+class MqttPublisher:
+    """
+    Publishes alert payloads to MQTT from a background task, so a slow broker never delays polling.
+    Payloads go through a bounded queue (the oldest is dropped when full), are sent in batches,
+    and are de-duplicated per alert id (same id with the same cities is published once).
+    """
+    def __init__(self, publish_func, topic, logger, max_queue=100, batch_size=20, publish_timeout=5, dedupe_ids=256):
+        self._publish = publish_func  # async callable(topic, payload_str)
+        self.topic = topic
+        self._log = logger
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._batch_size = batch_size
+        self._publish_timeout = publish_timeout
+        self._dedupe_ids = dedupe_ids
+        self._published_cities = OrderedDict() # alert id -> frozenset of cities already published
+        self._task = None
+        self.published = 0
+        self.dropped = 0
+        self.deduplicated = 0
+        self.errors = 0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def enqueue(self, alert_id, category, title, cities, desc, alert_date) -> bool:
+        """Queues one alert payload without waiting. Returns False if it was a duplicate."""
+        city_set = frozenset(cities)
+        if self._published_cities.get(alert_id) == city_set:
+            self.deduplicated += 1
+            return False
+        self._published_cities[alert_id] = city_set
+        self._published_cities.move_to_end(alert_id)
+        while len(self._published_cities) > self._dedupe_ids:
+            self._published_cities.popitem(last=False)
+
+        payload = json.dumps({
+            "id": alert_id, "category": category, "title": title,
+            "data": list(cities), "desc": desc, "alertDate": alert_date
+        }, ensure_ascii=False, separators=(",", ":"))
+
+        if self._queue.full():
+            self._queue.get_nowait()
+            self._queue.task_done()
+            self.dropped += 1
+            self._log("MQTT: Queue full, dropped oldest pending payload.", level="WARNING")
+        self._queue.put_nowait(payload)
+        return True
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self._batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            results = await asyncio.gather(
+                *(asyncio.wait_for(self._publish(self.topic, payload), self._publish_timeout) for payload in batch),
+                return_exceptions=True
+            )
+            for res in results:
+                if isinstance(res, Exception):
+                    self.errors += 1
+                    self._log(f"MQTT: Error publishing to '{self.topic}': {res.__class__.__name__} {res}", level="WARNING")
+                else:
+                    self.published += 1
+            for _ in batch:
+                self._queue.task_done()
+
+    async def stop(self, timeout=5):
+        """Waits up to `timeout` seconds for queued payloads to be published, then stops the worker."""
+        if self._task is None: return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            self._log(f"MQTT: {self._queue.qsize()} payloads not published before shutdown.", level="WARNING")
+        self._task.cancel()
+        self._task = None
+
+# ----------------------------------------------------------------------
+# Helper Class: AlertEventEmitter
+# ----------------------------------------------------------------------
+class AlertEventEmitter:
+    """
+    Fires the '[sensor_name]_event' Home Assistant event with only the cities new to the window.
+    The first payload fires immediately; payloads of the same title arriving within `debounce_seconds`
+    of the last event are merged and fired together once the debounce interval has passed.
+    """
+    def __init__(self, fire_func, event_name, logger, debounce_seconds=2.0, clock=time.monotonic):
+        self._fire_func = fire_func  # async callable(event_name, **data)
+        self.event_name = event_name
+        self._log = logger
+        self._debounce = debounce_seconds
+        self._clock = clock
+        self._last_fire = float('-inf')
+        self._pending = None
+        self._pending_areas = set()
+        self._timer = None
+        self.fired = 0
+        self.merged = 0
+
+    def emit(self, payload: dict, areas: set):
+        """payload holds the documented event keys except 'areas', which is built from `areas`."""
+        if not payload.get("cities"):
+            return
+        if self._pending and self._pending["title"] != payload["title"]:
+            self.flush()
+
+        if self._pending:
+            seen = set(self._pending["cities"])
+            self._pending["cities"].extend(c for c in payload["cities"] if c not in seen)
+            self._pending.update({k: payload[k] for k in ("id", "category", "description", "timestamp", "alerts_count")})
+            self._pending_areas.update(areas)
+            self.merged += 1
+            return
+
+        wait = self._last_fire + self._debounce - self._clock()
+        self._pending = {**payload, "cities": list(payload["cities"])}
+        self._pending_areas = set(areas)
+        if wait <= 0:
+            self.flush()
+        else:
+            self._timer = asyncio.get_running_loop().call_later(wait, self.flush)
+
+    def flush(self):
+        """Fires the pending (merged) event now, if there is one."""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        data = {**self._pending, "areas": ", ".join(sorted(self._pending_areas))}
+        self._pending = None
+        self._pending_areas = set()
+        self._last_fire = self._clock()
+        self.fired += 1
+        asyncio.ensure_future(self._send(data))
+
+    async def _send(self, data):
+        try:
+            await self._fire_func(self.event_name, **data)
+        except Exception as e:
+            self._log(f"Error firing event '{self.event_name}': {e}", level="WARNING")
+
+# ----------------------------------------------------------------------
+# Helper Class: PollScheduler
+# ----------------------------------------------------------------------
+class PollScheduler:
+    """
+    Fixed-rate poll ticks on the monotonic clock. Each deadline is the previous deadline plus the
+    current period, so fetch latency does not accumulate. The period is `fast_interval` while an
+    alert is active or was seen within `fast_window` seconds, `idle_interval` otherwise, and backs
+    off exponentially (up to `max_backoff`) on consecutive API errors.
+    """
+    def __init__(self, interval, fast_interval, idle_interval, fast_window, max_backoff=30, clock=time.monotonic):
+        self.interval = interval
+        self.fast_interval = fast_interval
+        self.idle_interval = idle_interval
+        self.fast_window = fast_window
+        self.max_backoff = max(max_backoff, idle_interval)
+        self._clock = clock
+        self._deadline = None
+        self._last_active = None
+        self._jitter_ms = deque(maxlen=200)
+        self.period = idle_interval
+        self.ticks = 0
+        self.missed = 0
+        self.max_jitter_ms = 0.0
+
+    def start(self, delay):
+        """Sets the first deadline `delay` seconds from now and returns the delay."""
+        self._deadline = self._clock() + delay
+        return delay
+
+    def tick_started(self):
+        """Records how late this tick started relative to its deadline."""
+        if self._deadline is None:
+            return
+        jitter_ms = max(0.0, (self._clock() - self._deadline) * 1000)
+        self._jitter_ms.append(jitter_ms)
+        self.max_jitter_ms = max(self.max_jitter_ms, jitter_ms)
+        self.ticks += 1
+
+    def next_delay(self, active, consecutive_errors=0):
+        """Advances to the next deadline and returns the seconds until it (0 if already overdue)."""
+        now = self._clock()
+        if active:
+            self._last_active = now
+        if self._last_active is not None and now - self._last_active <= self.fast_window:
+            period = self.fast_interval
+        else:
+            period = self.idle_interval
+        if consecutive_errors:
+            period = max(period, min(self.interval * 2 ** min(consecutive_errors, 8), self.max_backoff))
+        self.period = period
+
+        deadline = (self._deadline if self._deadline is not None else now) + period
+        if deadline <= now:
+            # The poll overran its slot: run now and re-anchor rather than firing a burst of catch-up ticks.
+            self.missed += 1
+            deadline = now
+        self._deadline = deadline
+        return deadline - now
+
+    def stats(self) -> dict:
+        jitter = sorted(self._jitter_ms)
+        def pct(q):
+            return round(jitter[min(len(jitter) - 1, int(q * len(jitter)))], 1) if jitter else 0.0
+        return {
+            "period": self.period, "ticks": self.ticks, "missed_deadlines": self.missed,
+            "jitter_ms": {"p50": pct(0.5), "p95": pct(0.95), "max": round(self.max_jitter_ms, 1)}
+        }
+
+# ----------------------------------------------------------------------
+# Helper Class: StageTimings
+# ----------------------------------------------------------------------
+class StageTimings:
+    """
+    Rolling wall-time samples (ms) for the named stages of the poll hot path, summarized as
+    p50/p95/max over the last `window` samples plus lifetime count and total. record() may be
+    called from the background file writer thread.
+    """
+    def __init__(self, window=256):
+        self._window = window
+        self._samples = {}
+        self._count = defaultdict(int)
+        self._total_ms = defaultdict(float)
+
+    def record(self, stage, ms):
+        samples = self._samples.get(stage)
+        if samples is None:
+            samples = self._samples.setdefault(stage, deque(maxlen=self._window))
+        samples.append(ms)
+        self._count[stage] += 1
+        self._total_ms[stage] += ms
+
+    @contextlib.contextmanager
+    def measure(self, stage):
+        """Context manager recording the wall time of its body under `stage`."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - started) * 1000)
+
+    def summary(self) -> dict:
+        result = {}
+        for stage, samples in list(self._samples.items()):
+            ordered = sorted(samples)
+            if not ordered:
+                continue
+            def pct(q):
+                return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+            result[stage] = {
+                "p50": pct(0.5), "p95": pct(0.95), "max": round(ordered[-1], 2),
+                "count": self._count[stage], "total": round(self._total_ms[stage], 2)
+            }
+        return result
+
+    @staticmethod
+    def to_prometheus(prefix, summary, counters) -> str:
+        """Renders a summary() and a {name: number} dict of counters in the Prometheus text format."""
+        prefix = re.sub(r'[^a-zA-Z0-9_]', '_', prefix)
+        lines = [
+            f"# HELP {prefix}_stage_ms Wall time per poll pipeline stage (rolling window quantiles).",
+            f"# TYPE {prefix}_stage_ms summary"
+        ]
+        for stage, stats in sorted(summary.items()):
+            lines.append(f'{prefix}_stage_ms{{stage="{stage}",quantile="0.5"}} {stats["p50"]}')
+            lines.append(f'{prefix}_stage_ms{{stage="{stage}",quantile="0.95"}} {stats["p95"]}')
+            lines.append(f'{prefix}_stage_ms_sum{{stage="{stage}"}} {stats["total"]}')
+            lines.append(f'{prefix}_stage_ms_count{{stage="{stage}"}} {stats["count"]}')
+        lines.append(f"# TYPE {prefix}_stage_max_ms gauge")
+        for stage, stats in sorted(summary.items()):
+            lines.append(f'{prefix}_stage_max_ms{{stage="{stage}"}} {stats["max"]}')
+        for name, value in counters.items():
+            metric = f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
 # ----------------------------------------------------------------------
 # Main AppDaemon Class: Red_Alerts_Israel 
 # ----------------------------------------------------------------------
@@ -1052,6 +2449,7 @@ class Red_Alerts_Israel(Hass):
         self.log("--------------------------------------------------")
         self.log("        Initializing Red Alerts Israel App")
         self.log("--------------------------------------------------")
+        init_started = time.monotonic()
         
         global _IS_RAI_RUNNING
         if _IS_RAI_RUNNING:
@@ -1062,6 +2460,15 @@ class Red_Alerts_Israel(Hass):
 
         # --- Configuration Loading & Validation ---
         self.interval = self.args.get("interval", 5)
+        self.fast_interval = self.args.get("fast_interval", 2)
+        self.idle_interval = self.args.get("idle_interval")
+        self.fast_window = self.args.get("fast_window", 600)
+        self.history_max_bytes = self.args.get("history_max_bytes", 0)
+        self.diagnostics_interval = self.args.get("diagnostics_interval", 60)
+        self.diagnostics_prometheus = self.args.get("diagnostics_prometheus", False)
+        self.geojson_gzip = self.args.get("geojson_gzip", False)
+        self.journal_days = self.args.get("journal_days", 0)
+        self.journal_path = self.args.get("journal_path")
         self.timer_duration = self.args.get("timer", 120)
         self.current_timer_duration = self.timer_duration
         self.save_2_file = self.args.get("save_2_file", True)
@@ -1080,6 +2487,30 @@ class Red_Alerts_Israel(Hass):
         if not isinstance(self.timer_duration, (int, float)) or self.timer_duration <= 0:
             self.log(f"Invalid 'timer' ({self.timer_duration}), must be > 0. Using default 120s.", level="WARNING")
             self.timer_duration = 120
+        if not isinstance(self.fast_interval, (int, float)) or self.fast_interval < 1:
+            self.log(f"Invalid 'fast_interval' ({self.fast_interval}), must be >= 1. Using default 2s.", level="WARNING")
+            self.fast_interval = 2
+        self.fast_interval = min(self.fast_interval, self.interval)
+        if self.idle_interval is None:
+            self.idle_interval = self.interval
+        elif not isinstance(self.idle_interval, (int, float)) or self.idle_interval < self.interval:
+            self.log(f"Invalid 'idle_interval' ({self.idle_interval}), must be >= interval. Using interval ({self.interval}s).", level="WARNING")
+            self.idle_interval = self.interval
+        if not isinstance(self.fast_window, (int, float)) or self.fast_window < 0:
+            self.log(f"Invalid 'fast_window' ({self.fast_window}), must be >= 0. Using default 600s.", level="WARNING")
+            self.fast_window = 600
+        if not isinstance(self.history_max_bytes, int) or self.history_max_bytes < 0:
+            self.log(f"Invalid 'history_max_bytes' ({self.history_max_bytes}), must be an integer >= 0. Using 0 (no limit).", level="WARNING")
+            self.history_max_bytes = 0
+        elif 0 < self.history_max_bytes < 1024:
+            self.log(f"'history_max_bytes' ({self.history_max_bytes}) is too small. Using 1024.", level="WARNING")
+            self.history_max_bytes = 1024
+        if not isinstance(self.diagnostics_interval, (int, float)) or self.diagnostics_interval < 0:
+            self.log(f"Invalid 'diagnostics_interval' ({self.diagnostics_interval}), must be >= 0. Using default 60s.", level="WARNING")
+            self.diagnostics_interval = 60
+        if not isinstance(self.journal_days, (int, float)) or self.journal_days < 0:
+            self.log(f"Invalid 'journal_days' ({self.journal_days}), must be >= 0. Journal disabled.", level="WARNING")
+            self.journal_days = 0
         if not isinstance(self.hours_to_show, (int, float)) or self.hours_to_show <= 0:
             self.log(f"Invalid 'hours_to_show' ({self.hours_to_show}), must be > 0. Using default 4h.", level="WARNING")
             self.hours_to_show = 4
@@ -1090,7 +2521,12 @@ class Red_Alerts_Israel(Hass):
             self.log(f"Invalid 'city_names' format (should be a list), got {type(self.city_names_config)}. Ignoring.", level="WARNING")
             self.city_names_config = []
 
-        self.log(f"Config: Interval={self.interval}s, Timer={self.timer_duration}s, SaveFiles={self.save_2_file}, HistoryHours={self.hours_to_show}, MQTT={self.mqtt_topic}, Event={self.ha_event}")
+        if self.mqtt_topic is True:
+            self.mqtt_topic = f"home/{self.sensor_name}/event"
+        elif not isinstance(self.mqtt_topic, str) or not self.mqtt_topic.strip():
+            self.mqtt_topic = False
+
+        self.log(f"Config: Interval={self.interval}s (fast {self.fast_interval}s, idle {self.idle_interval}s), Timer={self.timer_duration}s, SaveFiles={self.save_2_file}, HistoryHours={self.hours_to_show}, JournalDays={self.journal_days}, MQTT={self.mqtt_topic}, Event={self.ha_event}")
 
 
         # --- Entity ID Setup ---
@@ -1106,6 +2542,7 @@ class Red_Alerts_Israel(Hass):
         self.history_cities_sensor = f"sensor.{base}_history_cities"
         self.history_list_sensor = f"sensor.{base}_history_list"
         self.history_group_sensor = f"sensor.{base}_history_group"
+        self.diagnostics_sensor = f"sensor.{base}_diagnostics"
 
         # --- File Path Setup ---
         www_base = self._get_www_path()
@@ -1116,6 +2553,8 @@ class Red_Alerts_Israel(Hass):
                 "json_backup":     os.path.join(www_base, f"{base}_history.json"),
                 "geojson_latest":  os.path.join(www_base, f"{base}_latest.geojson"),
                 "geojson_history": os.path.join(www_base, f"{base}_24h.geojson"),
+                "history_full":    os.path.join(www_base, f"{base}_24h_history.json"),
+                "metrics":         os.path.join(www_base, f"{base}_metrics.prom"),
                 "lamas_local":     os.path.join(script_directory, "lamas_data.json")
             }
             self._verify_www_writeable(www_base) 
@@ -1144,22 +2583,27 @@ class Red_Alerts_Israel(Hass):
             "history":      f"https://www.oref.org.il/WarningMessages/alert/History/AlertsHistory.json", 
             "lamas_github": "https://raw.githubusercontent.com/idodov/RedAlert/main/apps/red_alerts_israel/lamas_data.json"
         }
-        self.api_client = OrefAPIClient(self.session, api_urls, self.log)
+        self.timings = StageTimings()
+        self.api_client = OrefAPIClient(self.session, api_urls, self.log, self.timings)
 
         # --- State Variables ---
         self.alert_sequence_count = 0
         self.no_active_alerts_polls = 0
         self.last_alert_time = None
         self.last_processed_alert_id = None 
-        self.window_alerts_grouped = defaultdict(lambda: defaultdict(set)) 
         self.prev_alert_final_attributes = None 
-        self.cities_past_window_std = set() 
         self.test_alert_cycle_flag = 0 
         self.test_alert_start_time = 0
         self._poll_running = False
         self._terminate_event = asyncio.Event()
+        self.poll_scheduler = PollScheduler(self.interval, self.fast_interval, self.idle_interval, self.fast_window)
+        self.ha_writes_sent = 0
+        self._render_alert_map = functools.lru_cache(maxsize=64)(self._render_alert_map_uncached) # Per instance, so a reload frees it
+        self._last_diagnostics_publish = None
         self.last_active_payload_details = None
         self.last_history_attributes_cache = None 
+        self._history_sensors_generation = None # HistoryManager.generation last pushed to the history sensors
+        self._history_geojson_generation = None # HistoryManager.generation last written to the 24h GeoJSON
         self.map_segments_history = []
         self.last_map_update = 0      
 
@@ -1169,17 +2613,38 @@ class Red_Alerts_Israel(Hass):
                                 api_urls["lamas_github"], self.api_client, self.log
                             )
         self.alert_processor  = AlertProcessor(self.lamas_manager, ICONS_AND_EMOJIS, self.log)
-        self.history_manager  = HistoryManager(self.hours_to_show, self.lamas_manager, self.log, self.timer_duration)
-        self.file_manager     = FileManager(self.file_paths, self.save_2_file, DAY_NAMES, self.timer_duration, self.log)
-
-        # --- Initial State Setup ---
-        try:
-            await self.set_state(self.main_sensor, state="off", attributes={'script_status': 'initializing', 'timestamp': datetime.now().isoformat()})
-        except Exception as e:
-            self.log(f"Error setting initial sensor state during init: {e}", level="WARNING")
+        self.journal          = None
+        if self.journal_days:
+            journal_path = self.journal_path or os.path.join(script_directory, f"{base}_journal.db")
+            self.journal = AlertJournal(journal_path, self.journal_days, self.log)
+        self.history_manager  = HistoryManager(self.hours_to_show, self.lamas_manager, self.log, self.timer_duration) # Journal attached once open
+        self.file_manager     = FileManager(self.file_paths, self.save_2_file, DAY_NAMES, self.timer_duration, self.log, self.timings)
+        self.event_emitter    = AlertEventEmitter(self.fire_event, f"{self.sensor_name}_event", self.log) if self.ha_event else None
+        self.mqtt_publisher   = None
+        if self.mqtt_topic:
+            self.mqtt_publisher = MqttPublisher(self._mqtt_publish, self.mqtt_topic, self.log)
+            self.mqtt_publisher.start()
+
+        # --- Startup Pipeline ---
+        # The history download does not need Lamas data, so it runs while the Lamas data loads and
+        # the HA entities are created; it is processed (which does need Lamas) once both are done.
+        self._init_started = init_started
+        self.startup_stats = {}
+        history_fetch = asyncio.create_task(self._timed(self._fetch_initial_history(), "history_fetch_ms"))
+
+        initial_state = self.set_state(self.main_sensor, state="off", attributes={'script_status': 'initializing', 'timestamp': datetime.now().isoformat()})
+        state_result, lamas_ok = await asyncio.gather(
+            initial_state, self._timed(self.lamas_manager.load_data(), "lamas_load_ms"), return_exceptions=True
+        )
+        if isinstance(state_result, Exception):
+            self.log(f"Error setting initial sensor state during init: {state_result}", level="WARNING")
+        if isinstance(lamas_ok, Exception):
+            self.log(f"Error loading Lamas data: {lamas_ok}", level="ERROR")
+            lamas_ok = False
 
         # --- Critical Dependency: Load Lamas Data ---
-        if not await self.lamas_manager.load_data():
+        if not lamas_ok:
+            history_fetch.cancel()
             self.log("FATAL: Lamas data load failed. Cannot map cities to areas. Aborting initialization.", level="CRITICAL")
             error_attrs = {'error': 'Lamas data failed to load', 'status': 'error', 'timestamp': datetime.now().isoformat()}
             try: await self.set_state(self.main_sensor, state="unavailable", attributes=error_attrs)
@@ -1188,12 +2653,32 @@ class Red_Alerts_Israel(Hass):
             await self.terminate() 
             return 
         
-        self._lamas_data = self.lamas_manager._lamas_data
         # --- Validate Configured City Names ---
         self._validate_configured_cities()
+        self.alert_window = AlertWindow(self.lamas_manager, self.city_ids_self, self.log)
 
         # --- Initialize HA Entities and Load Initial Data ---
-        await self._initialize_ha_sensors()
+        entities_result, history_data = await asyncio.gather(
+            self._timed(self._initialize_ha_sensors(), "entities_ms"), history_fetch, return_exceptions=True
+        )
+        if isinstance(entities_result, Exception):
+            self.log(f"Error initializing HA entities: {entities_result}", level="ERROR")
+        if isinstance(history_data, Exception):
+            self.log(f"Error fetching initial history: {history_data}", level="WARNING")
+            history_data = None
+        history_data, journal_alerts = history_data or (None, None)
+        self.history_manager.load_history_data(history_data, journal_alerts)
+        if journal_alerts is not None and self.api_client.history_validators:
+            # Saved after the new alerts were queued, so a 304 on the next start cannot skip them
+            self.journal.set_history_validators(**self.api_client.history_validators)
+
+        last_segment = self.history_manager.get_last_alert_segment()
+        if last_segment:
+            self.map_segments_history = [{
+                "type": "active",
+                "cities": last_segment[0]["cities"],
+                "timestamp": time.time()
+            }]
         await self._load_initial_data() 
 
         # --- Register Test Boolean Listener ---
@@ -1204,10 +2689,6 @@ class Red_Alerts_Israel(Hass):
             self.log(f"Error setting up listener for {self.activate_alert}: {e}", level="ERROR")
 
 
-        # --- Start Polling Loop ---
-        self.log("Scheduling first API poll.")
-        self.run_in(self._poll_alerts_callback_sync, 5) 
-
         # Update sensor status to running 
         running_attrs = {'script_status': 'running', 'timestamp': datetime.now().isoformat()}
         try:
@@ -1224,30 +2705,45 @@ class Red_Alerts_Israel(Hass):
         except Exception as e:
             self.log(f"Error setting running status attribute: {e}", level="WARNING")
 
-        self.map_url = self.generate_smart_alert_map([], self._lamas_data)
+        # --- Start Polling Loop ---
+        # Scheduled last: everything the first poll depends on is ready, so it need not wait.
+        self.log("Scheduling first API poll.")
+        self.run_in(self._poll_alerts_callback_sync, self.poll_scheduler.start(0))
 
-        await self.history_manager.load_initial_history(self.api_client)
-                
-        last_segment = self.history_manager.get_last_alert_segment()
-        if last_segment:
-            if not hasattr(self, 'map_segments_history'):
-                self.map_segments_history = []
-            
-            self.map_segments_history = [{
-                "type": "active",
-                "cities": last_segment[0]["cities"],
-                "timestamp": time.time()
-            }]
-            
-            self.map_url = self.generate_smart_alert_map(self.map_segments_history, self.lamas_manager._lamas_data)
-        else:
-            self.map_url = "https://static-maps.yandex.ru/1.x/?l=map&lang=he_IL&size=600,450&ll=34.8516,31.0461&z=7"
-        await self._load_initial_data()
         self.log("--------------------------------------------------")
         self.log("  Initialization Complete. Monitoring Red Alerts.")
         self.log("--------------------------------------------------")
 
 
+    async def _fetch_initial_history(self):
+        """
+        Opens the alert journal and reads its history window, then downloads AlertsHistory.json
+        (conditionally, when the journal has its validators, and only as far back as the history needs).
+        Returns (history payload, journal alerts or None).
+        """
+        journal_alerts, validators = None, {}
+        if self.journal:
+            if await asyncio.to_thread(self.journal.open):
+                self.history_manager.attach_journal(self.journal)
+                started = time.monotonic()
+                journal_alerts = await asyncio.to_thread(self.history_manager.read_journal)
+                self.startup_stats["journal_read_ms"] = round((time.monotonic() - started) * 1000, 1)
+                validators = self.journal.history_validators()
+            else:
+                self.journal = None
+        stop_before = self.history_manager.feed_horizon(with_journal=journal_alerts is not None)
+        history_data = await self.api_client.get_alert_history(stop_before=stop_before, **validators)
+        self.startup_stats.update(self.api_client.history_stats)
+        return history_data, journal_alerts
+
+    async def _timed(self, coro, stat_key):
+        """Awaits `coro`, recording its wall time in self.startup_stats[stat_key] (ms)."""
+        started = time.monotonic()
+        try:
+            return await coro
+        finally:
+            self.startup_stats[stat_key] = round((time.monotonic() - started) * 1000, 1)
+
     def _get_www_path(self):
         """Tries to determine the Home Assistant www path."""
         ha_config_dir_options = ["/homeassistant", "/config", "/usr/share/hassio/homeassistant", "/root/config"]
@@ -1292,6 +2788,7 @@ class Red_Alerts_Israel(Hass):
     def _validate_configured_cities(self):
         """Validates cities from config against loaded Lamas data."""
         self.city_names_self_std = set()
+        self.city_ids_self = frozenset() # The same cities as LamasDataManager ids, for every "my cities" check
         if not self.city_names_config: 
             self.log("No 'city_names' provided in configuration.", level="INFO")
             return
@@ -1318,6 +2815,8 @@ class Red_Alerts_Israel(Hass):
                 self.log(f"Config WARNING: City '{city_config_raw}' (standardized: '{city_config_std}') not found in Lamas data. The '{self.city_sensor}' may not trigger correctly for this entry.", level="WARNING")
                 found_all = False
 
+        self.city_ids_self = self.lamas_manager.intern_all(self.city_names_self_std)
+
         valid_count = processed_count - invalid_entries
         if valid_count == 0 and processed_count > 0:
             self.log("No valid city_names found after processing configuration entries.", level="WARNING")
@@ -1334,14 +2833,26 @@ class Red_Alerts_Israel(Hass):
         self.create_task(self._poll_and_schedule_next())
 
     async def _poll_and_schedule_next(self):
-        """Runs the poll logic and schedules the next poll, ensuring no overlap."""
-        start_time = time.monotonic()
+        """Runs the poll logic and schedules the next poll on the fixed-rate tick, ensuring no overlap."""
+        self.poll_scheduler.tick_started()
+        if "time_to_first_poll_ms" not in self.startup_stats:
+            self.startup_stats["time_to_first_poll_ms"] = round((time.monotonic() - self._init_started) * 1000, 1)
+            self.log(f"Startup: first poll {self.startup_stats['time_to_first_poll_ms']} ms after initialize ({self.startup_stats}).", level="INFO")
         try:
             if self._terminate_event.is_set():
                 self.log("Termination signal received, skipping poll.", level="INFO")
                 return 
 
-            await self.poll_alerts()
+            with self.timings.measure("poll"):
+                await self.poll_alerts()
+            if self.journal and self.api_client.live_ok:
+                self.journal.mark_covered(datetime.now())
+            if self.diagnostics_interval and (
+                self._last_diagnostics_publish is None
+                or time.monotonic() - self._last_diagnostics_publish >= self.diagnostics_interval
+            ):
+                self._last_diagnostics_publish = time.monotonic()
+                await self._publish_diagnostics()
 
         except Exception as e:
             self.log(f"CRITICAL ERROR during poll_alerts execution: {e.__class__.__name__} - {e}", level="CRITICAL")
@@ -1353,7 +2864,9 @@ class Red_Alerts_Israel(Hass):
             self._poll_running = False 
             
             if not self._terminate_event.is_set():
-                self.run_in(self._poll_alerts_callback_sync, self.interval)
+                active = self.last_alert_time is not None or self.test_alert_cycle_flag > 0
+                delay = self.poll_scheduler.next_delay(active, self.api_client.consecutive_errors)
+                self.run_in(self._poll_alerts_callback_sync, delay)
             else:
                 self.log("Termination signal received after poll, not scheduling next.", level="INFO")
 
@@ -1409,6 +2922,29 @@ class Red_Alerts_Israel(Hass):
             except Exception as e:
                 self.log(f"Error closing HTTP session: {e}", level="WARNING")
 
+        event_emitter = getattr(self, "event_emitter", None)
+        if event_emitter:
+            event_emitter.flush()
+
+        mqtt_publisher = getattr(self, "mqtt_publisher", None)
+        if mqtt_publisher:
+            await mqtt_publisher.stop()
+
+        journal = getattr(self, "journal", None)
+        if journal:
+            try:
+                await asyncio.to_thread(journal.close)
+            except Exception as e:
+                self.log(f"Error closing the alert journal: {e}", level="WARNING")
+
+        file_manager = getattr(self, "file_manager", None)
+        if file_manager:
+            try:
+                if not await asyncio.to_thread(file_manager.close):
+                    self.log("Timed out flushing pending file writes.", level="WARNING")
+            except Exception as e:
+                self.log(f"Error flushing pending file writes: {e}", level="WARNING")
+
         self.log("Red Alerts Israel App shutdown complete.")
         self.log("--------------------------------------------------")
 
@@ -1468,7 +3004,7 @@ class Red_Alerts_Israel(Hass):
             "prev_last_changed": now_iso, "prev_alerts_count": 0,
             "alert_wa": "", "alert_tg": "", 
             "script_status": "initializing",
-            "map_url": self.generate_smart_alert_map([], self._lamas_data)
+            "map_url": self.generate_smart_alert_map([])
         }
         history_default_attrs = {
             "cities_past_24h": [],
@@ -1477,26 +3013,28 @@ class Red_Alerts_Israel(Hass):
             "script_status": "initializing" 
         }
 
+        # Sensors of the same kind share one attribute dict; none of them is modified after this point.
         sensors_to_init = [
             (self.main_sensor, "off", idle_attrs),
-            (self.city_sensor, "off", idle_attrs.copy()),
-            (self.main_sensor_pre_alert, "off", idle_attrs.copy()),
-            (self.city_sensor_pre_alert, "off", idle_attrs.copy()),
-            (self.main_sensor_active_alert, "off", idle_attrs.copy()),
-            (self.city_sensor_active_alert, "off", idle_attrs.copy()),
-            (self.history_cities_sensor, "0", history_default_attrs.copy()),
-            (self.history_list_sensor, "0", history_default_attrs.copy()),
-            (self.history_group_sensor, "0", history_default_attrs.copy())
+            (self.city_sensor, "off", idle_attrs),
+            (self.main_sensor_pre_alert, "off", idle_attrs),
+            (self.city_sensor_pre_alert, "off", idle_attrs),
+            (self.main_sensor_active_alert, "off", idle_attrs),
+            (self.city_sensor_active_alert, "off", idle_attrs),
+            (self.history_cities_sensor, "0", history_default_attrs),
+            (self.history_list_sensor, "0", history_default_attrs),
+            (self.history_group_sensor, "0", history_default_attrs)
         ]
 
+        exists_results = await asyncio.gather(
+            *(self.entity_exists(entity_id) for entity_id, _, _ in sensors_to_init), return_exceptions=True
+        )
         init_tasks = []
-        for entity_id, state, attrs in sensors_to_init:
+        for (entity_id, state, attrs), entity_exists in zip(sensors_to_init, exists_results):
             try:
-                entity_exists = False
-                try:
-                    entity_exists = await self.entity_exists(entity_id)
-                except Exception as check_err:
-                    self.log(f"Error checking existence for {entity_id}: {check_err}", level="WARNING")
+                if isinstance(entity_exists, Exception):
+                    self.log(f"Error checking existence for {entity_id}: {entity_exists}", level="WARNING")
+                    entity_exists = False
 
                 if not entity_exists:
                     self.log(f"Entity {entity_id} not found. Creating with initial state.", level="INFO")
@@ -1513,7 +3051,9 @@ class Red_Alerts_Israel(Hass):
                     self.log(f"Error initializing entity task {i}: {res}", level="ERROR")
 
         try:
-            text_entity_exists = await self.entity_exists(self.main_text)
+            text_entity_exists, bool_entity_exists = await asyncio.gather(
+                self.entity_exists(self.main_text), self.entity_exists(self.activate_alert)
+            )
             text_attrs = {
                 "min": 0, "max": 255, "mode": "text",
                 "friendly_name": f"{self.sensor_name} Summary",
@@ -1523,7 +3063,6 @@ class Red_Alerts_Israel(Hass):
                 self.log(f"Entity {self.main_text} not found. Creating with initial text 'טוען...'.", level="INFO")
                 await self.set_state(self.main_text, state="טוען...", attributes=text_attrs)
 
-            bool_entity_exists = await self.entity_exists(self.activate_alert)
             bool_attrs = {"friendly_name": f"{self.sensor_name} Test Trigger"}
             if not bool_entity_exists:
                 self.log(f"Entity {self.activate_alert} not found. Creating.", level="INFO")
@@ -1535,15 +3074,14 @@ class Red_Alerts_Israel(Hass):
         self.log("HA sensor entities initialization check complete.")
 
     async def _load_initial_data(self):
-        """Loads history, gets backup, sets initial states with map from history, and saves files."""
-        await self.history_manager.load_initial_history(self.api_client)
+        """Gets backup, sets initial states with map from the loaded history, and saves files."""
         history_attrs = self.history_manager.get_history_attributes()
 
         initial_map_url = "https://static-maps.yandex.ru/1.x/?l=map&lang=he_IL&size=600,450&ll=34.8516,31.0461&z=7"
         try:
             last_segment = self.history_manager.get_last_alert_segment()
             if last_segment:
-                initial_map_url = self.generate_smart_alert_map(last_segment, self.lamas_manager._lamas_data)
+                initial_map_url = self.generate_smart_alert_map(last_segment)
         except Exception as map_err:
             self.log(f"Error generating initial history map: {map_err}", level="WARNING")
 
@@ -1575,39 +3113,18 @@ class Red_Alerts_Israel(Hass):
         try:
             tasks = [
                 self.set_state(self.main_sensor, state="off", attributes=initial_state_attrs),
-                self.set_state(self.city_sensor, state="off", attributes=initial_state_attrs.copy()),
-                self.set_state(self.main_sensor_pre_alert, state="off", attributes=initial_state_attrs.copy()),
-                self.set_state(self.city_sensor_pre_alert, state="off", attributes=initial_state_attrs.copy()),
-                self.set_state(self.main_sensor_active_alert, state="off", attributes=initial_state_attrs.copy()),
-                self.set_state(self.city_sensor_active_alert, state="off", attributes=initial_state_attrs.copy()),
+                self.set_state(self.city_sensor, state="off", attributes=initial_state_attrs),
+                self.set_state(self.main_sensor_pre_alert, state="off", attributes=initial_state_attrs),
+                self.set_state(self.city_sensor_pre_alert, state="off", attributes=initial_state_attrs),
+                self.set_state(self.main_sensor_active_alert, state="off", attributes=initial_state_attrs),
+                self.set_state(self.city_sensor_active_alert, state="off", attributes=initial_state_attrs),
             ]
             await asyncio.gather(*tasks, return_exceptions=True)
         except Exception as e:
             self.log(f"Error setting initial 'off' states: {e}", level="WARNING")
 
         try:
-            count_cities = len(history_attrs.get("cities_past_24h", []))
-            count_alerts = len(history_attrs.get("last_24h_alerts", []))
-            tasks = []
-            
-            hist_cities_attrs = {
-                "cities_past_24h": history_attrs.get("cities_past_24h", []),
-                "script_status": "running" 
-            }
-            tasks.append(self.set_state(self.history_cities_sensor, state=str(count_cities), attributes=hist_cities_attrs))
-
-            history_list_attr = {
-                "last_24h_alerts": history_attrs.get("last_24h_alerts", []),
-                "script_status": "running" 
-            }
-            tasks.append(self.set_state(self.history_list_sensor, state=str(count_alerts), attributes=history_list_attr))
-
-            history_group_attr = {
-                "last_24h_alerts_group": history_attrs.get("last_24h_alerts_group", {}),
-                "script_status": "running" 
-            }
-            tasks.append(self.set_state(self.history_group_sensor, state=str(count_alerts), attributes=history_group_attr))
-
+            tasks = self._history_sensor_tasks(history_attrs)
             if tasks:
                 await asyncio.gather(*tasks, return_exceptions=True)
         except Exception as e:
@@ -1628,6 +3145,48 @@ class Red_Alerts_Israel(Hass):
 
         self.log("Initial data loading complete. Map initialized from history.")
         
+    async def _mqtt_publish(self, topic, payload):
+        """Publishes through Home Assistant's MQTT integration (used by MqttPublisher)."""
+        await self.call_service("mqtt/publish", topic=topic, payload=payload, retain=False) # An old alert must not reach new subscribers
+
+    def _history_sensor_tasks(self, history_attrs):
+        """
+        Builds set_state tasks for the three history sensors and records the pushed history generation.
+        With `history_max_bytes` set, each sensor gets only the newest entries that fit in the budget,
+        and the complete history is written to www for `full_history_url`.
+        """
+        self._history_sensors_generation = self.history_manager.generation
+        count_cities = len(history_attrs.get("cities_past_24h", []))
+        count_alerts = len(history_attrs.get("last_24h_alerts", []))
+
+        published = history_attrs
+        extra = {}
+        if self.history_max_bytes:
+            # Leave room for the attribute key, script_status, truncated, full_history_url and attributes_bytes.
+            published = self.history_manager.get_budgeted_attributes(self.history_max_bytes - 256)
+            if self.save_2_file and self.file_manager:
+                self.file_manager.save_full_history(history_attrs)
+                extra["full_history_url"] = f"/local/{os.path.basename(self.file_paths['history_full'])}"
+
+        tasks = []
+        for entity_id, key, state, default in (
+            (self.history_cities_sensor, "cities_past_24h", count_cities, []),
+            (self.history_list_sensor, "last_24h_alerts", count_alerts, []),
+            (self.history_group_sensor, "last_24h_alerts_group", count_alerts, {})
+        ):
+            value = published.get(key, default)
+            attrs = {key: value, "script_status": "running"}
+            if self.history_max_bytes:
+                if isinstance(value, dict):
+                    shown = sum(len(cities) for areas in value.values() for cities in areas.values())
+                else:
+                    shown = len(value)
+                attrs["truncated"] = shown < state
+                attrs.update(extra)
+            attrs["attributes_bytes"] = json_size(attrs)
+            tasks.append(self.set_state(entity_id, state=str(state), attributes=attrs))
+        return tasks
+
     async def _process_active_alert(self, data, is_test=False):
         """
         Processes incoming alert data (real or test), updates state, history, and maps.
@@ -1638,6 +3197,7 @@ class Red_Alerts_Israel(Hass):
         now_dt = datetime.now()
         now_iso = now_dt.isoformat(timespec='microseconds')
 
+        standardize_started = time.perf_counter()
         try:
             cat_str = data.get("cat", "1")
             cat = int(cat_str) if str(cat_str).isdigit() else 1
@@ -1659,36 +3219,42 @@ class Red_Alerts_Israel(Hass):
                 return 
 
             stds_this_payload = set(standardize_name(n) for n in filtered_cities_raw if n)
+            ids_this_payload = self.lamas_manager.intern_all(stds_this_payload)
 
         except Exception as e:
             self.log(f"{log_prefix} Error parsing alert data: {e}", level="ERROR")
             return 
+        self.timings.record("standardize", (time.perf_counter() - standardize_started) * 1000)
 
         if self.last_active_payload_details and not is_test: 
-            if self.last_active_payload_details['id'] == aid and self.last_active_payload_details['stds'] == stds_this_payload:
+            if self.last_active_payload_details['id'] == aid and self.last_active_payload_details['ids'] == ids_this_payload:
                 self.last_alert_time = time.time()
                 return
 
-        self.last_active_payload_details = {'id': aid, 'cat': cat, 'title': title, 'desc': desc, 'stds': stds_this_payload}
+        self.last_active_payload_details = {'id': aid, 'cat': cat, 'title': title, 'desc': desc, 'ids': ids_this_payload}
+
+        if self.mqtt_publisher:
+            self.mqtt_publisher.enqueue(aid, cat, title, filtered_cities_raw, desc, now_dt.strftime('%Y-%m-%d %H:%M:%S'))
 
         if await self.get_state(self.main_sensor) == "off":
-            self.cities_past_window_std = set()
+            self.alert_window.clear()
             self.alert_sequence_count = 0
-            self.window_alerts_grouped.clear()
             self.history_manager.clear_poll_tracker()
+            if self.event_emitter:
+                self.event_emitter.flush()
 
         if "האירוע הסתיים" not in title and "בדקות הקרובות" not in title:
-            self.history_manager.update_history(title, stds_this_payload)
+            self.history_manager.update_history(title, stds_this_payload, category=cat, persist=not is_test)
 
-        self.cities_past_window_std.update(stds_this_payload)
-        
-        for std in stds_this_payload:
-            det = self.lamas_manager.get_city_details(std)
-            area = det.get("area", DEFAULT_UNKNOWN_AREA) if det else DEFAULT_UNKNOWN_AREA
-            orig_name = det.get("original_name", std) if det else std
-            self.window_alerts_grouped[title][area].add(orig_name)
+        new_cities, new_areas = self.alert_window.add(title, ids_this_payload)
 
         self.alert_sequence_count += 1
+        if self.event_emitter and new_cities:
+            self.event_emitter.emit({
+                "id": aid, "category": cat, "title": title, "cities": sorted(new_cities),
+                "description": desc, "timestamp": now_iso,
+                "alerts_count": self.alert_sequence_count, "is_test": is_test
+            }, new_areas)
         self.last_alert_time = time.time()
         self.current_timer_duration = 10 if ("האירוע הסתיים" in title or "בדקות הקרובות" in title) else self.timer_duration
 
@@ -1709,7 +3275,7 @@ class Red_Alerts_Israel(Hass):
 
         new_segment = {
             "type": seg_type,
-            "cities": list(stds_this_payload),
+            "cities": list(ids_this_payload),
             "timestamp": now_ts
         }
         self.map_segments_history.append(new_segment)
@@ -1720,33 +3286,21 @@ class Red_Alerts_Israel(Hass):
         ]
 
         try:
-            current_map_url = self.generate_smart_alert_map(self.map_segments_history, self._lamas_data)
+            with self.timings.measure("map"):
+                current_map_url = self.generate_smart_alert_map(self.map_segments_history)
             self.map_url = current_map_url 
         except Exception as e:
             self.log(f"Map generation error: {e}")
 
-        info = self.alert_processor.process_alert_window_data(
-            category=cat, title=title, description=desc,
-            window_std_cities=self.cities_past_window_std, 
-            window_alerts_grouped=self.window_alerts_grouped,
-            user_configured_stds=self.city_names_self_std
-        )
-        all_cities_display = []
-        user_cities_display = []
-        
-        for std in self.cities_past_window_std:
-            det = self.lamas_manager.get_city_details(std)
-            name = det.get("original_name", std) if det else std
-            
-            if std in self.city_names_self_std:
-                user_cities_display.append(name)
-            else:
-                all_cities_display.append(name)
-        
-        user_cities_display.sort()
-        all_cities_display.sort()
+        with self.timings.measure("window_data"):
+            info = self.alert_processor.process_alert_window_data(
+                category=cat, title=title, description=desc,
+                window=self.alert_window
+            )
+        user_cities_display = self.alert_window.user_names
+        all_cities_display = self.alert_window.nonuser_names
         
-        total_count = len(self.cities_past_window_std)
+        total_count = len(self.alert_window.city_ids)
         areas_str = info.get("areas_alert_str", "ישראל")
 
         if total_count > 100:
@@ -1777,7 +3331,7 @@ class Red_Alerts_Israel(Hass):
 
         self.prev_alert_final_attributes = final_attributes.copy()
 
-        city_sensor_on = bool(self.cities_past_window_std.intersection(self.city_names_self_std))
+        city_sensor_on = not self.alert_window.city_ids.isdisjoint(self.city_ids_self)
         if is_test and self.city_names_self_std: city_sensor_on = True 
         
         await self._update_ha_state(
@@ -1872,8 +3426,7 @@ class Red_Alerts_Israel(Hass):
             self.prev_alert_final_attributes = None 
             self.last_alert_time = None 
             self.last_processed_alert_id = None 
-            self.cities_past_window_std.clear() 
-            self.window_alerts_grouped.clear() 
+            self.alert_window.clear() 
             self.alert_sequence_count = 0 
             self.no_active_alerts_polls = 0 
 
@@ -1898,13 +3451,9 @@ class Red_Alerts_Israel(Hass):
                 self.log(f"{log_prefix} Error during _update_ha_state call on reset: {e}", level="ERROR")
 
             try:
-                count_cities = len(hist_attrs.get("cities_past_24h", []))
-                count_alerts = len(hist_attrs.get("last_24h_alerts", []))
-                tasks = [
-                    self.set_state(self.history_cities_sensor, state=str(count_cities), attributes={"cities_past_24h": hist_attrs.get("cities_past_24h", []), "script_status": "running"}),
-                    self.set_state(self.history_list_sensor, state=str(count_alerts), attributes={"last_24h_alerts": hist_attrs.get("last_24h_alerts", []), "script_status": "running"}),
-                    self.set_state(self.history_group_sensor, state=str(count_alerts), attributes={"last_24h_alerts_group": hist_attrs.get("last_24h_alerts_group", {}), "script_status": "running"})
-                ]
+                tasks = []
+                if self.history_manager.generation != self._history_sensors_generation:
+                    tasks = self._history_sensor_tasks(hist_attrs)
                 if tasks:
                     results = await asyncio.gather(*tasks, return_exceptions=True)
             except Exception as e:
@@ -1929,6 +3478,7 @@ class Red_Alerts_Israel(Hass):
 
     async def _update_ha_state(self, main_state, city_state, text_state, attributes, text_icon="mdi:information"):
         """Updates the state and attributes of core HA entities."""
+        started = time.perf_counter()
         attributes = attributes or {}
         attributes["last_changed"] = datetime.now().isoformat(timespec='microseconds')
         attributes["script_status"] = "running" 
@@ -1937,63 +3487,63 @@ class Red_Alerts_Israel(Hass):
         is_clearance = "האירוע הסתיים" in title_alert
         is_pre = "בדקות הקרובות" in title_alert or "עדכון" in title_alert or "שהייה בסמיכות" in title_alert
 
-        current_cities_in_payload = attributes.get("cities", []) 
-        city_in_current_payload = any(c in self.city_names_config for c in current_cities_in_payload)
+        # city_state already reflects the window's configured cities (an id set check in _process_active_alert)
+        city_in_current_payload = city_state == "on"
 
-        update_tasks = []
         log_prefix = "[HA Update]"
-
-        try:
-            main_attrs = attributes.copy() 
-            update_tasks.append(self.set_state(self.main_sensor, state=main_state, attributes=main_attrs))
-            
-            if is_clearance:
-                update_tasks.append(self.set_state(self.main_sensor_active_alert, state="off", attributes=main_attrs))
-                update_tasks.append(self.set_state(self.main_sensor_pre_alert, state="off", attributes=main_attrs))
-            elif is_pre:
-                update_tasks.append(self.set_state(self.main_sensor_pre_alert, state=main_state, attributes=main_attrs))
-                update_tasks.append(self.set_state(self.main_sensor_active_alert, state="off", attributes=main_attrs))
-            else:
-                update_tasks.append(self.set_state(self.main_sensor_active_alert, state=main_state, attributes=main_attrs))
-                update_tasks.append(self.set_state(self.main_sensor_pre_alert, state="off", attributes=main_attrs))
-        except Exception as e:
-            self.log(f"{log_prefix} Error preparing task for {self.main_sensor}: {e}", level="ERROR")
-
-        try:
-            city_attrs = attributes.copy() 
-            update_tasks.append(self.set_state(self.city_sensor, state=city_state, attributes=city_attrs))
-            
-            if is_clearance:
-                update_tasks.append(self.set_state(self.city_sensor_active_alert, state="off", attributes=city_attrs))
-                update_tasks.append(self.set_state(self.city_sensor_pre_alert, state="off", attributes=city_attrs))
-            elif is_pre:
-                new_state = main_state if city_in_current_payload else "off"
-                update_tasks.append(self.set_state(self.city_sensor_pre_alert, state=new_state, attributes=city_attrs))
-            else:
-                new_state = main_state if city_in_current_payload else "off"
-                update_tasks.append(self.set_state(self.city_sensor_active_alert, state=new_state, attributes=city_attrs))
-        except Exception as e:
-            self.log(f"{log_prefix} Error preparing task for {self.city_sensor}: {e}", level="ERROR")
+        writes = [] # (entity_id, state, attributes)
+
+        # All six binary sensors share one attribute dict; it is not modified after this point.
+        writes.append((self.main_sensor, main_state, attributes))
+        if is_clearance:
+            writes.append((self.main_sensor_active_alert, "off", attributes))
+            writes.append((self.main_sensor_pre_alert, "off", attributes))
+        elif is_pre:
+            writes.append((self.main_sensor_pre_alert, main_state, attributes))
+            writes.append((self.main_sensor_active_alert, "off", attributes))
+        else:
+            writes.append((self.main_sensor_active_alert, main_state, attributes))
+            writes.append((self.main_sensor_pre_alert, "off", attributes))
+
+        writes.append((self.city_sensor, city_state, attributes))
+        if is_clearance:
+            writes.append((self.city_sensor_active_alert, "off", attributes))
+            writes.append((self.city_sensor_pre_alert, "off", attributes))
+        elif is_pre:
+            new_state = main_state if city_in_current_payload else "off"
+            writes.append((self.city_sensor_pre_alert, new_state, attributes))
+        else:
+            new_state = main_state if city_in_current_payload else "off"
+            writes.append((self.city_sensor_active_alert, new_state, attributes))
 
         try:
             if main_state == "on":
                 safe_text_state = text_state[:255] if isinstance(text_state, str) else "Error"
                 current_text_state = await self.get_state(self.main_text)
                 if safe_text_state != current_text_state:
-                    update_tasks.append(self.set_state(self.main_text, state=safe_text_state, attributes={"icon": text_icon}))
+                    writes.append((self.main_text, safe_text_state, {"icon": text_icon}))
 
         except Exception as e:
             self.log(f"{log_prefix} Error preparing/checking task for {self.main_text}: {e}", level="ERROR")
 
+        update_tasks = []
+        for entity_id, state, attrs in writes:
+            try:
+                update_tasks.append(self.set_state(entity_id, state=state, attributes=attrs))
+            except Exception as e:
+                self.log(f"{log_prefix} Error preparing task for {entity_id}: {e}", level="ERROR")
+        self.ha_writes_sent += len(update_tasks)
+
         if update_tasks:
             try:
                 results = await asyncio.gather(*update_tasks, return_exceptions=True)
-                for i, result in enumerate(results):
+                for result in results:
                     if isinstance(result, Exception):
                         self.log(f"{log_prefix} Error during HA state update task: {result}", level="ERROR", exc_info=False) 
 
             except Exception as e:
                 self.log(f"{log_prefix} Unexpected error executing HA state updates via asyncio.gather: {e}", level="ERROR")
+        self.timings.record("ha_update", (time.perf_counter() - started) * 1000)
 
     async def poll_alerts(self):
         """Fetches alerts from API, processes them, or checks for sensor reset."""
@@ -2036,12 +3586,7 @@ class Red_Alerts_Israel(Hass):
                         self.log(f"{log_prefix} Old alerts aged out. Updating history sensors.", level="DEBUG")
                         current_hist_attrs = self.history_manager.get_history_attributes()
 
-                        count_alerts = len(current_hist_attrs.get("last_24h_alerts", []))
-                        tasks = [
-                            self.set_state(self.history_cities_sensor, state=str(len(current_hist_attrs.get("cities_past_24h", []))), attributes={"cities_past_24h": current_hist_attrs["cities_past_24h"], "script_status": "running"}),
-                            self.set_state(self.history_list_sensor, state=str(count_alerts), attributes={"last_24h_alerts": current_hist_attrs["last_24h_alerts"], "script_status": "running"}),
-                            self.set_state(self.history_group_sensor, state=str(count_alerts), attributes={"last_24h_alerts_group": current_hist_attrs["last_24h_alerts_group"], "script_status": "running"})
-                        ]
+                        tasks = self._history_sensor_tasks(current_hist_attrs)
                         if self.save_2_file and self.file_manager:
                             tasks.append(self._save_history_geojson(current_hist_attrs))
                         
@@ -2147,10 +3692,11 @@ class Red_Alerts_Israel(Hass):
             self.log("Skipping Latest GeoJSON save: Attributes missing.", level="WARNING")
             return
         try:
-            latest_geojson_data = self._generate_geojson_data(attributes, duration="latest")
+            with self.timings.measure("geojson_latest"):
+                latest_geojson_data = self._generate_geojson_data(attributes, duration="latest")
             path = self.file_paths.get("geojson_latest")
             if path:
-                self.file_manager.save_geojson_file(latest_geojson_data, path)
+                self.file_manager.save_geojson_file(latest_geojson_data, path, gzip_copy=self.geojson_gzip)
             else:
                 self.log("Skipping Latest GeoJSON save: Path not found.", level="WARNING")
         except Exception as e:
@@ -2162,18 +3708,23 @@ class Red_Alerts_Israel(Hass):
         if not history_attributes or "last_24h_alerts" not in history_attributes:
             self.log("Skipping History GeoJSON save: History attributes missing or invalid.", level="WARNING")
             return
+        generation = self.history_manager.generation
+        if generation == self._history_geojson_generation:
+            return
         try:
-            history_geojson_data = self._generate_geojson_data(history_attributes, duration="history")
+            with self.timings.measure("geojson_history"):
+                history_geojson_text = self.history_manager.get_history_geojson()
             path = self.file_paths.get("geojson_history")
             if path:
-                self.file_manager.save_geojson_file(history_geojson_data, path)
+                self.file_manager.save_geojson_file(history_geojson_text, path, gzip_copy=self.geojson_gzip)
+                self._history_geojson_generation = generation
             else:
                 self.log("Skipping History GeoJSON save: Path not found.", level="WARNING")
         except Exception as e:
             self.log(f"Error saving History GeoJSON: {e}", level="ERROR")
 
     def _generate_geojson_data(self, attributes, duration="latest"):
-        """Generates the GeoJSON structure (FeatureCollection)."""
+        """Generates the GeoJSON structure (FeatureCollection). The history file comes from HistoryManager.get_history_geojson()."""
         geo = {"type": "FeatureCollection", "features": []}
         attrs = attributes or {} 
         locations = {} 
@@ -2192,21 +3743,17 @@ class Red_Alerts_Israel(Hass):
                 if not isinstance(city_display_name, str) or not city_display_name.strip(): continue
                 std = standardize_name(city_display_name)
                 if not std: continue 
-                det = self.lamas_manager.get_city_details(std)
-
-                if det and "lat" in det and "long" in det:
-                    try:
-                        lat, lon = float(det["lat"]), float(det["long"])
-                        key = f"{lat},{lon}" 
-                        if key not in locations:
-                            locations[key] = {"coords": [lon, lat], "cities": set()}
-                        locations[key]["cities"].add(city_display_name) 
-                    except (ValueError, TypeError) as e:
-                        if std not in unknown_cities_logged: 
-                            self.log(f"GeoJSON ({duration}): Invalid coords for '{city_display_name}': {e}", level="WARNING")
-                            unknown_cities_logged.add(std)
+                city_id = self.lamas_manager.get_city_id(std)
+                coords = self.lamas_manager.get_coords(city_id) if city_id is not None else None
+
+                if coords:
+                    lon, lat = coords
+                    key = f"{lat},{lon}" 
+                    if key not in locations:
+                        locations[key] = {"coords": [round(lon, GEOJSON_COORD_DECIMALS), round(lat, GEOJSON_COORD_DECIMALS)], "cities": set()}
+                    locations[key]["cities"].add(city_display_name) 
                 elif std not in unknown_cities_logged: 
-                    reason = "Not found in Lamas" if not det else "Missing coords"
+                    reason = "Not found in Lamas" if city_id is None else "Missing coords"
                     self.log(f"GeoJSON ({duration}): SKIP city '{city_display_name}' (std: '{std}'). Reason: {reason}.", level="DEBUG") 
                     unknown_cities_logged.add(std)
 
@@ -2229,72 +3776,6 @@ class Red_Alerts_Israel(Hass):
                         "properties": props
                     })
 
-        elif duration == "history":
-            history_list = attrs.get("last_24h_alerts", [])
-            if not history_list: return geo 
-
-            for alert in history_list:
-                if not isinstance(alert, dict): continue
-                city_display_name = alert.get("city") 
-                if not city_display_name or not isinstance(city_display_name, str): continue
-
-                std = standardize_name(city_display_name)
-                if not std: continue
-                det = self.lamas_manager.get_city_details(std)
-
-                if det and "lat" in det and "long" in det:
-                    try:
-                        lat, lon = float(det["lat"]), float(det["long"])
-                        key = f"{lat},{lon}"
-                        if key not in locations:
-                            locations[key] = {"coords": [lon, lat], "cities": set(), "details": []}
-                        locations[key]["details"].append(alert)
-                        locations[key]["cities"].add(city_display_name)
-                    except (ValueError, TypeError) as e:
-                        if std not in unknown_cities_logged:
-                            self.log(f"GeoJSON ({duration}): Invalid hist coords for '{city_display_name}': {e}", level="WARNING")
-                            unknown_cities_logged.add(std)
-                elif std not in unknown_cities_logged:
-                    reason = "Not found in Lamas" if not det else "Missing coords"
-                    self.log(f"GeoJSON ({duration}): SKIP hist city '{city_display_name}' (std: '{std}'). Reason: {reason}.", level="DEBUG") 
-                    unknown_cities_logged.add(std)
-
-            if locations:
-                icon_mdi, emoji = ("mdi:history", "📜") 
-                for key, loc_data in locations.items():
-                    if not loc_data.get("details"): continue 
-
-                    try:
-                        latest_alert_at_loc = max(
-                            loc_data["details"],
-                            key=lambda x: parse_datetime_str(x.get("time", ""), self.log) or datetime.min
-                        )
-                    except (ValueError, TypeError) as max_err:
-                        self.log(f"GeoJSON ({duration}): Error finding latest alert time for location {key}: {max_err}", level="WARNING")
-                        continue 
-
-                    city_names_at_point = sorted(list(loc_data["cities"]))
-                    alert_time_str = latest_alert_at_loc.get('time', 'N/A') 
-                    alert_count = len(loc_data['details'])
-                    desc = f"{latest_alert_at_loc.get('title', 'התרעה היסטורית')}\n" \
-                        f"{', '.join(city_names_at_point)}\n" \
-                        f"זמן אחרון: {alert_time_str}\n" \
-                        f"סה״כ: {alert_count} אירועים"
-
-                    props = {
-                        "name": ", ".join(city_names_at_point),
-                        "area": latest_alert_at_loc.get("area", ""),
-                        "icon": icon_mdi,
-                        "label": emoji,
-                        "description": desc,
-                        "alert_count_at_location": alert_count,
-                        "latest_alert_time": alert_time_str 
-                    }
-                    geo["features"].append({
-                        "type": "Feature",
-                        "geometry": {"type": "Point", "coordinates": loc_data["coords"]},
-                        "properties": props
-                    })
         else:
             self.log(f"GeoJSON: Unknown duration type '{duration}'.", level="WARNING")
 
@@ -2363,59 +3844,96 @@ class Red_Alerts_Israel(Hass):
             "prev_alerts_count": data.get('alerts_count', 0) 
         }
 
-    def generate_smart_alert_map(self, alert_segments, lamas_data):
+    def generate_smart_alert_map(self, alert_segments):
         """
         Final Tactical Map Engine:
         1. Priority Layering: Clear > Active > Pre.
         2. Clustering with Containment Check: Prevents redundant polygons of the same color.
         3. 3-Decimal Precision & Decimated Hull: Optimized for Yandex 2048 char limit.
+        Segment "cities" are LamasDataManager ids. Rendering is memoized on the merged (type, cities)
+        content of the segments.
         """
-        import math
-        from collections import defaultdict
-        
-        COLORS = {"pre": "ff9800", "active": "f44336", "clear": "4caf50"}
-        yandex_paths = []
-        all_coords_for_center = []
         ignore_list = ["ברחבי הארץ", "כל הארץ", "ישראל", "לא ידוע"]
 
         if not alert_segments:
             return "https://static-maps.yandex.ru/1.x/?l=map&lang=he_IL&size=600,450&ll=34.852,31.046&z=7"
 
-        def is_point_in_poly(x, y, poly):
-            n = len(poly)
-            inside = False
-            if n < 3: return False
-            p1x, p1y = poly[0]
-            for i in range(n + 1):
-                p2x, p2y = poly[i % n]
-                if y > min(p1y, p2y):
-                    if y <= max(p1y, p2y):
-                        if x <= max(p1x, p2x):
-                            if p1y != p2y:
-                                xints = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
-                            if p1x == p2x or x <= xints:
-                                inside = not inside
-                p1x, p1y = p2x, p2y
-            return inside
-
+        lamas = self.lamas_manager
+        ignore_ids = {lamas.get_city_id(name) for name in ignore_list}
         merged_cities = defaultdict(set)
         for segment in alert_segments:
             seg_type = segment.get("type", "active")
-            for city in segment.get("cities", []):
-                if city not in ignore_list:
-                    merged_cities[seg_type].add(city)
+            # Cities not in the Lamas data have no coordinates, so they never change the map
+            merged_cities[seg_type].update(c for c in segment.get("cities", ()) if lamas.is_known(c))
+
+        fingerprint = tuple(sorted(
+            (seg_type, frozenset(cities - ignore_ids)) for seg_type, cities in merged_cities.items() if cities - ignore_ids
+        ))
+        return self._render_alert_map(fingerprint)
+
+    def _map_cache_attributes(self) -> dict:
+        info = self._render_alert_map.cache_info()
+        return {"map_cache_hits": info.hits, "map_cache_misses": info.misses}
+
+    async def _publish_diagnostics(self):
+        """Publishes the stage timings and runtime counters to the diagnostics sensor (and the metrics file)."""
+        stages = self.timings.summary()
+        api = self._api_stats_attributes()
+        writer = self.file_manager.writer_stats() if self.file_manager else {}
+        attributes = {
+            "stages_ms": stages,
+            **api,
+            **self._map_cache_attributes(),
+            "poll_stats": self.poll_scheduler.stats(),
+            "startup_stats": self.startup_stats,
+            "ha_writes_sent": self.ha_writes_sent,
+            "file_writer": writer,
+            "unit_of_measurement": "ms",
+            "icon": "mdi:timer-outline",
+            "friendly_name": "Red Alert Diagnostics",
+            "timestamp": datetime.now().isoformat()
+        }
+        try:
+            await self.set_state(self.diagnostics_sensor, state=stages.get("poll", {}).get("p95", 0), attributes=attributes)
+        except Exception as e:
+            self.log(f"Error updating {self.diagnostics_sensor}: {e}", level="WARNING")
+
+        if self.diagnostics_prometheus and self.file_manager:
+            counters = {
+                "api_bytes_downloaded_total": api["api_bytes_downloaded"],
+                "api_parses_skipped_total": api["api_parses_skipped"],
+                "poll_missed_deadlines_total": self.poll_scheduler.missed,
+                "ha_writes_sent_total": self.ha_writes_sent,
+                **{f"file_{k}_total": v for k, v in writer.items()}
+            }
+            self.file_manager.save_metrics_file(StageTimings.to_prometheus(self.sensor_name, stages, counters))
+
+    def _api_stats_attributes(self) -> dict:
+        stats = self.api_client.live_stats if self.api_client else {}
+        return {
+            "api_bytes_downloaded": stats.get("bytes_downloaded", 0),
+            "api_parses_skipped": stats.get("parses_skipped", 0)
+        }
+
+    def _render_alert_map_uncached(self, fingerprint):
+        """
+        Renders the Yandex static map URL for a canonical ((type, frozenset(city ids)), ...) fingerprint.
+        Called through self._render_alert_map, the per-instance LRU cache set up in initialize().
+        """
+        COLORS = {"pre": "ff9800", "active": "f44336", "clear": "4caf50"}
+        yandex_paths = []
+        all_coords_for_center = []
+        merged_cities = dict(fingerprint)
 
         coords_by_type = defaultdict(set)
+        lamas = self.lamas_manager
         for seg_type, cities in merged_cities.items():
-            if lamas_data and "areas" in lamas_data:
-                for area_cities in lamas_data["areas"].values():
-                    for city_name in cities:
-                        if city_name in area_cities:
-                            d = area_cities[city_name]
-                            if "lat" in d and "long" in d:
-                                p = (float(d["long"]), float(d["lat"]))
-                                coords_by_type[seg_type].add(p)
-                                all_coords_for_center.append(p)
+            city_ids = sorted(cities) # Ids are area-major, so the point order depends only on the city set
+            for city_id in city_ids:
+                p = lamas.get_coords(city_id)
+                if p:
+                    coords_by_type[seg_type].add(p)
+                    all_coords_for_center.append(p)
 
         if "clear" in coords_by_type:
             coords_by_type["active"] -= coords_by_type["clear"]
@@ -2429,25 +3947,16 @@ class Red_Alerts_Israel(Hass):
             points = list(coords_by_type[seg_type])
             if not points: continue
             
-            clusters = []
-            for p in points:
-                found = False
-                for cluster in clusters:
-                    if any(math.sqrt((p[0]-cp[0])**2 + (p[1]-cp[1])**2) < DIST_THRESHOLD for cp in cluster):
-                        cluster.append(p)
-                        found = True
-                        break
-                if not found: clusters.append([p])
+            clusters = cluster_points(points, DIST_THRESHOLD)
 
             hulls_candidates = []
             for cluster in clusters:
-                expanded = []
-                for lon, lat in cluster:
-                    for angle in range(0, 360, 72): 
-                        rad = math.radians(angle)
-                        expanded.append((lon + 0.015 * math.cos(rad), lat + 0.015 * math.sin(rad)))
-                h = get_convex_hull(expanded)
-                if h: hulls_candidates.append({'hull': h, 'cluster': cluster})
+                h = expanded_hull(cluster)
+                if h:
+                    c_lon = sum(p[0] for p in cluster) / len(cluster)
+                    c_lat = sum(p[1] for p in cluster) / len(cluster)
+                    bbox = (min(p[0] for p in h), min(p[1] for p in h), max(p[0] for p in h), max(p[1] for p in h))
+                    hulls_candidates.append({'hull': h, 'cluster': cluster, 'center': (c_lon, c_lat), 'bbox': bbox})
 
             hulls_candidates.sort(key=lambda x: len(x['cluster']), reverse=True)
             
@@ -2456,12 +3965,11 @@ class Red_Alerts_Israel(Hass):
 
             for i, data in enumerate(hulls_candidates):
                 is_contained = False
-                for j, target in enumerate(hulls_candidates):
-                    if i <= j: continue 
-                    
-                    c_lon = sum(p[0] for p in data['cluster']) / len(data['cluster'])
-                    c_lat = sum(p[1] for p in data['cluster']) / len(data['cluster'])
-                    
+                c_lon, c_lat = data['center']
+                for target in hulls_candidates[:i]:
+                    min_lon, min_lat, max_lon, max_lat = target['bbox']
+                    if not (min_lon <= c_lon <= max_lon and min_lat <= c_lat <= max_lat):
+                        continue
                     if is_point_in_poly(c_lon, c_lat, target['hull']):
                         is_contained = True
                         break
@@ -0,0 +1,716 @@
+"""
+Regression checks for the incremental code paths of red_alerts_israel.
+
+Each check drives the real app code (imported with the same AppDaemon stub as replay.py) through
+randomized inputs and compares the incremental result with a straightforward reference, so a
+later change cannot silently break the equivalence the optimizations rely on.
+
+    python benchmarks/checks.py                  # every check
+    python benchmarks/checks.py json_stream      # one check
+    python benchmarks/checks.py --seeds 500
+
+Exits with status 1 if any check fails.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import aiohttp
+
+from replay import APP_DIR, FIXTURES_DIR, import_app_module, replay
+
+
+# ----------------------------------------------------------------------
+# Checks
+# ----------------------------------------------------------------------
+def random_feed_entry(rng, now):
+    """An AlertsHistory.json-like entry, with the odd string / number shapes the parser must survive."""
+    texts = ["תל אביב - מרכז העיר", "באר שבע - דרום", 'quote " and \\ backslash', "emoji 🚀", "אבג", ""]
+    return {
+        "alertDate": (now - timedelta(seconds=rng.uniform(0, 86400))).strftime("%Y-%m-%d %H:%M:%S"),
+        "title": rng.choice(texts),
+        "data": rng.choice(texts),
+        "category": rng.choice([1, 2, 13, -7, 1.5, 1e-3, 123456789012, None, True]),
+        "extra": rng.choice([[], {}, [1, [2, {"a": None}]], "x" * rng.randint(0, 300)]),
+    }
+
+
+def split_bytes(rng, data):
+    """Splits bytes at random points, including inside multi-byte UTF-8 sequences."""
+    chunks, pos = [], 0
+    while pos < len(data):
+        size = rng.choice([1, 2, 3, 7, 64, 1024, rng.randint(1, 70000)])
+        chunks.append(data[pos:pos + size])
+        pos += size
+    return chunks
+
+
+async def read_chunks(client, chunks, stop_before=None):
+    async def iterate():
+        for chunk in chunks:
+            yield chunk
+    return await client._read_history(iterate(), stop_before)
+
+
+def check_json_stream(module, seeds):
+    """OrefAPIClient._read_history (UTF-8-sig decoder + JsonArrayStream) on chunk-split bodies vs json.loads."""
+    client = module.OrefAPIClient(None, {}, lambda *args, **kwargs: None)
+    now = datetime.now()
+    runs = 0
+    for seed in range(seeds):
+        rng = random.Random(seed)
+        entries = sorted((random_feed_entry(rng, now) for _ in range(rng.randint(0, 60))),
+                         key=lambda e: e["alertDate"], reverse=True)
+        text = json.dumps(entries, ensure_ascii=rng.random() < 0.3, indent=rng.choice([None, 0, 2]),
+                          separators=rng.choice([None, (",", ":"), (" , ", " : ")]))
+        body = ("﻿" if rng.random() < 0.5 else "") + text + rng.choice(["", "\n", "  \r\n"])
+
+        # Valid body: every split gives exactly json.loads' result
+        for _ in range(4):
+            got = asyncio.run(read_chunks(client, split_bytes(rng, body.encode("utf-8"))))
+            assert got == json.loads(text), f"seed {seed}: parsed entries differ from json.loads"
+            runs += 1
+
+        # Early stop: a prefix of the feed, ending in a run of HISTORY_STOP_AFTER entries older than the cutoff.
+        # The feed is only roughly newest first, so some neighbours are swapped.
+        for i in range(len(entries) - 1):
+            if rng.random() < 0.2:
+                entries[i], entries[i + 1] = entries[i + 1], entries[i]
+        body = json.dumps(entries, ensure_ascii=False)
+        stop_before = now - timedelta(seconds=rng.uniform(0, 86400))
+        got = asyncio.run(read_chunks(client, split_bytes(rng, body.encode("utf-8")), stop_before))
+        assert got == entries[:len(got)], f"seed {seed}: early stop did not return a prefix of the feed"
+        if client.history_stats["history_stopped_early"]:
+            tail = got[-client.HISTORY_STOP_AFTER:]
+            assert all(datetime.fromisoformat(e["alertDate"]) < stop_before for e in tail), f"seed {seed}: stopped too soon"
+        else:
+            assert got == entries, f"seed {seed}: no early stop but entries are missing"
+        runs += 1
+
+        # Damaged body: either both parsers reject it, or both return the same array
+        damaged = list(text)
+        for _ in range(rng.randint(1, 3)):
+            pos = rng.randrange(len(damaged) + 1)
+            if rng.random() < 0.5 and damaged:
+                del damaged[pos:pos + rng.randint(1, 5)]
+            else:
+                damaged.insert(pos, rng.choice(["]", "[", ",", '"', "x", "1", "{", "}", ":", " "]))
+        damaged = "".join(damaged)
+        try:
+            expected = json.loads(damaged)
+        except ValueError:
+            expected = ValueError
+        if not damaged.strip():
+            continue # An empty body is "no feed" (None), not an error
+        if expected is not ValueError and not isinstance(expected, list):
+            expected = ValueError # Only a top-level array is accepted
+        try:
+            got = asyncio.run(read_chunks(client, split_bytes(rng, damaged.encode("utf-8"))))
+        except ValueError:
+            got = ValueError
+        assert got == expected, f"seed {seed}: damaged body {damaged[:80]!r}: got {str(got)[:80]}, expected {str(expected)[:80]}"
+        runs += 1
+    return f"{runs} chunk-split bodies match json.loads"
+
+
+class FakeClock(datetime):
+    """A datetime whose now() the check sets, so history expiry can be driven without sleeping."""
+    current = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+@contextlib.contextmanager
+def fake_clock(module, start):
+    """Makes the app module's datetime a FakeClock starting at `start`."""
+    module._parse_datetime_cached.cache_clear() # It may hold plain datetimes
+    module.datetime, FakeClock.current = FakeClock, FakeClock.fromisoformat(start.isoformat())
+    try:
+        yield
+    finally:
+        module.datetime = datetime
+        module._parse_datetime_cached.cache_clear()
+
+
+def load_lamas(module):
+    lamas = module.LamasDataManager(os.path.join(APP_DIR, "lamas_data.json"), None, None, lambda *args, **kwargs: None)
+    assert asyncio.run(lamas.load_data()), "Lamas data did not load"
+    with open(os.path.join(APP_DIR, "lamas_data.json"), encoding="utf-8-sig") as f:
+        names = sorted(name for cities in json.load(f)["areas"].values() for name in cities)
+    return lamas, names
+
+
+def check_history(module, seeds):
+    """
+    HistoryManager's incremental history (newest-first deque, O(1) expiry, per-city merge index and
+    per-location GeoJSON) against a plain sorted-list model and a from-scratch rebuild of it.
+    """
+    lamas, names = load_lamas(module)
+    log = lambda *args, **kwargs: None
+    titles = ["ירי רקטות וטילים", "חדירת כלי טיס עוין", "בדקות הקרובות צפויות להתקבל התרעות באזורך", "רעידת אדמה"]
+    unknown = ["עיר שלא קיימת", "טקסט חופשי"]
+    compared = 0
+    for seed in range(seeds):
+        rng = random.Random(seed)
+        hours = rng.choice([1, 4, 24])
+        with fake_clock(module, datetime(2026, 3, 1, 12, 0, 0)):
+            hm = module.HistoryManager(hours, lamas, log, 120)
+            max_events = hm._max_history_events
+            feed_size = rng.choice([0, 10, 200, max_events * 2]) # The largest one fills the history to its cap
+            spread = hours * rng.choice([3000, 4000]) # Seconds, some of it past the window
+            feed = [{"alertDate": (FakeClock.current - timedelta(seconds=rng.uniform(0, spread))).strftime("%Y-%m-%d %H:%M:%S"),
+                     "title": rng.choice(titles), "data": rng.choice(names + unknown), "category": 1} for _ in range(feed_size)]
+            hm.load_history_data(feed)
+
+            # The model: (time, insertion order, alert) kept sorted newest first, ties in insertion order
+            model = [(a["time"], i, a) for i, a in enumerate(hm._history_list)]
+            seq = len(model)
+            for step in range(rng.randint(5, 25)):
+                r = rng.random()
+                if len(hm._history_list) == max_events and r < 0.2: # Full, and the clock went back past the oldest alert kept
+                    delta = (hm._history_list[-1]["time"] - FakeClock.current).total_seconds() - rng.uniform(1, 60)
+                elif r < 0.15: delta = 0 # Same timestamp as the newest alert
+                elif r < 0.25: delta = -rng.uniform(1, 600) # Clock went backwards
+                elif r < 0.35: delta = hours * 3600 # The previous poll's alerts sit exactly on the cutoff
+                else: delta = rng.uniform(1, hours * 1200)
+                FakeClock.current += timedelta(seconds=delta)
+                now = FakeClock.current
+
+                title = rng.choice(titles)
+                cities = set(rng.sample(names, rng.choice([1, 3, 20, 150]))) | set(rng.sample(unknown, rng.randint(0, 1)))
+                hm.clear_poll_tracker()
+                hm.update_history(title, cities, persist=False)
+
+                for std in cities: # Same set object, so the same iteration order as update_history
+                    details = lamas.get_city_details(std)
+                    alert = {"title": title, "city": details["original_name"] if details else std,
+                             "area": details["area"] if details else module.DEFAULT_UNKNOWN_AREA, "time": now}
+                    model.append((now, seq, alert))
+                    seq += 1
+                model.sort(key=lambda entry: entry[1])
+                model.sort(key=lambda entry: entry[0], reverse=True)
+                cutoff = now - timedelta(hours=hours)
+                model = [entry for entry in model[:max_events] if entry[0] >= cutoff]
+
+                got = [(a["time"], a["city"], a["title"]) for a in hm._history_list]
+                assert got == [(t, a["city"], a["title"]) for t, _, a in model], f"seed {seed} step {step}: history differs from the model"
+
+                if rng.random() < 0.4 or step == 0: # Let changes pile up between reads sometimes
+                    reference = module.HistoryManager(hours, lamas, log, 120)
+                    reference._reset_history([a for _, _, a in model])
+                    assert hm.get_history_attributes() == reference.get_history_attributes(), f"seed {seed} step {step}: attributes differ from a rebuild"
+                    assert hm.get_history_geojson() == reference.get_history_geojson(), f"seed {seed} step {step}: GeoJSON differs from a rebuild"
+                    compared += 1
+    return f"{compared} incremental history states match a full rebuild"
+
+
+def feed_alert(module, lamas, entry):
+    """The history alert load_history_data makes of an AlertsHistory.json entry, as a comparable tuple."""
+    details = lamas.get_city_details(module.standardize_name(entry["data"]))
+    return (module.parse_datetime_str(entry["alertDate"]), entry["title"],
+            details["original_name"] if details else entry["data"], details["area"] if details else module.DEFAULT_UNKNOWN_AREA)
+
+
+def check_journal(module, seeds):
+    """
+    AlertJournal across a restart: the reopened journal plus the AlertsHistory.json alerts newer than its
+    covered_until must give back every alert within the history window, each exactly once.
+    """
+    lamas, names = load_lamas(module)
+    log = lambda *args, **kwargs: None
+    titles = ["ירי רקטות וטילים", "חדירת כלי טיס עוין", "בדקות הקרובות צפויות להתקבל התרעות באזורך"]
+    names = names + ["עיר שלא קיימת"]
+    restarts = 0
+
+    def as_tuples(alerts):
+        return Counter((a["time"], a["title"], a["city"], a["area"]) for a in alerts)
+
+    def random_entries(rng, newest, oldest, count):
+        entries = {}
+        for _ in range(count): # Unique per (city, second, title), as the journal's index expects
+            entry = {"alertDate": (newest - timedelta(seconds=rng.randint(0, int((newest - oldest).total_seconds())))).strftime("%Y-%m-%d %H:%M:%S"),
+                     "title": rng.choice(titles), "data": rng.choice(names), "category": rng.choice([1, 6, None])}
+            entries[entry["alertDate"], entry["title"], entry["data"]] = entry
+        return sorted(entries.values(), key=lambda e: e["alertDate"], reverse=True)
+
+    for seed in range(seeds):
+        rng = random.Random(seed)
+        hours = rng.choice([1, 4, 24])
+        with tempfile.TemporaryDirectory() as tmp, fake_clock(module, datetime(2026, 3, 1, 12, 0, 0)):
+            path = os.path.join(tmp, "journal.db")
+            feed = random_entries(rng, FakeClock.current, FakeClock.current - timedelta(hours=hours * 3), rng.choice([0, 5, 300]))
+            every_alert = Counter(feed_alert(module, lamas, e) for e in feed if "בדקות הקרובות" not in e["title"])
+
+            # First start: an empty journal takes the whole feed, then live polls are journaled
+            journal = module.AlertJournal(path, 30, log)
+            assert journal.open(), "journal did not open"
+            hm = module.HistoryManager(hours, lamas, log, 120)
+            hm.attach_journal(journal)
+            assert hm.read_journal() == [] and hm.feed_horizon(with_journal=True) is None
+            hm.load_history_data(feed, hm.read_journal())
+            covered = None
+            for _ in range(rng.randint(0, 15)):
+                FakeClock.current += timedelta(seconds=rng.choice([1, rng.uniform(0.001, hours * 600)]))
+                now = FakeClock.current
+                if rng.random() < 0.3:
+                    journal.mark_covered(now, force=True) # A healthy idle poll, as if COVERED_INTERVAL had passed
+                else:
+                    title = rng.choice(titles)
+                    cities = {module.standardize_name(name) for name in rng.sample(names, rng.choice([1, 3, 20]))}
+                    hm.clear_poll_tracker()
+                    hm.update_history(title, cities, category=1)
+                    for std in cities:
+                        details = lamas.get_city_details(std)
+                        every_alert[now, title, details["original_name"] if details else std, details["area"] if details else module.DEFAULT_UNKNOWN_AREA] += 1
+                        feed.insert(0, {"alertDate": now.strftime("%Y-%m-%d %H:%M:%S"), "title": title, "data": details["original_name"] if details else std, "category": 1})
+                covered = now
+            hm._prune_and_limit() # The app's periodic prune
+            cutoff = FakeClock.current - timedelta(hours=hours)
+            assert as_tuples(hm._history_list) == Counter({a: n for a, n in every_alert.items() if a[0] >= cutoff}), f"seed {seed}: history before the restart is off"
+            journal.set_history_validators('"etag-1"', None)
+            assert journal.close(), f"seed {seed}: journal did not flush on close"
+
+            # Restart, possibly with a longer window: alerts raised while down only reach the feed
+            downtime = timedelta(seconds=rng.choice([0, rng.uniform(1, hours * 1800)]))
+            if downtime:
+                gap = random_entries(rng, FakeClock.current + downtime, FakeClock.current + timedelta(seconds=1), rng.choice([1, 20]))
+                feed = gap + feed
+                every_alert.update(feed_alert(module, lamas, e) for e in gap if "בדקות הקרובות" not in e["title"])
+            FakeClock.current += downtime
+            hours = rng.choice([hours, hours * 2])
+            for _ in range(2): # The second restart finds the downtime alerts journaled, and nothing left in the gap
+                journal = module.AlertJournal(path, 30, log)
+                assert journal.open(), "journal did not reopen"
+                hm = module.HistoryManager(hours, lamas, log, 120)
+                hm.attach_journal(journal)
+                assert journal.history_validators() == {"etag": '"etag-1"'}, f"seed {seed}: history validators were lost"
+                assert hm.feed_horizon(with_journal=True) == covered, f"seed {seed}: covered_until {journal.covered_until}, expected {covered}"
+                hm.load_history_data(feed, hm.read_journal())
+                cutoff = FakeClock.current - timedelta(hours=hours)
+                assert as_tuples(hm._history_list) == Counter({a: n for a, n in every_alert.items() if a[0] >= cutoff}), f"seed {seed}: history after the restart is off"
+                times = [a["time"] for a in hm._history_list]
+                assert times == sorted(times, reverse=True), f"seed {seed}: history after the restart is not newest first"
+                journal.close()
+                restarts += 1
+    return f"{restarts} journal reloads give back the history"
+
+
+def check_unknown_cities(module, seeds):
+    """
+    City names not in the Lamas data past LamasDataManager.MAX_UNKNOWN_CITIES: the alert window and its
+    texts must be the same as with room to intern every name, so no city is ever dropped.
+    """
+    lamas, names = load_lamas(module)
+    bounded, _ = load_lamas(module)
+    log = lambda *args, **kwargs: None
+    titles = ["ירי רקטות וטילים", "חדירת כלי טיס עוין"]
+    payloads = 0
+    for seed in range(seeds):
+        rng = random.Random(seed)
+        unknown = [f"יישוב לא מוכר {i}" for i in range(rng.choice([1, 5, 40]))]
+        bounded.MAX_UNKNOWN_CITIES = rng.choice([0, 1, 3, len(unknown)])
+        mine = [module.standardize_name(n) for n in rng.sample(names, 2) + rng.sample(unknown, 1)]
+        windows = []
+        for manager in (lamas, bounded):
+            manager._build_id_tables() # Forget the unknown names of earlier seeds
+            windows.append((manager, module.AlertWindow(manager, manager.intern_all(mine)),
+                            module.AlertProcessor(manager, module.ICONS_AND_EMOJIS, log)))
+        for _ in range(rng.randint(1, 6)):
+            title = rng.choice(titles)
+            cities = rng.sample(names, rng.choice([1, 10, 200])) + rng.sample(unknown, rng.randint(0, len(unknown)))
+            stds = {module.standardize_name(c) for c in cities}
+            results = []
+            for manager, window, processor in windows:
+                new_names, new_areas = window.add(title, manager.intern_all(stds))
+                window_names = {manager.display_name(c) for c in window.city_ids}
+                assert all(c in window_names or manager.get_city_id(c) is not None for c in stds), f"seed {seed}: a city is missing from the window"
+                results.append((sorted(new_names), sorted(new_areas), processor.process_alert_window_data(1, title, "", window)))
+            assert results[0] == results[1], f"seed {seed}: bound {bounded.MAX_UNKNOWN_CITIES} changes the alert window"
+            payloads += 1
+    return f"{payloads} payloads give the same window with unknown names past the bound"
+
+
+class StubLiveServer:
+    """
+    An aiohttp-session stand-in for the live alerts endpoint: serves `body` with an ETag, answers
+    304 to a matching If-None-Match, and fails the body read of the next `read_failures` requests.
+    """
+    def __init__(self):
+        self.body, self.version, self.read_failures = b"", 0, 0
+        self.requests = [] # Request headers
+
+    def publish(self, body):
+        self.body, self.version = body, self.version + 1
+
+    @property
+    def etag(self):
+        return f'"v{self.version}"'
+
+    @contextlib.asynccontextmanager
+    async def get(self, url, headers=None):
+        self.requests.append(dict(headers or {}))
+        server = self
+        not_modified = (headers or {}).get("If-None-Match") == self.etag
+        fail = self.read_failures > 0 and not not_modified
+        self.read_failures -= fail
+
+        class Response:
+            status = 304 if not_modified else 200
+            headers = {"Content-Type": "application/json", "ETag": server.etag}
+            body = server.body
+            def raise_for_status(self): pass
+            async def read(self):
+                if fail:
+                    raise aiohttp.ClientPayloadError("Response payload is not completed")
+                return self.body
+        yield Response()
+
+
+@contextlib.contextmanager
+def no_retry_sleep():
+    """Makes the client's retry back-off instant."""
+    sleep = asyncio.sleep
+    async def instant(delay, result=None):
+        return await sleep(0, result)
+    asyncio.sleep = instant
+    try:
+        yield
+    finally:
+        asyncio.sleep = sleep
+
+
+def check_live_polling(module, seeds):
+    """
+    OrefAPIClient.get_live_alerts' conditional requests: whenever it reports a healthy poll (live_ok),
+    its result must be the server's current body, including after a failed body read or an invalid
+    body (which must not leave validators behind for a 304 to reuse).
+    """
+    alerts = [
+        b"",
+        json.dumps({"id": "1", "cat": "1", "title": "ירי רקטות וטילים", "data": ["שדרות"], "desc": ""}, ensure_ascii=False).encode("utf-8-sig"),
+        json.dumps({"id": "2", "cat": "1", "title": "ירי רקטות וטילים", "data": ["שדרות", "נתיבות"], "desc": ""}, ensure_ascii=False).encode("utf-8"),
+        b"\r\n",
+    ]
+    invalid = [b'{"id": "3", "data": [', b"\xff\xfe{}"] # Truncated JSON, undecodable bytes
+    polls = conditional = 0
+    with no_retry_sleep():
+        # Scripted: the body read fails after the headers arrived, and the retry must not get a 304
+        server = StubLiveServer()
+        client = module.OrefAPIClient(server, {"live": "https://stub/alerts.json"}, lambda *args, **kwargs: None)
+        server.publish(alerts[0])
+        asyncio.run(client.get_live_alerts())
+        server.publish(alerts[1])
+        server.read_failures = 1
+        result = asyncio.run(client.get_live_alerts())
+        assert result == json.loads(alerts[1].decode("utf-8-sig")) and client.live_ok, f"read failure then retry: got {result}"
+
+        for seed in range(seeds):
+            rng = random.Random(seed)
+            server = StubLiveServer()
+            client = module.OrefAPIClient(server, {"live": "https://stub/alerts.json"}, lambda *args, **kwargs: None)
+            for step in range(40):
+                r = rng.random()
+                if r < 0.4: server.publish(rng.choice(alerts))
+                elif r < 0.5: server.publish(rng.choice(invalid))
+                failures = server.read_failures = rng.choice([0, 0, 0, 1, 2, 3]) # 3 exhausts the client's retries
+                sent_before = len(server.requests)
+                result = asyncio.run(client.get_live_alerts())
+                polls += 1
+                conditional += any("If-None-Match" in h for h in server.requests[sent_before:])
+                attempts, failed = len(server.requests) - sent_before, failures - server.read_failures
+
+                try:
+                    text = server.body.decode("utf-8-sig")
+                    expected = json.loads(text) if text.strip() else None
+                    valid = True
+                except ValueError:
+                    expected, valid = None, False
+                ok = attempts > failed and valid # The last attempt got the body (or a 304), and it parses
+                assert client.live_ok == ok, f"seed {seed} step {step}: live_ok {client.live_ok}, expected {ok}"
+                assert result == (expected if ok else None), f"seed {seed} step {step}: got {result}, server has {server.body[:60]!r}"
+    return f"{polls} polls match the server ({conditional} sent validators)"
+
+
+class FakeTimers:
+    """Virtual time for code that reads a clock and schedules with loop.call_later (patched on the running loop)."""
+    class Handle:
+        def __init__(self, when, callback, args):
+            self.when, self.callback, self.args, self.cancelled = when, callback, args, False
+        def cancel(self):
+            self.cancelled = True
+
+    def __init__(self, start=0.0):
+        self.now, self.pending = start, []
+
+    def clock(self):
+        return self.now
+
+    def call_later(self, delay, callback, *args, context=None):
+        handle = self.Handle(self.now + delay, callback, args)
+        self.pending.append(handle)
+        return handle
+
+    async def advance(self, to):
+        """Runs the timers due by `to` in time order (and the tasks they start), then sets the clock to `to`."""
+        while True:
+            due = [h for h in self.pending if not h.cancelled and h.when <= to]
+            if not due:
+                break
+            handle = min(due, key=lambda h: h.when)
+            self.pending.remove(handle)
+            self.now = max(self.now, handle.when)
+            handle.callback(*handle.args)
+            await asyncio.sleep(0)
+        self.now = to
+
+
+def check_events(module, seeds):
+    """
+    AlertEventEmitter's debouncing on a virtual clock: every new city is fired exactly once, under its
+    title, at most `debounce` seconds after it arrived; an idle emitter fires at once; events of one
+    title are at least `debounce` apart unless a different title flushed them; merged events carry
+    the latest payload's fields and all their cities and areas.
+    """
+    titles = ["ירי רקטות וטילים", "חדירת כלי טיס עוין", "בדקות הקרובות צפויות להתקבל התרעות באזורך"]
+    def area(city):
+        return f"area-{int(city.split('-')[1]) // 5}"
+    events = payloads = immediate = 0
+
+    async def run(rng):
+        timers = FakeTimers(rng.uniform(0, 1e5))
+        asyncio.get_running_loop().call_later = timers.call_later
+        fired = []
+        async def fire_event(event, **data):
+            fired.append((timers.now, event, data))
+        debounce = rng.choice([0.5, 2.0, 5.0])
+        emitter = module.AlertEventEmitter(fire_event, "red_alert_event", lambda *args, **kwargs: None, debounce, clock=timers.clock)
+
+        sent, next_city, title = [], 0, titles[0]
+        for n in range(rng.randint(1, 60)):
+            await timers.advance(timers.now + rng.choice([0, rng.uniform(0, debounce), rng.uniform(debounce, 3 * debounce)]))
+            if rng.random() < 0.2:
+                title = rng.choice(titles)
+            count = rng.choice([0, 1, 1, 3, 40])
+            cities = [f"city-{c}" for c in range(next_city, next_city + count)]
+            next_city += count
+            payload = {"id": n, "category": rng.randint(1, 14), "title": title, "cities": cities, "description": f"desc {n}",
+                       "timestamp": timers.now, "alerts_count": n + 1, "is_test": False}
+            emitter.emit(payload, {area(c) for c in cities})
+            await asyncio.sleep(0)
+            if cities:
+                sent.append((timers.now, payload))
+        await timers.advance(timers.now + debounce)
+        emitter.flush()
+        await asyncio.sleep(0)
+        return debounce, sent, fired, emitter
+
+    for seed in range(seeds):
+        debounce, sent, fired, emitter = asyncio.run(run(random.Random(seed)))
+        assert emitter.fired == len(fired) and emitter.merged == len(sent) - len(fired), f"seed {seed}: counters {emitter.fired}/{emitter.merged}"
+        assert all(event == "red_alert_event" for _, event, _ in fired)
+
+        fired_at = {}
+        for at, _, data in fired:
+            for city in data["cities"]:
+                assert city not in fired_at, f"seed {seed}: {city} fired twice"
+                fired_at[city] = (at, data)
+        for i, (arrived, payload) in enumerate(sent):
+            for city in payload["cities"]:
+                assert city in fired_at, f"seed {seed}: {city} was never fired"
+                at, data = fired_at[city]
+                assert data["title"] == payload["title"], f"seed {seed}: {city} fired under another title"
+                assert arrived <= at <= arrived + debounce + 1e-9, f"seed {seed}: {city} arrived at {arrived}, fired at {at}"
+            if all(fired_at[c][0] <= arrived - debounce for _, earlier in sent[:i] for c in earlier["cities"]):
+                assert fired_at[payload["cities"][0]][0] == arrived, f"seed {seed}: an idle emitter delayed payload {payload['id']}"
+                immediate += 1
+
+        arrivals = {}
+        for arrived, payload in sent:
+            arrivals.setdefault(arrived, set()).add(payload["title"])
+        for (before, _, first), (at, _, data) in zip(fired, fired[1:]):
+            flushed = any(title != data["title"] for title in arrivals.get(at, ())) # A new title flushes the pending event
+            assert at - before >= debounce - 1e-9 or flushed, f"seed {seed}: events {at - before:.3f} s apart"
+        for at, _, data in fired:
+            merged = [p for _, p in sent if fired_at[p["cities"][0]][1] is data]
+            assert data["cities"] == [c for p in merged for c in p["cities"]], f"seed {seed}: merged cities differ"
+            assert data["areas"] == ", ".join(sorted({area(c) for c in data["cities"]})), f"seed {seed}: areas differ"
+            latest = merged[-1]
+            assert all(data[k] == latest[k] for k in ("id", "category", "description", "timestamp", "alerts_count")), f"seed {seed}: stale fields"
+        events += len(fired)
+        payloads += len(sent)
+    return f"{payloads} payloads fired as {events} debounced events ({immediate} at once)"
+
+
+def check_poll_scheduler(module, seeds):
+    """
+    PollScheduler on a virtual clock, driven like _poll_and_schedule_next: ticks start (a little late)
+    at their deadlines, polls take random time and the client's consecutive_errors comes from a stub
+    server that sometimes fails. Each deadline must be the previous one plus the expected period
+    (fast within fast_window of an alert, idle otherwise, backed off on errors), with overruns
+    counted as missed and re-anchored, and the jitter must match how late the ticks started. A
+    scripted run checks the drift and the exact periods.
+    """
+    def expected_period(sched, now, last_active, errors):
+        fast = last_active is not None and now - last_active <= sched.fast_window
+        period = sched.fast_interval if fast else sched.idle_interval
+        if errors:
+            period = max(period, min(sched.interval * 2 ** min(errors, 8), max(30, sched.idle_interval)))
+        return period
+
+    # Scripted: 5 s interval, 300 ms polls. The old re-schedule-after-poll loop drifted to 5.3 s.
+    now = [1000.0]
+    sched = module.PollScheduler(5, 2, 5, 20, clock=lambda: now[0])
+    deadline = now[0] + sched.start(0)
+    periods = []
+    for tick in range(150):
+        now[0] = deadline
+        sched.tick_started()
+        now[0] += 0.3
+        errors = max(0, tick - 139) # Errors on the last ten ticks
+        deadline = now[0] + sched.next_delay(100 <= tick < 110, errors)
+        periods.append(sched.period)
+        if tick == 99:
+            assert abs(deadline - (1000.0 + 100 * 5)) < 1e-6, f"100 idle ticks ended at {deadline - 1000.0:.3f} s, not 500 s"
+    assert periods[100:110] == [2] * 10, f"periods during the alert: {periods[100:110]}"
+    assert periods[110:120] == [2] * 10 and periods[120:140] == [5] * 20, f"periods after the alert: {periods[110:140]}"
+    assert periods[140:] == [10, 20, 30, 30, 30, 30, 30, 30, 30, 30], f"back-off periods: {periods[140:]}"
+    assert sched.missed == 0 and sched.ticks == 150, sched.stats()
+
+    async def run(seed, rng):
+        interval = rng.choice([1, 2, 5, 10])
+        fast_interval = min(rng.choice([1, 2]), interval)
+        idle_interval = rng.choice([interval, interval * 3, 60])
+        now = [rng.uniform(0, 1e6)]
+        sched = module.PollScheduler(interval, fast_interval, idle_interval, rng.choice([10, 60, 600]), clock=lambda: now[0])
+        server = StubLiveServer()
+        client = module.OrefAPIClient(server, {"live": "https://stub/alerts.json"}, lambda *args, **kwargs: None)
+        deadline = now[0] + sched.start(rng.uniform(0, 5))
+        last_active, active, outage, streak, overruns, backed_off, max_late = None, False, False, 0, 0, 0, 0.0
+        for tick in range(200):
+            late = rng.choice([0, 0, rng.uniform(0, 0.05)]) # run_in fires a little late
+            now[0] = deadline + late
+            max_late = max(max_late, late)
+            sched.tick_started()
+            if rng.random() < 0.1:
+                outage = not outage
+            if outage:
+                server.publish(server.body) # A new ETag, so the failing requests are not answered with a 304
+            server.read_failures = 3 if outage else 0 # 3 exhausts the client's retries
+            await client.get_live_alerts()
+            streak = streak + 1 if outage else 0
+            assert client.consecutive_errors == streak, f"seed {seed} tick {tick}: {client.consecutive_errors} consecutive errors, expected {streak}"
+            now[0] += rng.uniform(0, 2 * idle_interval) if rng.random() < 0.05 else rng.uniform(0, 0.5)
+            if rng.random() < 0.05:
+                active = not active
+            if active:
+                last_active = now[0]
+
+            period = expected_period(sched, now[0], last_active, client.consecutive_errors)
+            delay = sched.next_delay(active, client.consecutive_errors)
+            expected = deadline + period
+            if expected <= now[0]:
+                expected = now[0]
+                overruns += 1
+            assert sched.period == period, f"seed {seed} tick {tick}: period {sched.period}, expected {period}"
+            assert delay >= 0 and abs(now[0] + delay - expected) < 1e-6, f"seed {seed} tick {tick}: next tick in {delay:.3f} s, expected {expected - now[0]:.3f}"
+            deadline = expected
+            backed_off += client.consecutive_errors > 0
+        assert sched.missed == overruns and sched.ticks == 200, f"seed {seed}: {sched.stats()}, {overruns} overruns"
+        assert abs(sched.max_jitter_ms - max_late * 1000) < 1e-3, f"seed {seed}: max jitter {sched.max_jitter_ms} ms, ticks were up to {max_late * 1000} ms late"
+        return overruns, backed_off
+
+    ticks = missed = backed_off = 0
+    with no_retry_sleep():
+        for seed in range(seeds):
+            overruns, errors = asyncio.run(run(seed, random.Random(seed)))
+            ticks += 200
+            missed += overruns
+            backed_off += errors
+    return f"{ticks} ticks on the expected deadlines ({missed} overruns, {backed_off} backed off)"
+
+
+def check_mqtt(module, seeds):
+    """
+    MQTT publishing end to end: replays fixtures with `mqtt` set and checks every mqtt.publish call
+    (topic, not retained, payload) against the fixture's distinct payloads, the all-clear included.
+    `seeds` is unused: the fixtures are fixed.
+    """
+    published = 0
+    for name, mqtt, topic in (("regional_salvo", True, "home/red_alert/event"), ("single_city", "alerts/custom", "alerts/custom")):
+        with open(os.path.join(FIXTURES_DIR, f"{name}.json"), encoding="utf-8") as f:
+            fixture = json.load(f)
+        fixture["config"] = {**fixture.get("config", {}), "mqtt": mqtt}
+        messages = asyncio.run(replay(module, fixture, 0, False, False))["mqtt"]
+
+        expected, last = [], None
+        for step in fixture["steps"]:
+            payload = step["payload"]
+            if not payload or (payload["id"], frozenset(payload["data"])) == last:
+                continue # Repeats of the same alert id and cities are published once
+            last = (payload["id"], frozenset(payload["data"]))
+            expected.append({"id": int(payload["id"]), "category": int(payload["cat"]), "title": payload["title"],
+                             "data": [c for c in payload["data"] if "בדיקה" not in c and "תרגיל" not in c], "desc": payload["desc"]})
+        assert any("האירוע הסתיים" in e["title"] for e in expected) or name != "regional_salvo", f"{name}: the fixture has no all-clear"
+
+        assert len(messages) == len(expected), f"{name}: {len(messages)} MQTT messages, expected {len(expected)}"
+        for message, want in zip(messages, expected):
+            assert message["topic"] == topic, f"{name}: published to {message['topic']!r}, expected {topic!r}"
+            assert message.get("retain") is False, f"{name}: messages must not be retained ({message.get('retain')!r})"
+            payload = json.loads(message["payload"])
+            assert re.fullmatch(r"\d{4}-\d\d-\d\d \d\d:\d\d:\d\d", payload.pop("alertDate")), f"{name}: bad alertDate"
+            assert payload == want, f"{name}: payload {str(payload)[:120]} differs from {str(want)[:120]}"
+            published += 1
+    return f"{published} MQTT messages match the replayed payloads"
+
+
+CHECKS = {
+    "json_stream": check_json_stream,
+    "history": check_history,
+    "journal": check_journal,
+    "live_polling": check_live_polling,
+    "unknown_cities": check_unknown_cities,
+    "poll_scheduler": check_poll_scheduler,
+    "mqtt": check_mqtt,
+    "events": check_events,
+}
+
+
+# ----------------------------------------------------------------------
+# Main
+# ----------------------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("checks", nargs="*", metavar="check", help=f"checks to run: {', '.join(CHECKS)} (default: all)")
+    parser.add_argument("--seeds", type=int, default=200, help="random cases per check")
+    args = parser.parse_args()
+    unknown = set(args.checks) - set(CHECKS)
+    if unknown:
+        parser.error(f"unknown check(s): {', '.join(sorted(unknown))}")
+
+    module = import_app_module()
+    failed = 0
+    for name in args.checks or list(CHECKS):
+        started = time.perf_counter()
+        try:
+            summary = CHECKS[name](module, args.seeds)
+        except Exception as e:
+            failed += 1
+            print(f"FAIL {name}: {e if isinstance(e, AssertionError) else repr(e)}")
+            continue
+        print(f"ok   {name}: {summary} ({time.perf_counter() - started:.1f} s)")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Regenerates the replay fixtures in benchmarks/fixtures/ from apps/red_alerts_israel/lamas_data.json.
+
+    python benchmarks/make_fixtures.py
+
+The output is deterministic (fixed seed and ids), so the checked-in fixtures only change when the
+Lamas city list does. See replay.py for the fixture format.
+"""
+import json
+import os
+import random
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMAS_PATH = os.path.join(ROOT, "apps", "red_alerts_israel", "lamas_data.json")
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+ROCKETS = ("1", "ירי רקטות וטילים", "היכנסו למרחב המוגן ושהו בו 10 דקות")
+DRONE = ("6", "חדירת כלי טיס עוין", "היכנסו למרחב המוגן ושהו בו 10 דקות")
+PRE_ALERT = ("14", "בדקות הקרובות צפויות להתקבל התרעות באזורך", "על תושבי האזורים הבאים לשפר את המיקום למיגון המיטבי בקרבתך")
+ALL_CLEAR = ("13", "האירוע הסתיים", "השוהים במרחב המוגן יכולים לצאת")
+
+
+def payload(alert_id, kind, cities):
+    cat, title, desc = kind
+    return {"id": str(alert_id), "cat": cat, "title": title, "data": list(cities), "desc": desc}
+
+
+def step(alert, polls):
+    return {"payload": alert, "polls": polls}
+
+
+def write_fixture(name, fixture):
+    path = os.path.join(FIXTURES_DIR, f"{name}.json")
+    steps = fixture.pop("steps")
+    with open(path, "w", encoding="utf-8") as f:
+        head = json.dumps(fixture, ensure_ascii=False, indent=2)[:-2]
+        f.write(head + ',\n  "steps": [\n')
+        f.write(",\n".join("    " + json.dumps(s, ensure_ascii=False) for s in steps))
+        f.write("\n  ]\n}\n")
+    print(f"{path}: {len(steps)} steps, {os.path.getsize(path)} bytes")
+
+
+def main():
+    with open(LAMAS_PATH, encoding="utf-8-sig") as f:
+        areas = {area: list(cities) for area, cities in json.load(f)["areas"].items()}
+    all_cities = [c for cities in areas.values() for c in cities]
+    rng = random.Random(20231007)
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+
+    city = areas["קו העימות"][0]
+    write_fixture("single_city", {
+        "description": "One city on the northern border, repeated for the life of the alert, then quiet.",
+        "poll_interval": 2,
+        "config": {"city_names": [city], "timer": 30},
+        "history_synthetic": {"count": 50, "hours": 4},
+        "steps": [
+            step(None, 3),
+            step(payload(133700000000000001, ROCKETS, [city]), 8),
+            step(None, 20),
+        ],
+    })
+
+    envelope = areas["עוטף עזה"]
+    western_negev = areas["מערב הנגב"]
+    write_fixture("regional_salvo", {
+        "description": "Gaza envelope salvo growing into the western Negev, a drone alert, then all-clear.",
+        "poll_interval": 2,
+        "config": {"city_names": [envelope[0], western_negev[5]], "timer": 60},
+        "history_synthetic": {"count": 400, "hours": 12},
+        "steps": [
+            step(None, 2),
+            step(payload(133700000000000101, ROCKETS, envelope[:20]), 3),
+            step(payload(133700000000000102, ROCKETS, envelope[20:]), 3),
+            step(payload(133700000000000103, ROCKETS, western_negev), 4),
+            step(payload(133700000000000103, ROCKETS, western_negev[:15]), 2),
+            step(payload(133700000000000104, DRONE, rng.sample(envelope, 6)), 3),
+            step(payload(133700000000000105, ALL_CLEAR, envelope + western_negev), 2),
+            step(None, 40),
+        ],
+    })
+
+    shuffled = all_cities[:]
+    rng.shuffle(shuffled)
+    waves = [shuffled[i::4] for i in range(4)]
+    write_fixture("national_barrage", {
+        "description": "Nationwide pre-alert, four waves covering all 1,554 cities, expiry, then all-clear.",
+        "poll_interval": 2,
+        "config": {"city_names": [areas["גוש דן"][0], areas["השפלה"][3], areas["גליל עליון"][7]], "timer": 120},
+        "history_synthetic": {"count": 2000, "hours": 24},
+        "steps": [
+            step(None, 2),
+            step(payload(133700000000000201, PRE_ALERT, shuffled[:1200]), 3),
+            step(payload(133700000000000202, ROCKETS, waves[0]), 2),
+            step(payload(133700000000000203, ROCKETS, waves[1]), 2),
+            step(payload(133700000000000204, ROCKETS, waves[2]), 2),
+            step(payload(133700000000000205, ROCKETS, waves[3]), 2),
+            step(payload(133700000000000205, ROCKETS, waves[3][:120]), 2),
+            step(payload(133700000000000206, ALL_CLEAR, all_cities), 2),
+            step(None, 70),
+        ],
+    })
+
+
+if __name__ == "__main__":
+    main()
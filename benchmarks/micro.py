@@ -0,0 +1,601 @@
+"""
+Micro-benchmarks for the optimized hot paths of red_alerts_israel.
+
+Each benchmark first checks, on randomized inputs, that the current app code (imported with the same
+AppDaemon stub as replay.py) gives the same output as the implementation it replaced, which is kept
+here verbatim as the reference, and then times both. The numbers quoted in the commit messages come
+from these runs; absolute timings depend on the machine, the ratios should not.
+
+    python benchmarks/micro.py                   # every benchmark
+    python benchmarks/micro.py clustering        # one benchmark
+    python benchmarks/micro.py --seeds 500 --repeat 50
+
+Timings are the median of --repeat runs, in ms per call. Exits with status 1 if an equivalence
+check fails.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from checks import FakeClock, fake_clock, load_lamas
+from replay import APP_DIR, import_app_module
+
+
+def median_ms(func, repeat):
+    """Median wall time of `repeat` calls to func(), in ms."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def load_lamas_json():
+    with open(os.path.join(APP_DIR, "lamas_data.json"), encoding="utf-8-sig") as f:
+        return json.load(f)
+
+
+def lamas_points(lamas_data):
+    """The (lon, lat) of every Lamas city, in file order."""
+    return [(float(d["long"]), float(d["lat"])) for cities in lamas_data["areas"].values()
+            for d in cities.values() if "lat" in d and "long" in d]
+
+
+def map_app(module, lamas):
+    """Just enough of a Red_Alerts_Israel instance to call generate_smart_alert_map, without the cache."""
+    app = SimpleNamespace(lamas_manager=lamas)
+    app._render_alert_map = lambda fingerprint: module.Red_Alerts_Israel._render_alert_map_uncached(app, fingerprint)
+    return app
+
+
+# ----------------------------------------------------------------------
+# Map clustering
+# ----------------------------------------------------------------------
+def monotone_chain_hull(points):
+    """get_convex_hull as it was before the map optimizations, so the references do not use app code."""
+    n = len(points)
+    if n <= 2: return points
+    points.sort()
+    def cross_product(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+    lower = []
+    for p in points:
+        while len(lower) >= 2 and cross_product(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    upper = []
+    for p in reversed(points):
+        while len(upper) >= 2 and cross_product(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return lower[:-1] + upper[:-1]
+
+
+def pairwise_clusters(points, threshold):
+    """The clustering scan generate_smart_alert_map used before cluster_points()."""
+    clusters = []
+    for p in points:
+        found = False
+        for cluster in clusters:
+            if any(math.sqrt((p[0]-cp[0])**2 + (p[1]-cp[1])**2) < threshold for cp in cluster):
+                cluster.append(p)
+                found = True
+                break
+        if not found: clusters.append([p])
+    return clusters
+
+
+def baseline_map_url(alert_segments, lamas_data):
+    """generate_smart_alert_map before the grid index (names in, raw Lamas data), minus the logging."""
+    COLORS = {"pre": "ff9800", "active": "f44336", "clear": "4caf50"}
+    yandex_paths = []
+    all_coords_for_center = []
+    ignore_list = ["ברחבי הארץ", "כל הארץ", "ישראל", "לא ידוע"]
+
+    if not alert_segments:
+        return "https://static-maps.yandex.ru/1.x/?l=map&lang=he_IL&size=600,450&ll=34.852,31.046&z=7"
+
+    def is_point_in_poly(x, y, poly):
+        n = len(poly)
+        inside = False
+        if n < 3: return False
+        p1x, p1y = poly[0]
+        for i in range(n + 1):
+            p2x, p2y = poly[i % n]
+            if y > min(p1y, p2y):
+                if y <= max(p1y, p2y):
+                    if x <= max(p1x, p2x):
+                        if p1y != p2y:
+                            xints = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
+                        if p1x == p2x or x <= xints:
+                            inside = not inside
+            p1x, p1y = p2x, p2y
+        return inside
+
+    merged_cities = defaultdict(set)
+    for segment in alert_segments:
+        seg_type = segment.get("type", "active")
+        for city in segment.get("cities", []):
+            if city not in ignore_list:
+                merged_cities[seg_type].add(city)
+
+    coords_by_type = defaultdict(set)
+    for seg_type, cities in merged_cities.items():
+        if lamas_data and "areas" in lamas_data:
+            for area_cities in lamas_data["areas"].values():
+                for city_name in cities:
+                    if city_name in area_cities:
+                        d = area_cities[city_name]
+                        if "lat" in d and "long" in d:
+                            p = (float(d["long"]), float(d["lat"]))
+                            coords_by_type[seg_type].add(p)
+                            all_coords_for_center.append(p)
+
+    if "clear" in coords_by_type:
+        coords_by_type["active"] -= coords_by_type["clear"]
+        coords_by_type["pre"] -= coords_by_type["clear"]
+    if "active" in coords_by_type:
+        coords_by_type["pre"] -= coords_by_type["active"]
+
+    DIST_THRESHOLD = 0.30
+
+    for seg_type in ["pre", "active", "clear"]:
+        points = list(coords_by_type[seg_type])
+        if not points: continue
+
+        clusters = pairwise_clusters(points, DIST_THRESHOLD)
+
+        hulls_candidates = []
+        for cluster in clusters:
+            expanded = []
+            for lon, lat in cluster:
+                for angle in range(0, 360, 72):
+                    rad = math.radians(angle)
+                    expanded.append((lon + 0.015 * math.cos(rad), lat + 0.015 * math.sin(rad)))
+            h = monotone_chain_hull(expanded)
+            if h: hulls_candidates.append({'hull': h, 'cluster': cluster})
+
+        hulls_candidates.sort(key=lambda x: len(x['cluster']), reverse=True)
+
+        color_hex = COLORS.get(seg_type, "f44336")
+        final_type_paths = []
+
+        for i, data in enumerate(hulls_candidates):
+            is_contained = False
+            for j, target in enumerate(hulls_candidates):
+                if i <= j: continue
+
+                c_lon = sum(p[0] for p in data['cluster']) / len(data['cluster'])
+                c_lat = sum(p[1] for p in data['cluster']) / len(data['cluster'])
+
+                if is_point_in_poly(c_lon, c_lat, target['hull']):
+                    is_contained = True
+                    break
+
+            if not is_contained:
+                hull = data['hull']
+                if len(hull) > 12: hull = hull[::len(hull)//12 + 1]
+
+                path_pts = [f"{round(p[0], 3)},{round(p[1], 3)}" for p in hull]
+                path_pts.append(path_pts[0])
+                final_type_paths.append(f"c:{color_hex}ff,f:{color_hex}66,w:2,{','.join(path_pts)}")
+
+        yandex_paths.extend(final_type_paths)
+
+    if not all_coords_for_center:
+        return "https://static-maps.yandex.ru/1.x/?l=map&lang=he_IL&size=600,450&ll=34.852,31.046&z=7"
+
+    lons, lats = [p[0] for p in all_coords_for_center], [p[1] for p in all_coords_for_center]
+    avg_lon, avg_lat = round(sum(lons)/len(lons), 3), round(sum(lats)/len(lats), 3)
+    lat_diff, lon_diff = max(lats)-min(lats), max(lons)-min(lons)
+
+    if lat_diff > 1.2 or lon_diff > 1.2: z = 7
+    elif lat_diff > 0.5 or lon_diff > 0.5: z = 8
+    elif lat_diff > 0.2 or lon_diff > 0.2: z = 9
+    elif lat_diff > 0.05 or lon_diff > 0.05: z = 10
+    else: z = 11
+
+    url = f"https://static-maps.yandex.ru/1.x/?l=map&lang=he_IL&size=600,450&ll={avg_lon},{avg_lat}&z={z}"
+    if yandex_paths:
+        url += "&pl=" + "~".join(yandex_paths[:7])
+
+    return url
+
+
+def random_points(rng, count):
+    """Synthetic points that stress the grid: cell-boundary and exactly-threshold-apart coordinates, duplicates."""
+    step = rng.choice([0.15, 0.3, 0.05, None])
+    points = []
+    for _ in range(count):
+        if step and rng.random() < 0.7:
+            p = (rng.randint(-20, 20) * step, rng.randint(-20, 20) * step)
+        else:
+            p = (rng.uniform(-3, 3), rng.uniform(-3, 3))
+        points.append(p)
+        if rng.random() < 0.05:
+            points.append(p)
+    return points
+
+
+def bench_clustering(module, seeds, repeat):
+    """cluster_points() against the pairwise scan, and the map URLs against the old generate_smart_alert_map."""
+    lamas, names = load_lamas(module)
+    lamas_data = load_lamas_json()
+    all_points = lamas_points(lamas_data)
+    app = map_app(module, lamas)
+
+    for seed in range(seeds):
+        rng = random.Random(seed)
+        points = rng.sample(all_points, rng.randint(1, len(all_points))) if seed % 2 else random_points(rng, rng.randint(1, 400))
+        threshold = 0.30 if seed % 3 else rng.choice([0.05, 0.3, 1.0])
+        assert module.cluster_points(points, threshold) == pairwise_clusters(points, threshold), f"seed {seed}: clusters differ"
+
+    for seed in range(max(1, seeds // 10)):
+        rng = random.Random(seed)
+        segments = [{"type": rng.choice(["pre", "active", "clear"]), "cities": rng.sample(names, rng.randint(1, len(names)))}
+                    for _ in range(rng.randint(1, 4))]
+        id_segments = [{"type": s["type"], "cities": [lamas.intern(c) for c in s["cities"]]} for s in segments]
+        old, new = baseline_map_url(segments, lamas_data), module.Red_Alerts_Israel.generate_smart_alert_map(app, id_segments)
+        assert old == new, f"seed {seed}: map URL differs\n  old {old[:200]}\n  new {new[:200]}"
+
+    lines = [f"{seeds} random point sets cluster identically, {max(1, seeds // 10)} random segment sets give the same map URL",
+             "clustering only, Lamas points (old scan / grid):"]
+    rng = random.Random(0)
+    for count in (50, 500, len(all_points)):
+        points = rng.sample(all_points, count)
+        old = median_ms(lambda: pairwise_clusters(points, 0.30), repeat)
+        new = median_ms(lambda: module.cluster_points(points, 0.30), repeat)
+        lines.append(f"  {count:>5,}: {old:.2f} / {new:.2f} ms")
+    return lines
+
+
+# ----------------------------------------------------------------------
+# Map hulls
+# ----------------------------------------------------------------------
+def trig_expanded_hull(cluster):
+    """The hull expansion _render_alert_map did before expanded_hull(): trigonometry for every city."""
+    expanded = []
+    for lon, lat in cluster:
+        for angle in range(0, 360, 72):
+            rad = math.radians(angle)
+            expanded.append((lon + 0.015 * math.cos(rad), lat + 0.015 * math.sin(rad)))
+    return monotone_chain_hull(expanded)
+
+
+def random_cluster(rng, all_points):
+    """Lamas subsets, or synthetic clusters that are rounded (duplicates, collinear runs) or degenerate."""
+    kind = rng.choice(["lamas", "rounded", "line", "same", "uniform"])
+    count = rng.choice([1, 2, 3, 12, 13, 50, 400])
+    if kind == "lamas":
+        return rng.sample(all_points, count)
+    if kind == "rounded":
+        return [(round(rng.uniform(34, 35), 2), round(rng.uniform(31, 32), 2)) for _ in range(count)]
+    if kind == "line":
+        return [(34 + i * 0.01, 31 + i * 0.02) for i in range(count)]
+    if kind == "same":
+        return [(34.5, 31.5)] * count
+    return [(rng.uniform(34, 35), rng.uniform(31, 32)) for _ in range(count)]
+
+
+def bench_hulls(module, seeds, repeat):
+    """expanded_hull() (pure Python and NumPy) against the per-city trigonometry, and uncached map renders."""
+    np = module.np
+    lamas, names = load_lamas(module)
+    all_points = lamas_points(load_lamas_json())
+    clusters = 0
+    for seed in range(seeds * 5):
+        rng = random.Random(seed)
+        cluster = random_cluster(rng, all_points)
+        expected = trig_expanded_hull(cluster)
+        module.np = None
+        try:
+            assert module.expanded_hull(cluster) == expected, f"seed {seed}: the pure-Python hull differs"
+        finally:
+            module.np = np
+        if np is not None:
+            assert module.expanded_hull(cluster) == expected, f"seed {seed}: the NumPy hull differs"
+            points = [(p[0] + dx, p[1] + dy) for p in cluster for dx, dy in module._EXPANSION_OFFSETS]
+            assert module._convex_hull_np(points) == monotone_chain_hull(list(points)), f"seed {seed}: _convex_hull_np differs"
+        clusters += 1
+
+    app = map_app(module, lamas)
+    rng = random.Random(0)
+    lines = [f"{clusters} random clusters give the same hull with {'both backends' if np is not None else 'pure Python (NumPy is not installed)'}",
+             f"uncached _render_alert_map, ms per render (per-city trigonometry / pure Python now{' / NumPy' if np is not None else ''}):"]
+    expanded_hull = module.expanded_hull
+    def render_ms(fingerprint, hull_func, with_np):
+        module.expanded_hull, module.np = hull_func, (np if with_np else None)
+        try:
+            return median_ms(lambda: module.Red_Alerts_Israel._render_alert_map_uncached(app, fingerprint), repeat)
+        finally:
+            module.expanded_hull, module.np = expanded_hull, np
+    for count in (200, 800, len(names)):
+        fingerprint = (("active", frozenset(lamas.intern(c) for c in rng.sample(names, count))),)
+        timings = [render_ms(fingerprint, trig_expanded_hull, False), render_ms(fingerprint, expanded_hull, False)]
+        if np is not None:
+            timings.append(render_ms(fingerprint, expanded_hull, True))
+        lines.append(f"  {count:>5} cities: {' / '.join(f'{t:.1f}' for t in timings)}")
+    if np is not None:
+        module.np = None
+        try:
+            pure = median_ms(lambda: expanded_hull(all_points), repeat)
+        finally:
+            module.np = np
+        lines.append(f"hull of all {len(all_points):,} cities alone: {pure:.1f} ms pure Python, {median_ms(lambda: expanded_hull(all_points), repeat):.1f} ms NumPy")
+    return lines
+
+
+# ----------------------------------------------------------------------
+# History storage
+# ----------------------------------------------------------------------
+def list_insert(history, alerts, cutoff, max_events):
+    """HistoryManager.update_history's storage before the deque: append, re-sort, then prune."""
+    history.extend(alerts)
+    history.sort(key=lambda x: x.get('time', datetime.min), reverse=True)
+    return list_prune(history, cutoff, max_events)
+
+
+def list_prune(history, cutoff, max_events):
+    """_prune_and_limit before the deque: rebuild the list, then cap it."""
+    history = [a for a in history if isinstance(a.get('time'), datetime) and a['time'] >= cutoff]
+    if len(history) > max_events:
+        history = history[:max_events]
+    return history
+
+
+def bench_history(module, seeds, repeat):
+    """HistoryManager's newest-first deque (insert, O(1) expiry, cap) against the re-sorted list it replaced."""
+    lamas, names = load_lamas(module)
+    log = lambda *args, **kwargs: None
+    steps = 0
+    for seed in range(seeds):
+        rng = random.Random(seed)
+        hours = rng.choice([1, 4])
+        with fake_clock(module, datetime(2026, 3, 1, 12, 0, 0)):
+            hm = module.HistoryManager(hours, lamas, log, 120)
+            max_events = hm._max_history_events = rng.choice([20, 200, 2000])
+            hm._history_list = deque(maxlen=max_events)
+            history = []
+            for step in range(rng.randint(10, 60)):
+                r = rng.random()
+                if r < 0.15:
+                    FakeClock.current -= timedelta(seconds=rng.uniform(1, hours * 3600)) # The clock went backwards
+                elif r < 0.85:
+                    FakeClock.current += timedelta(seconds=rng.choice([0, rng.uniform(0, 60), rng.uniform(0, hours * 1800), hours * 3600]))
+                now = FakeClock.current
+                cutoff = now - timedelta(hours=hours)
+                if rng.random() < 0.7:
+                    alerts = [{"title": "ירי רקטות וטילים", "city": rng.choice(names), "area": "", "time": now}
+                              for _ in range(rng.choice([1, 5, 40]))]
+                    history = list_insert(history, alerts, cutoff, max_events)
+                    hm._insert_alerts(alerts, now)
+                else:
+                    history = list_prune(history, cutoff, max_events)
+                hm._prune_and_limit()
+                assert list(hm._history_list) == history, f"seed {seed} step {step}: the deque and the list differ"
+                steps += 1
+
+    lines = [f"{steps} random insert/prune steps (clock jumps and caps included) keep the same history",
+             "per-poll cost by history size (old list / deque):"]
+    for size in (100, 2000):
+        start = datetime.now()
+        alerts = [{"title": "ירי רקטות וטילים", "city": names[i % len(names)], "area": "", "time": start - timedelta(seconds=size - i)}
+                  for i in range(size)][::-1]
+        cutoff = start - timedelta(hours=4)
+        hm = module.HistoryManager(4, lamas, log, 120)
+        hm._reset_history(alerts)
+        hm.get_history_attributes() # Builds the merge index, as the app's first history update does
+        history = list(alerts)
+        prune_old = median_ms(lambda: list_prune(history, cutoff, 2000), repeat) * 1000
+        prune_new = median_ms(hm._prune_and_limit, repeat) * 1000
+        batch = lambda: [{"title": "ירי רקטות וטילים", "city": names[0], "area": "", "time": datetime.now()}]
+        update_old = median_ms(lambda: list_insert(history, batch(), cutoff, 2000), repeat) * 1000
+        update_new = median_ms(lambda: (hm._insert_alerts(batch(), datetime.now()), hm._prune_and_limit()), repeat) * 1000
+        lines.append(f"  {size:>5,}: idle prune {prune_old:.0f} / {prune_new:.0f} us, one-alert update {update_old:.0f} / {update_new:.0f} us")
+    return lines
+
+
+# ----------------------------------------------------------------------
+# Lamas cache
+# ----------------------------------------------------------------------
+LAMAS_LOAD_SCRIPT = """
+import asyncio, sys, time
+sys.path.insert(0, sys.argv[1])
+from replay import import_app_module
+module = import_app_module()
+lamas = module.LamasDataManager(sys.argv[2], None, None, lambda *args, **kwargs: None)
+async def load():
+    started = time.perf_counter()
+    assert await lamas.load_data()
+    return (time.perf_counter() - started) * 1000
+print(asyncio.run(load()))
+"""
+
+
+def lamas_state(lamas):
+    """Everything load_data builds, in comparable form."""
+    return (lamas._lamas_data, lamas._city_details_map, lamas._city_ids, lamas._area_names, lamas._city_names, lamas._city_display,
+            lamas._city_lons.tobytes(), lamas._city_lats.tobytes(), lamas._city_areas.tobytes())
+
+
+def load_counting(module, path):
+    """Loads the Lamas data at `path`; returns (manager, whether the JSON was processed instead of the cache used)."""
+    lamas = module.LamasDataManager(path, None, None, lambda *args, **kwargs: None)
+    processed = []
+    process = lamas._process_lamas_data
+    lamas._process_lamas_data = lambda raw: processed.append(True) or process(raw)
+    assert asyncio.run(lamas.load_data()), f"{path} did not load"
+    return lamas, bool(processed)
+
+
+def bench_lamas_cache(module, seeds, repeat):
+    """LamasDataManager.load_data from the binary cache against processing lamas_data.json, cold and warm."""
+    tmp = tempfile.mkdtemp(prefix="rai_lamas_")
+    try:
+        path = os.path.join(tmp, "lamas_data.json")
+        shutil.copy(os.path.join(APP_DIR, "lamas_data.json"), path)
+        cache = os.path.splitext(path)[0] + ".cache"
+
+        cold, processed = load_counting(module, path)
+        assert processed and os.path.exists(cache), "a cold load must process the JSON and write the cache"
+        warm, processed = load_counting(module, path)
+        assert not processed and lamas_state(warm) == lamas_state(cold), "a warm load must come from the cache, unchanged"
+
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        touched, processed = load_counting(module, path)
+        assert not processed and lamas_state(touched) == lamas_state(cold), "a touched source must reuse the cache"
+
+        version = module.LamasDataManager.CACHE_VERSION
+        module.LamasDataManager.CACHE_VERSION = version + 1
+        try:
+            bumped, processed = load_counting(module, path)
+        finally:
+            module.LamasDataManager.CACHE_VERSION = version
+        assert processed and lamas_state(bumped) == lamas_state(cold), "a new CACHE_VERSION must rebuild"
+        load_counting(module, path) # Back to a cache of the current version
+
+        with open(cache, "rb") as f:
+            good = f.read()
+        for seed in range(seeds):
+            rng = random.Random(seed)
+            blob = bytearray(good)
+            for _ in range(rng.choice([1, 1, 3])):
+                blob[rng.randrange(len(blob))] ^= 1 << rng.randrange(8)
+            if rng.random() < 0.1:
+                blob = blob[:rng.randrange(len(blob))] # Truncated
+            with open(cache, "wb") as f:
+                f.write(blob)
+            corrupted, processed = load_counting(module, path)
+            assert processed and lamas_state(corrupted) == lamas_state(cold), f"seed {seed}: a corrupted cache was used"
+
+        with open(path, encoding="utf-8-sig") as f:
+            data = json.load(f)
+        area = next(iter(data["areas"].values()))
+        city = next(iter(area.values()))
+        city["lat"] = str(float(city["lat"]) + 0.5)
+        with open(path, "w", encoding="utf-8-sig") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns)) # Same mtime, so only the size or hash can tell
+        edited, processed = load_counting(module, path)
+        fresh = os.path.join(tmp, "fresh")
+        os.mkdir(fresh)
+        shutil.copy(path, os.path.join(fresh, "lamas_data.json"))
+        rebuilt, _ = load_counting(module, os.path.join(fresh, "lamas_data.json"))
+        assert processed and lamas_state(edited) == lamas_state(rebuilt) != lamas_state(cold), "an edited source must rebuild"
+
+        shutil.copy(os.path.join(APP_DIR, "lamas_data.json"), path)
+        def timed_load():
+            out = subprocess.run([sys.executable, "-c", LAMAS_LOAD_SCRIPT, os.path.dirname(os.path.abspath(__file__)), path],
+                                 check=True, capture_output=True, text=True).stdout
+            return float(out)
+        cold_ms, warm_ms = [], []
+        for _ in range(repeat):
+            os.remove(cache)
+            cold_ms.append(timed_load())
+            warm_ms.append(timed_load())
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return [f"cold, warm, touched, re-versioned, edited and {seeds} corrupted caches load the same data as the JSON",
+            f"load_data in a fresh process, {len(cold._city_ids):,} cities (median, min-max of {repeat}):",
+            f"  cold (no cache, includes writing it): {statistics.median(cold_ms):.1f} ms ({min(cold_ms):.1f}-{max(cold_ms):.1f})",
+            f"  warm (cache hit):                     {statistics.median(warm_ms):.1f} ms ({min(warm_ms):.1f}-{max(warm_ms):.1f})"]
+
+
+# ----------------------------------------------------------------------
+# Configured-city matching
+# ----------------------------------------------------------------------
+def config_variant(rng, name):
+    """A city_names entry as users write them: exact, padded, quoted, or not a Lamas city at all."""
+    return rng.choice([name, name, f"{name} ", f" {name}", f'"{name}"', "עיר שלא קיימת"])
+
+
+def bench_city_match(module, seeds, repeat):
+    """The city_ids_self isdisjoint check against standardized-name sets and the old any-in-list scan."""
+    lamas, names = load_lamas(module)
+    standardize_name = module.standardize_name
+    differed = 0
+    for seed in range(seeds):
+        rng = random.Random(seed)
+        config = [config_variant(rng, c) if rng.random() < 0.3 else c for c in rng.sample(names, rng.choice([1, 5, 200]))]
+        window = rng.sample(names, rng.choice([1, 10, 500])) + rng.choice([[], ["עיר שלא קיימת"]])
+        config_std = {standardize_name(c) for c in config}
+        app = SimpleNamespace(lamas_manager=lamas, city_names_config=config, city_sensor="binary_sensor.red_alert_city", log=lambda *args, **kwargs: None)
+        module.Red_Alerts_Israel._validate_configured_cities(app)
+        city_ids_self = app.city_ids_self
+        window_ids = lamas.intern_all(standardize_name(c) for c in window)
+        expected = not config_std.isdisjoint(standardize_name(c) for c in window)
+        assert (not window_ids.isdisjoint(city_ids_self)) == expected, f"seed {seed}: the id check differs from the name check"
+        old = any(lamas.display_name(i) in config for i in window_ids) # The window's "cities" attribute against the raw list
+        if old != expected:
+            differed += 1
+            assert any(c != standardize_name(c) for c in config), f"seed {seed}: the old scan differed with canonical names"
+
+    rng = random.Random(0)
+    watched = rng.sample(names, 1500)
+    watched_std = {standardize_name(c) for c in watched}
+    watched_ids = lamas.intern_all(watched_std)
+    unwatched = [c for c in names if c not in set(watched)]
+    lines = [f"{seeds} random configs and windows: the id check always matches the standardized names "
+             f"(the old any-in-list scan differed {differed} times, only with entries not in standardized form)",
+             "1,500 watched cities (any-in-list / str set intersection / id isdisjoint):"]
+    for label, window in ((f"all {len(names):,} cities", names), (f"{len(unwatched)} unwatched cities", unwatched)):
+        window_std = {standardize_name(c) for c in window}
+        window_ids = lamas.intern_all(window_std)
+        old = median_ms(lambda: any(c in watched for c in window), repeat)
+        names_ms = median_ms(lambda: bool(window_std & watched_std), repeat)
+        ids_us = median_ms(lambda: not window_ids.isdisjoint(watched_ids), repeat) * 1000
+        lines.append(f"  window = {label}: {old:.3f} ms / {names_ms:.3f} ms / {ids_us:.2f} us")
+    return lines
+
+
+BENCHMARKS = {
+    "clustering": bench_clustering,
+    "hulls": bench_hulls,
+    "history": bench_history,
+    "lamas_cache": bench_lamas_cache,
+    "city_match": bench_city_match,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmarks", nargs="*", metavar="benchmark", help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("--seeds", type=int, default=200, help="random cases per equivalence check")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per measurement")
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    module = import_app_module()
+    failed = 0
+    for name in args.benchmarks or list(BENCHMARKS):
+        try:
+            lines = BENCHMARKS[name](module, args.seeds, args.repeat)
+        except Exception as e:
+            failed += 1
+            print(f"FAIL {name}: {e if isinstance(e, AssertionError) else repr(e)}")
+            continue
+        print(f"== {name}: {lines[0]}")
+        for line in lines[1:]:
+            print(line)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
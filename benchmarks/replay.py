@@ -0,0 +1,369 @@
+"""
+Headless replay / benchmark harness for red_alerts_israel.
+
+Replays recorded alerts.json payload sequences through the real app code, with AppDaemon's Hass base
+replaced by an in-memory stub and the Oref API replaced by the fixture. Reports per-stage latency
+percentiles, Home Assistant write volume, file bytes written and (optionally) allocations.
+
+    python benchmarks/replay.py                                   # every fixture, as fast as possible
+    python benchmarks/replay.py benchmarks/fixtures/national_barrage.json --speed 10
+    python benchmarks/replay.py --tracemalloc --json
+
+Fixture format (see make_fixtures.py, which generates the checked-in set):
+
+    {
+      "description": "...",
+      "poll_interval": 2,                       # seconds between recorded polls
+      "config": {"city_names": [...], ...},     # apps.yaml args for the app
+      "history_synthetic": {"count": 2000, "hours": 24},   # AlertsHistory.json built at replay time,
+                                                           # served as bytes to the app's streaming parser
+      "steps": [{"payload": <alerts.json dict or null>, "polls": 3}, ...]
+    }
+
+--speed N replays N times faster than recorded; --speed 0 (default) does not sleep and instead ages
+the app's alert timestamps by poll_interval per poll, so timer-based resets still happen. Event
+debouncing and write coalescing run on the wall clock, so event counts and file bytes vary a little
+between runs.
+"""
+import argparse
+import asyncio
+import atexit
+import contextlib
+import glob
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_DIR = os.path.join(ROOT, "apps", "red_alerts_israel")
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+# ----------------------------------------------------------------------
+# Stubbed AppDaemon Hass base
+# ----------------------------------------------------------------------
+class StubHass:
+    """The subset of AppDaemon's Hass API the app uses, backed by a dict. Counts writes and bytes."""
+    def __init__(self, args=None, verbose=False):
+        self.args = args or {}
+        self._verbose = verbose
+        self._states = {}
+        self.ha_calls = defaultdict(int)
+        self.ha_bytes = defaultdict(int)
+        self.services = []
+        self.events = []
+
+    def log(self, msg, level="INFO", **kwargs):
+        if self._verbose or level in ("ERROR", "CRITICAL"):
+            print(f"  [{level}] {msg}", file=sys.stderr)
+
+    async def set_state(self, entity_id, state=None, attributes=None, replace=False, **kwargs):
+        # AppDaemon serializes every write for Home Assistant; do the same work to measure it.
+        self.ha_calls[entity_id] += 1
+        self.ha_bytes[entity_id] += len(json.dumps({"state": state, "attributes": attributes or {}}, ensure_ascii=False, default=str).encode("utf-8"))
+        current = self._states.get(entity_id, {"state": None, "attributes": {}})
+        merged = dict(attributes or {}) if replace else {**current["attributes"], **(attributes or {})}
+        self._states[entity_id] = {"state": current["state"] if state is None else state, "attributes": merged}
+
+    async def get_state(self, entity_id, attribute=None, **kwargs):
+        entry = self._states.get(entity_id)
+        if entry is None:
+            return None
+        if attribute == "all":
+            return entry
+        if attribute:
+            return entry["attributes"].get(attribute)
+        return entry["state"]
+
+    async def entity_exists(self, entity_id):
+        return entity_id in self._states
+
+    async def call_service(self, service, **kwargs):
+        self.services.append((service, kwargs))
+
+    async def fire_event(self, event, **kwargs):
+        self.events.append(event)
+
+    def run_in(self, callback, delay, **kwargs):
+        return None # Polls are driven by the harness
+
+    def cancel_timer(self, handle):
+        pass
+
+    def listen_state(self, *args, **kwargs):
+        pass
+
+    def create_task(self, coro, **kwargs):
+        return asyncio.ensure_future(coro)
+
+
+def import_app_module():
+    """Imports red_alerts_israel with StubHass standing in for appdaemon.plugins.hass.hassapi.Hass."""
+    for name in ("appdaemon", "appdaemon.plugins", "appdaemon.plugins.hass", "appdaemon.plugins.hass.hassapi"):
+        sys.modules[name] = types.ModuleType(name)
+    sys.modules["appdaemon.plugins.hass.hassapi"].Hass = StubHass
+    sys.path.insert(0, APP_DIR)
+    import red_alerts_israel
+    return red_alerts_israel
+
+
+# ----------------------------------------------------------------------
+# Measurement helpers
+# ----------------------------------------------------------------------
+class StageTimer:
+    """Wraps sync and async callables, collecting wall-time samples (ms) per stage name."""
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap(self, obj, attr, stage):
+        func = getattr(obj, attr)
+        samples = self.samples[stage]
+        if asyncio.iscoroutinefunction(func):
+            async def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    samples.append((time.perf_counter() - started) * 1000)
+        else:
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    samples.append((time.perf_counter() - started) * 1000)
+        setattr(obj, attr, timed)
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "max": 0.0, "total": 0.0}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {"count": len(ordered), "p50": round(pick(0.5), 3), "p95": round(pick(0.95), 3),
+            "max": round(ordered[-1], 3), "total": round(sum(ordered), 3)}
+
+
+def synthetic_history(city_names, count, hours, seed=1):
+    """AlertsHistory.json entries spread over the last `hours`, newest first."""
+    rng = random.Random(seed)
+    now = datetime.now()
+    titles = ["ירי רקטות וטילים", "ירי רקטות וטילים", "חדירת כלי טיס עוין"]
+    offsets = sorted(rng.uniform(60, hours * 3600) for _ in range(count))
+    return [{"alertDate": (now - timedelta(seconds=s)).strftime("%Y-%m-%d %H:%M:%S"),
+             "title": rng.choice(titles), "data": rng.choice(city_names), "category": 1} for s in offsets]
+
+
+class HistoryFeedSession:
+    """
+    Stands in for the app's aiohttp session on the history endpoint: serves `body` in network-sized
+    chunks (with an ETag, and 304 to a matching If-None-Match), so the real download and streaming
+    parse run. Other URLs fail, as the replay never goes online.
+    """
+    def __init__(self, url, body, seed=1):
+        self._url = url
+        self._body = body
+        self._rng = random.Random(seed)
+        self.etag = f'"replay-{len(body)}"'
+
+    @contextlib.asynccontextmanager
+    async def get(self, url, headers=None):
+        if url != self._url:
+            raise aiohttp.ClientConnectionError(f"replay is offline: {url}")
+        session = self
+        not_modified = (headers or {}).get("If-None-Match") == self.etag
+
+        class Content:
+            async def iter_chunked(self, size):
+                pos = 0
+                while pos < len(session._body):
+                    n = session._rng.randint(1, size)
+                    yield session._body[pos:pos + n]
+                    pos += n
+
+        class Response:
+            status = 304 if not_modified else 200
+            headers = {"Content-Type": "application/json", "ETag": session.etag}
+            content = Content()
+            def raise_for_status(self): pass
+        yield Response()
+
+
+def age_app_clock(app, seconds):
+    """Makes `seconds` pass for the app's timer logic without sleeping (used with --speed 0)."""
+    if app.last_alert_time is not None:
+        app.last_alert_time -= seconds
+    if app.test_alert_start_time:
+        app.test_alert_start_time -= seconds
+    for segment in app.map_segments_history:
+        segment["timestamp"] -= seconds
+
+
+# ----------------------------------------------------------------------
+# Replay
+# ----------------------------------------------------------------------
+async def replay(module, fixture, speed, trace_alloc, verbose):
+    www = tempfile.mkdtemp(prefix="rai_replay_")
+    config = {"sensor_name": "red_alert", "interval": fixture.get("poll_interval", 2), "save_2_file": True,
+              "journal_days": 30, "journal_path": os.path.join(www, "journal.db"),
+              "hours_to_show": 24, "event": True, "mqtt": False, **fixture.get("config", {})}
+    module._IS_RAI_RUNNING = False
+    app = module.Red_Alerts_Israel(dict(config, city_names=list(config.get("city_names", []))), verbose=verbose)
+    app._get_www_path = lambda: www
+
+    lamas_names = []
+    with open(os.path.join(APP_DIR, "lamas_data.json"), encoding="utf-8-sig") as f:
+        for cities in json.load(f)["areas"].values():
+            lamas_names.extend(cities)
+    history_spec = fixture.get("history_synthetic") or {"count": 0, "hours": 1}
+    history = synthetic_history(lamas_names, history_spec["count"], history_spec["hours"])
+
+    live = {"payload": None}
+    async def get_live_alerts(_self=None):
+        return live["payload"]
+    history_body = ("\ufeff" + json.dumps(history, ensure_ascii=False)).encode("utf-8")
+    original_client_init = module.OrefAPIClient.__init__
+    def client_init(client, session, urls, *args, **kwargs):
+        original_client_init(client, HistoryFeedSession(urls["history"], history_body), urls, *args, **kwargs)
+    module.OrefAPIClient.__init__ = client_init
+
+    file_bytes = defaultdict(int)
+    original_write_json_atomic = module.write_json_atomic
+    def counting_write_json_atomic(path, data, indent=2):
+        original_write_json_atomic(path, data, indent)
+        file_bytes[os.path.basename(path)] += os.path.getsize(path)
+    module.write_json_atomic = counting_write_json_atomic
+    original_write_bytes_atomic = module.write_bytes_atomic
+    def counting_write_bytes_atomic(path, data):
+        original_write_bytes_atomic(path, data)
+        file_bytes[os.path.basename(path)] += len(data)
+    module.write_bytes_atomic = counting_write_bytes_atomic
+
+    timer = StageTimer()
+    started = time.perf_counter()
+    try:
+        await app.initialize()
+    finally:
+        module.OrefAPIClient.__init__ = original_client_init
+    timer.samples["initialize"].append((time.perf_counter() - started) * 1000)
+    atexit.unregister(app._cleanup_on_exit)
+
+    app.api_client.get_live_alerts = get_live_alerts
+    if app.file_manager:
+        append_text = app.file_manager._append_text
+        def counting_append_text(path, text, label, newline=None):
+            append_text(path, text, label, newline)
+            file_bytes[os.path.basename(path)] += len(text.encode("utf-8"))
+        app.file_manager._append_text = counting_append_text
+
+    timer.wrap(app, "poll_alerts", "poll")
+    timer.wrap(app, "_process_active_alert", "process_active_alert")
+    timer.wrap(app, "_check_reset_sensors", "check_reset")
+    timer.wrap(app, "_update_ha_state", "ha_update")
+    timer.wrap(app, "generate_smart_alert_map", "map")
+    timer.wrap(app, "_save_latest_geojson", "geojson_latest")
+    timer.wrap(app, "_save_history_geojson", "geojson_history")
+    timer.wrap(app.alert_processor, "process_alert_window_data", "window_data")
+    timer.wrap(app.history_manager, "update_history", "history_update")
+    timer.wrap(app.history_manager, "get_history_attributes", "history_attrs")
+
+    poll_interval = fixture.get("poll_interval", 2)
+    poll_peaks = []
+    if trace_alloc:
+        tracemalloc.start()
+    replay_started = time.perf_counter()
+    for step in fixture["steps"]:
+        live["payload"] = step["payload"]
+        for _ in range(step.get("polls", 1)):
+            if trace_alloc:
+                base, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+            await app.poll_alerts()
+            if trace_alloc:
+                poll_peaks.append((tracemalloc.get_traced_memory()[1] - base) / 1024)
+            if speed:
+                await asyncio.sleep(poll_interval / speed)
+            else:
+                age_app_clock(app, poll_interval)
+    replay_seconds = time.perf_counter() - replay_started
+    retained_kib = tracemalloc.get_traced_memory()[0] / 1024 if trace_alloc else None
+    if trace_alloc:
+        tracemalloc.stop()
+
+    await app._async_terminate()
+    writer = app.file_manager._writer if app.file_manager else None
+    writer_stats = {"jobs_written": writer.jobs_written, "jobs_coalesced": writer.jobs_coalesced} if writer else {}
+    module.write_json_atomic = original_write_json_atomic
+    module.write_bytes_atomic = original_write_bytes_atomic
+
+    polls = sum(step.get("polls", 1) for step in fixture["steps"])
+    result = {
+        "polls": polls,
+        "replay_seconds": round(replay_seconds, 3),
+        "stages_ms": {stage: percentiles(values) for stage, values in timer.samples.items()},
+        "ha": {"set_state_calls": sum(app.ha_calls.values()), "bytes": sum(app.ha_bytes.values()),
+               "events": len(app.events)},
+        "mqtt": [kwargs for service, kwargs in app.services if service == "mqtt/publish"],
+        "files": {"bytes_written": sum(file_bytes.values()), "by_file": dict(file_bytes), **writer_stats},
+        "history_feed": {k: app.startup_stats.get(k) for k in ("history_bytes", "history_entries", "history_stopped_early")},
+    }
+    if trace_alloc:
+        result["alloc_kib"] = {"per_poll_peak": percentiles(poll_peaks), "retained_after_replay": round(retained_kib, 1)}
+    return result
+
+
+def print_report(name, fixture, result):
+    print(f"\n=== {name}: {fixture.get('description', '')}")
+    print(f"{result['polls']} polls in {result['replay_seconds']} s")
+    print(f"{'stage':<22}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'total ms':>11}")
+    for stage, stats in sorted(result["stages_ms"].items(), key=lambda kv: -kv[1]["total"]):
+        print(f"{stage:<22}{stats['count']:>7}{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['max']:>10.3f}{stats['total']:>11.2f}")
+    feed = result["history_feed"]
+    print(f"History feed: {feed['history_bytes']:,} bytes streamed, {feed['history_entries']} entries parsed"
+          + (", stopped early" if feed["history_stopped_early"] else ""))
+    ha = result["ha"]
+    print(f"HA: {ha['set_state_calls']} set_state calls, {ha['bytes']:,} bytes, {ha['events']} events, {len(result['mqtt'])} MQTT messages")
+    files = result["files"]
+    print(f"Files: {files['bytes_written']:,} bytes written " + ", ".join(f"{k}={v:,}" for k, v in sorted(files["by_file"].items())))
+    if "jobs_written" in files:
+        print(f"Writer: {files['jobs_written']} jobs written, {files['jobs_coalesced']} coalesced")
+    if "alloc_kib" in result:
+        peak = result["alloc_kib"]["per_poll_peak"]
+        print(f"Allocations: per-poll peak p50 {peak['p50']:.1f} KiB, p95 {peak['p95']:.1f} KiB, max {peak['max']:.1f} KiB; "
+              f"retained after replay {result['alloc_kib']['retained_after_replay']:.1f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded alert streams through red_alerts_israel and report timings.")
+    parser.add_argument("fixtures", nargs="*", help="fixture files (default: every file in benchmarks/fixtures)")
+    parser.add_argument("--speed", type=float, default=0, help="replay speed multiplier; 0 = no sleeping (default)")
+    parser.add_argument("--tracemalloc", action="store_true", help="measure per-poll allocation peaks (slower)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show the app's log output")
+    args = parser.parse_args()
+
+    module = import_app_module()
+    paths = args.fixtures or sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.json")))
+    results = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            fixture = json.load(f)
+        name = os.path.splitext(os.path.basename(path))[0]
+        results[name] = asyncio.run(replay(module, fixture, args.speed, args.tracemalloc, args.verbose))
+        if not args.json:
+            print_report(name, fixture, results[name])
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()